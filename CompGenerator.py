@@ -6,19 +6,40 @@
 # if present, puts that event on the specified stage.
 
 import argparse
+import base64
+import bisect
+import contextlib
+import copy
 import json
 import csv
-import re
-from collections import defaultdict
+import functools
+import gc
 import math
+import operator
+import os
+import hashlib
+import heapq
+import io
+import itertools
+import pickle
+import time
+import zipfile
+try:
+    import resource # not available on Windows, where --profile just leaves out the memory numbers
+except ImportError:
+    resource = None
 
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
+from reportlab.lib.pagesizes import letter, legal, TABLOID, A3, A4, A5
+
+# reportlab's PDF-drawing modules take a while to import, so they're only imported by load_reportlab() once something
+# actually gets drawn. Runs that don't draw anything (like '--assign -g none') never need them.
+canvas = pdfdoc = _digester = RecordingCanvas = stringWidth = rl_config = None
 
 # some page drawing globals
 w, h = letter
 w2, h2 = w/2, h/2
 m = 36
+badge_size = (2.5*72, 3.5*72)
 
 eventNames = { # Map of WCA event ids to friendly names and short-names, which are used on the scorecards and competitor schedules
     "222": ("2x2x2 Cube","2x2"),
@@ -56,43 +77,320 @@ def load_config(config_file):
     if "custom_events" in cfg.keys():
         for _e in cfg["custom_events"]:
             eventNames[_e[0]] = tuple(_e[1:])
+    if "wcif" in cfg:
+        apply_wcif(cfg, read_wcif(cfg["wcif"]))
     return cfg
 
-# helper for load_data() that sanity-checks an assignment string to make sure that
-# the assignment doesn't have multiple roles for the same group (e.g. C1;R1)
-def validate_assignment(who, event, assn):
-    if not assn: # empty assignment strings pass automatically.
-        return
-    used = []
+# One role that a person has in one event, e.g. the "J4" in "C3;J4". For a competing role, stage is the
+# tag of the stage that assign_stages() puts them on.
+class Role:
+    __slots__ = ("role", "group", "stage")
+
+    def __init__(self, role, group, stage=""):
+        self.role = role
+        self.group = group
+        self.stage = stage
+
+    # pickles as just its three strings, which is much smaller and quicker than the default for a class with slots
+    def __reduce__(self):
+        return (Role, (self.role, self.group, self.stage))
+
+    def __str__(self):
+        return self.role + self.stage + self.group
+
+# Everything we know about one person from the assignments file. roles maps event ids to lists of Roles.
+class Person:
+    __slots__ = ("name", "wcaid", "number", "roles")
+
+    def __init__(self, name, wcaid, number, roles=None):
+        self.name = name
+        self.wcaid = wcaid
+        self.number = number
+        self.roles = {} if roles is None else roles
+
+    def __reduce__(self):
+        return (Person, (self.name, self.wcaid, self.number, self.roles))
+
+    # returns the person's competing Role in this event, or None if they aren't competing in it
+    def competing(self, event):
+        for r in self.roles.get(event, ()):
+            if r.role == "C":
+                return r
+        return None
+
+# The parsed assignments file. Every role string is parsed once, as the person is added, and the lookups that
+# staging, scorecards and badges need are kept as indexes:
+#   people:      name -> Person, in file order
+#   groups:      event -> competing group -> names of the people competing in it, in file order
+#   competitors: names of everybody competing in at least one event (the rest are helpers)
+#   stage_names: stage tag -> stage name
+# report is the ValidationReport of any problems found while the file was read.
+class AssignmentTable:
+    def __init__(self, config):
+        self.people = {}
+        self.groups = {}
+        self.competitors = set()
+        self.stage_names = {s[0]: name for name, s in config.get("stages", {}).items()}
+        self.report = ValidationReport()
+
+    def add(self, person):
+        self.people[person.name] = person
+        for event, roles in person.roles.items():
+            for r in roles:
+                if r.role == "C":
+                    self.groups.setdefault(event, {}).setdefault(r.group, []).append(person.name)
+                    self.competitors.add(person.name)
+
+    # names of everybody competing in an event, grouped by competing group
+    def competing_in(self, event):
+        return [who for names in self.groups.get(event, {}).values() for who in names]
+
+    # Maps a stage's shorthand form, like "R" or "B", back to its full name, like "Red" or "Blue"
+    def stage_name(self, tag):
+        return self.stage_names.get(tag, f"Error: stage name not found for shorthand {tag}")
+
+# parse an assignment string like "C3;J4" into a list of Roles. The role letters get uppercased so people don't have
+# to capitalize the CJRS roles in their spreadsheet.
+def parse_assignment(assn):
+    roles = []
     for chunk in assn.split(";"):
-        group = chunk[-1] # last character should be the group number
-        if group in used:
-            print(f"Warning: {who} has simultaneous assignments for {eventNames[event]}: {assn}")
+        chunk = chunk.strip()
+        if chunk:
+            roles.append(Role(chunk[0].upper(), chunk[1:].strip()))
+    return roles
+
+# The problems found in an assignments file, collected while it's read rather than printed one by one. Each problem
+# is a (line number, name, event, kind, detail) tuple. load_data() fills in the one on the AssignmentTable it
+# returns, and it's up to the caller what to do with it; the command line prints it with show().
+class ValidationReport:
+    def __init__(self):
+        self.problems = []
+
+    def __len__(self):
+        return len(self.problems)
+
+    def add(self, line, who, event, kind, detail):
+        self.problems.append((line, who, event, kind, detail))
+
+    # returns a dict of problem kind -> how many of them there were
+    def counts(self):
+        ret = {}
+        for p in self.problems:
+            ret[p[3]] = ret.get(p[3], 0) + 1
+        return ret
+
+    # prints the problems, at most `limit` of each kind so a big merged file doesn't scroll everything else away
+    def show(self, limit=10):
+        if len(self.problems) == 0:
+            return
+        print(f"Warning: found {len(self.problems)} problem(s) in the assignments file. We'll still use it, but check these:")
+        for kind, n in self.counts().items():
+            shown = [p for p in self.problems if p[3] == kind][:limit]
+            for line, who, event, _, detail in shown:
+                print(f"  line {line}: {detail}")
+            if n > limit:
+                print(f"  ...and {n-limit} more '{kind}' problems")
+
+# helper for load_data() that sanity-checks a parsed assignment to make sure that the assignment doesn't have
+# multiple roles for the same group (e.g. C1;R1), roles that aren't in the config's "roles", or roles with no group.
+def validate_assignment(report, line, who, event, roles, allowed):
+    used = []
+    assn = ";".join(str(_) for _ in roles)
+    eventName = eventNames.get(event, (event,))[0]
+    for r in roles:
+        if r.role not in allowed:
+            report.add(line, who, event, "unknown role", f"{who} has a role other than {allowed} for {eventName}: {assn}")
+        if r.group == "":
+            report.add(line, who, event, "no group", f"{who} has a role with no group number for {eventName}: {assn}")
+        elif r.group in used:
+            report.add(line, who, event, "simultaneous", f"{who} has simultaneous assignments for {eventName}: {assn}")
         else:
-            used.append(group)
-    return
+            used.append(r.group)
+
+# Reads an assignments CSV one row at a time, yielding (line number, header, row) for every person's row. Blank lines
+# are skipped. A row that starts like the header is taken as a new header, because a file made by pasting several
+# registration exports together repeats it, and the columns may not be in the same order in each one.
+def iter_assignment_rows(fin):
+    reader = csv.reader(fin)
+    header = None
+    for row in reader:
+        if len(row) == 0 or not any(_.strip() for _ in row):
+            continue
+        row[0] = row[0].lstrip("\ufeff") # spreadsheet programs like to put byte order marks on each export
+        if header is None or row[0] == header[0]:
+            header = row
+            continue
+        yield reader.line_num, header, row
+
+# Where the people and their assignments come from: the assignments file, or if there isn't one, the WCIF file.
+def assignments_file(config):
+    return config.get("assignments", config.get("wcif"))
 
-# to-do: as a robustness feature, we should check all the keys for each person in assignments,
-# and for the keys that are events, uppercase the value. That way people don't have to capitalize
-# the CJRS roles in their spreadsheet, which would be good, because other parts of the code
-# expect capitals for those things.
 def load_data(config):
-    raw_data = []
-    with open(config["assignments"], "r") as fin:
-        reader = csv.reader(fin)
-        for row in reader:
-            raw_data.append(row)
-    assignments = {}
-    header = raw_data[0]
-
-    # make a per-person dictionary of assignments 
-    for i in range(1,len(raw_data)):
-        who = raw_data[i][0] # the person's name
-        _ = {"Number": str(i)} # temporary dict for the person's data. "Number" is their competitor number
-        for j in range(1,len(header)): # here we need to associate the columns with event information from the header row, not the events list from the config file, because the order could be different.
-            _[header[j]] = raw_data[i][j] # store the assignment
-            validate_assignment(who, header[j], _[header[j]]) # print a warning if the assignment is not good. We'll still use it, but warn the user.
-        assignments[who] = _
+    if "assignments" not in config and "wcif" in config:
+        return load_wcif_data(config)
+    assignments = AssignmentTable(config)
+    report = assignments.report
+    allowed = config.get("roles", "CJRS")
+    people = {} # name -> Person. A name that comes up again replaces the earlier row, but keeps its place in the order
+    number = 0
+    with open(config["assignments"], "r", encoding="utf-8-sig", newline="") as fin:
+        # make a Person out of each row as it's read, checking it on the way in
+        for line, header, row in iter_assignment_rows(fin):
+            number += 1 # every row counts toward the numbering, even one that gets skipped
+            who = row[0].strip() # the person's name
+            if who == "":
+                report.add(line, who, None, "no name", f"row has no name in it: {','.join(row)}")
+                continue
+            if who in people:
+                report.add(line, who, None, "duplicate", f"{who} is in the file more than once; using the last one")
+            if len(row) < len(header):
+                report.add(line, who, None, "short row", f"{who}'s row has fewer columns than the header")
+                row += [""] * (len(header) - len(row))
+            person = Person(who, "", str(number)) # by default, their competitor number is their row in the file
+            for j in range(1,len(header)): # here we need to associate the columns with event information from the header row, not the events list from the config file, because the order could be different.
+                if header[j] == "WCA ID":
+                    person.wcaid = row[j]
+                elif header[j] == "Number":
+                    person.number = row[j]
+                else:
+                    person.roles[header[j]] = parse_assignment(row[j])
+                    validate_assignment(report, line, who, header[j], person.roles[header[j]], allowed)
+            people[who] = person
+    for person in people.values():
+        assignments.add(person)
+    return assignments
+
+# WCIF. Instead of (or as well as) typing the events into the config file and making an assignments file, the config
+# file can name a WCIF export of the competition (the JSON file that the WCA website and tools like Groupifier work
+# with) in its "wcif" key. The WCIF fills in whatever the config file doesn't say itself:
+#   "competition"  the competition's name
+#   "events"       each event's first round: its format, cutoff and time limit
+#   "rounds"       the later rounds of each event, by name ("2", "3", ... and "Final"), with their own settings
+# and, if there's no "assignments" key, the people and their round 1 groups come from the WCIF too, from the
+# competitor, judge, scrambler and runner assignments to each round 1 group activity in the schedule.
+
+# solves per round for each WCIF round format
+wcif_formats = {"1": 1, "2": 2, "3": 3, "5": 5, "a": 5, "m": 3, "h": 5}
+
+# the WCIF assignment codes that are roles in the assignments file
+wcif_roles = {"competitor": "C", "staff-judge": "J", "staff-scrambler": "S", "staff-runner": "R"}
+
+# Parsed WCIF files, by (path, modification time, size), so load_config() and load_data() only parse one once.
+wcif_loaded = {}
+
+def read_wcif(filename):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        print(f"Error: can't find the WCIF file {filename}.")
+        exit()
+    key = (os.path.abspath(filename), st.st_mtime_ns, st.st_size)
+    if key not in wcif_loaded:
+        with open(filename, "rb") as fin:
+            try:
+                wcif_loaded.clear() # only the latest version of a file is worth keeping
+                wcif_loaded[key] = json.loads(fin.read())
+            except ValueError:
+                print(f"Error loading WCIF file {filename}. Make sure it's a valid JSON file.")
+                exit()
+    return wcif_loaded[key]
+
+# A WCIF time in centiseconds, written the way the config file would have it: "10:00", "1:30.50", "45", "12.34"
+def wcif_time(centiseconds):
+    minutes, rest = divmod(centiseconds, 6000)
+    seconds = f"{rest // 100:02d}" if minutes > 0 else str(rest // 100)
+    if rest % 100 != 0:
+        seconds += f".{rest % 100:02d}"
+    return f"{minutes}:{seconds}" if minutes > 0 else seconds
+
+# A round's [solves, attempts, cutoff, limit], like an entry in the config file's "events". Fewest moves cutoffs are
+# a number of moves and multi-blind ones are points; those two events have no time limit of their own in the WCIF,
+# so they get the hour that the regulations give them.
+def wcif_round_settings(event, round):
+    solves = wcif_formats.get(round.get("format"), 5)
+    cutoff = round.get("cutoff")
+    attempts, cutoff_text = None, ""
+    if cutoff is not None:
+        attempts = cutoff["numberOfAttempts"]
+        result = cutoff["attemptResult"]
+        if event == "333fm":
+            cutoff_text = f"{result} moves"
+        elif event == "333mbf":
+            cutoff_text = f"{99 - result // 10000000} points"
+        else:
+            cutoff_text = wcif_time(result)
+    limit = round.get("timeLimit")
+    if limit is None:
+        limit_text = "60:00" if event in ("333fm", "333mbf") else ""
+    else:
+        limit_text = wcif_time(limit["centiseconds"]) + (" total" if len(limit.get("cumulativeRoundIds", [])) > 0 else "")
+    return [solves, attempts, cutoff_text, limit_text]
+
+# Round names, as scorecards show them: the last round of an event with more than one is the "Final".
+def wcif_round_name(number, rounds):
+    return "Final" if number == rounds and rounds > 1 else str(number)
+
+# Fills in the config from its WCIF file, without overriding anything the config file says itself.
+def apply_wcif(cfg, wcif):
+    cfg.setdefault("competition", wcif["name"])
+    events = {}
+    rounds = {}
+    for e in wcif.get("events", []):
+        if len(e.get("rounds", [])) == 0:
+            continue
+        events[e["id"]] = wcif_round_settings(e["id"], e["rounds"][0])
+        rounds[e["id"]] = {wcif_round_name(n+1, len(e["rounds"])): wcif_round_settings(e["id"], r) for n, r in enumerate(e["rounds"]) if n > 0}
+    cfg["events"] = dict(events, **cfg.get("events", {}))
+    cfg["rounds"] = dict(rounds, **cfg.get("rounds", {}))
+
+# The round 1 group activities in a WCIF schedule, as activity id -> (event, group). Every room (stage) has its own
+# activity for a group, and they all map to the same group.
+def wcif_groups(wcif):
+    groups = {}
+    def visit(activity):
+        code = activity.get("activityCode", "").split("-")
+        if len(code) == 3 and code[1] == "r1" and code[2].startswith("g"):
+            groups[activity["id"]] = (code[0], code[2][1:])
+        for child in activity.get("childActivities", []):
+            visit(child)
+    for venue in wcif.get("schedule", {}).get("venues", []):
+        for room in venue.get("rooms", []):
+            for activity in room.get("activities", []):
+                visit(activity)
+    return groups
+
+# Builds the AssignmentTable from a WCIF file, like load_data() does from an assignments file: everybody whose
+# registration was accepted, plus anybody else with an assignment, in the WCIF's order. Competitor numbers are their
+# registrant ids. Problems are reported against each person's place in the WCIF's list of people, since there are no
+# line numbers to go by, and so is anybody who's registered for an event but isn't in one of its round 1 groups.
+def load_wcif_data(config):
+    wcif = read_wcif(config["wcif"])
+    assignments = AssignmentTable(config)
+    report = assignments.report
+    allowed = config.get("roles", "CJRS")
+    groups = wcif_groups(wcif)
+    for line, p in enumerate(wcif.get("persons", []), 1):
+        registration = p.get("registration") or {}
+        if registration.get("status") != "accepted" and len(p.get("assignments", [])) == 0:
+            continue
+        who = p["name"].strip()
+        if who in assignments.people:
+            report.add(line, who, None, "duplicate", f"{who} is in the file more than once; using the first one")
+            continue
+        person = Person(who, p.get("wcaId") or "", str(p.get("registrantId") or line))
+        for event in config["events"]:
+            person.roles[event] = []
+        for a in p.get("assignments", []):
+            if a["activityId"] in groups and a["assignmentCode"] in wcif_roles:
+                event, group = groups[a["activityId"]]
+                person.roles.setdefault(event, []).append(Role(wcif_roles[a["assignmentCode"]], group))
+        for event, roles in person.roles.items():
+            validate_assignment(report, line, who, event, roles, allowed)
+        for event in registration.get("eventIds", []):
+            if event in config["events"] and person.competing(event) is None:
+                report.add(line, who, event, "not grouped", f"{who} is registered for {eventNames.get(event, (event,))[0]} but isn't in a round 1 group")
+        assignments.add(person)
     return assignments
 
 # generates output PDF filenames. compname is the name of the competition, while content is
@@ -102,104 +400,116 @@ def get_filename(compname, content):
     c2 = content.split(" ")
     return "_".join(c1+c2)+".pdf" # join the with _ and put .pdf on the end.
 
-# helper that returns the competing group sub-portion of an assignment string
-def group_of(assn):
-    try:
-        g = re.search("C\d", assn)[0]
-    except: # we shouldn't ever hit this exception because we're only calling group_of from places where assn should already be a competitor's assignments, but you never know.
-        g = f"Error: no group present in assignment string '{assn}'"
-    return g
-
-# Build lists of everybody competing in the event, what they're doing, and the
-# set of competing groups in that event (which comes from the assignments file)
-# This is a helper used by round robin and single-staging. 
-def get_people_groups(assignments, event, return_groups=True):
-    people = []        # competitors in this event
-    role_strings = []  # roles they have
-    for who in assignments.keys():
-        roles = assignments[who][event]
-        if "C" in roles:
-            people.append(who)
-            role_strings.append(roles)
-    # Given a set of role strings, boil them down to a dict where the keys are the group
-    # substrings (E.g. "C1", "C2", "C3") and the values are how many people were assigned to
-    # that group
-    groups = defaultdict(lambda: 0)
-    for s in role_strings:
-        groups[group_of(s)] += 1
-    if return_groups:
-        return (people, groups)
-    else:
-        return people
+# Works out a group -> stage mapping for single staging. groups maps group numbers to how many people are in them,
+# and stages is a list of stage [tag,size] arrays. Every group has to go on a stage it fits on. Within that, the
+# number of groups on each stage is kept as even as possible (so the stages all finish at about the same time), and
+# then the number of people on each stage. Returns a dict of group -> stage tag, or None if some group doesn't fit on
+# any stage, or if there are at least as many groups as stages and a stage would still be left without any (because
+# it's too small for all of them). Either way, round robin staging is used instead, which uses every stage.
+#
+# Placing the biggest groups first, each on the stage with the fewest groups so far that it fits on, gives the most
+# even group counts there can be, because any stage a big group fits on, a smaller group fits on too. After that,
+# groups get moved and swapped between stages for as long as it evens out the number of people, up to max_moves times
+# (by default, the number of groups times the number of stages, which is far more than it ever takes). Everything is
+# tried in a fixed order, so the same groups always get the same answer, however busy the computer is.
+def solve_single_staging(groups, stages, max_moves=None):
+    if max_moves is None:
+        max_moves = len(groups) * len(stages)
+    stages = sorted(stages, reverse=True, key=lambda x: x[1]) # descending sort by the size. Ties keep the config order.
+    caps = [s[1] for s in stages]
+    counts = [0] * len(stages) # how many groups are on each stage
+    loads = [0] * len(stages)  # and how many people
+    on = [[] for _ in stages]  # and which groups, as a sorted list of (size, position in file, group) for each stage
+    for pos, g in sorted(enumerate(groups), key=lambda x: -groups[x[1]]): # biggest first. Ties keep the file order.
+        fits = [i for i in range(len(stages)) if caps[i] >= groups[g]]
+        if len(fits) == 0:
+            return None # this will trigger round_robin_staging as a fallback.
+        i = min(fits, key=lambda i: (counts[i], loads[i]))
+        bisect.insort(on[i], (groups[g], pos, g))
+        counts[i] += 1
+        loads[i] += groups[g]
+    if len(groups) >= len(stages) and 0 in counts:
+        return None # a stage would sit idle all event, so this will trigger round_robin_staging as a fallback.
+    most = max(counts) if len(counts) > 0 else 0
 
-# helper that inserts a stage tag into an assignments string.
-def assign_one_stage(assn, tag):
-    chunks = assn.split(";") # break the assignment into chunks so we can find the C chunk and rewrite it easily.
-    for i in range(len(chunks)):
-        if chunks[i][0] == "C":
-            chunks[i] = "C" + tag + chunks[i][1] # rewrite it to insert the stage tag
-    return ";".join(chunks) # put the chunks back together and return the result.
+    # Even out the people. Each step moves a group (or swaps two groups) from a heavier stage a to a lighter stage b,
+    # shifting x people over for some 0 < x < gap, which always makes the loads more even, so this has to finish.
+    # The closer x is to half the gap, the more even it gets, so that's the one we pick.
+    for _ in range(max_moves):
+        best = None
+        for a in sorted(range(len(stages)), key=lambda i: -loads[i]): # heaviest stage first
+            for b in sorted(range(len(stages)), key=lambda i: loads[i]): # lightest stage first
+                gap = loads[a] - loads[b]
+                if gap <= 1:
+                    break
+                if counts[b] < most: # room to move a group over without making stage b run long
+                    top = min(gap-1, caps[b])
+                    for x in near(on[a], min(gap/2, top)):
+                        if 0 < x[0] <= top and (best is None or abs(x[0]-gap/2) < best[0]):
+                            best = (abs(x[0]-gap/2), a, b, x, None)
+                for x in on[a]:
+                    if x[0] > caps[b]:
+                        break
+                    top = min(x[0]-1, caps[a]) # the group coming back has to be smaller, and fit on stage a
+                    for y in near(on[b], min(x[0]-gap/2, top)):
+                        if x[0]-gap < y[0] <= top and (best is None or abs(x[0]-y[0]-gap/2) < best[0]):
+                            best = (abs(x[0]-y[0]-gap/2), a, b, x, y)
+                if best is not None:
+                    break
+            if best is not None:
+                break
+        if best is None:
+            break
+        _, a, b, x, y = best
+        on[a].remove(x)
+        bisect.insort(on[b], x)
+        counts[a] -= 1
+        counts[b] += 1
+        loads[a] -= x[0]
+        loads[b] += x[0]
+        if y is not None:
+            on[b].remove(y)
+            bisect.insort(on[a], y)
+            counts[b] -= 1
+            counts[a] += 1
+            loads[b] -= y[0]
+            loads[a] += y[0]
+    return {x[2]: stages[i][0] for i in range(len(stages)) for x in on[i]}
 
+# helper for solve_single_staging() that returns the entries of a sorted list of (size, ...) tuples on either side of
+# the given size
+def near(entries, size):
+    i = bisect.bisect_left(entries, (size,))
+    return entries[max(i-1,0):i+1]
 
 # This routine handles the case where group sizes are small and all groups can be assigned
-# to individual stages in such a way that stages aren't wasted.
-# This is a greedy allocation algorithm that iterates over the stages in descending order of size,
-# assigning to each the largest available group that will fit, detecting failure and end conditions along the way
-def single_staging(config, groups, event):
+# to individual stages in such a way that stages aren't wasted. See solve_single_staging().
+def single_staging(config, assignments, event):
     stages = [config["stages"][_] for _ in config["stages"]] # Get the list of stage [tag,size] arrays
-    stages.sort(reverse=True, key=lambda x: x[1]) # descending sort by the size
-    
-    (people, groups) = get_people_groups(assignments, event)
-    group_stages = {}     # this dict will map competing groups onto whichever stage they fit on.
-    done = False
-    while not done:
-        failed = False
-        for s in stages:
-            cap = s[1]      # Get the size of the stage
-            # Find the biggest group that can fit on this stage:
-            best_size = -1  # sentinal 'no group' values
-            best_group = None
-            for g in groups: # this gets us a key that is a "C1" type string
-                if groups[g] > best_size and groups[g] <= cap: # If this group fits on s but is bigger than the previous best
-                    best_size = groups[g] # then record the size
-                    best_group = g        # and the key
-            # If we found one, then map it to that stage and take it out of the list of groups
-            if best_group is not None:
-                group_stages[best_group] = s[0] # Map the group to a stage tag
-                del groups[g] # take this group out of the list of groups to be assigned
-                if len(groups) == 0: # and if that was the last group, then we're done
-                    done = True
-                    break
-            # but if we failed to find one, then abort
-            else:
-                failed = done = True
-                break
-    if failed:
+    groups = {g: len(names) for g, names in assignments.groups.get(event, {}).items()} # how many people are in each competing group
+    group_stages = solve_single_staging(groups, stages, config.get("staging_max_moves"))
+    if group_stages is None:
         return False # this will trigger round_robin_staging as a fallback.
     else: # we succeeded, so do the actual group assignments as per group_stages
-        for who in people:
-            assn = assignments[who][event] # convenience variable
-            assignments[who][event] = assign_one_stage(assn, group_stages[group_of(assn)])
+        for g, names in assignments.groups.get(event, {}).items():
+            for who in names:
+                assignments.people[who].competing(event).stage = group_stages[g]
         return True # this will tell assigned_stages that we succeeded
 
 # Assign stages for a given event according to what the config file dictated
 def assigned_staging(config, assignments, event):
     stage = config["events"][event][4] # this is guaranteed to exist because assign_stages had to check for it in order to know to call this mode
     stage_tag = config["stages"][stage][0] # get the stage tag
-    people = get_people_groups(assignments, event, return_groups=False)
-    for who in people:
-        assignments[who][event] = assign_one_stage(assignments[who][event], stage_tag)
+    for who in assignments.competing_in(event):
+        assignments.people[who].competing(event).stage = stage_tag
 
 # Deals competitors in each competing group onto each stage in round-robin fashion.
 def round_robin_staging(config, assignments, event, stage_tags, num_stages):
-    # get lists of everybody competing in the event, what they're doing, and what groups there are
-    (people, groups) = get_people_groups(assignments, event)
-    for g in groups:            # for this group
+    for g, names in assignments.groups.get(event, {}).items(): # for this group
         stage = 0                   # initialize the stage index
-        for who in people:          # loop over all the people
-            if g in assignments[who][event]:  # and find the ones in this group
-                assignments[who][event] = assign_one_stage(assignments[who][event], stage_tags[stage])
-                stage = (stage + 1) % num_stages   # increment the stage index for next time
+        for who in names:           # loop over the people in it
+            assignments.people[who].competing(event).stage = stage_tags[stage]
+            stage = (stage + 1) % num_stages   # increment the stage index for next time
 
 # This assigns competing stages to all competitors for round 1 of all events. It determines
 # which stage assignment mode to use, then calls a helper to do that mode of assignment.
@@ -218,6 +528,125 @@ def assign_stages(config,assignments):
                 round_robin_staging(config, assignments, event, stage_tags, num_stages)
 
 
+# Reads a registrations CSV for --assign, like the one the WCA website exports: a "Name" column, an optional "WCA ID"
+# column, and a column for each event, with a 1 (or x, or yes) for each event the person is registered in. If there's
+# a "Status" column, only accepted registrations ("a" or "accepted") are used. Columns for events that aren't in the
+# config file are ignored. People with no events can still be on the list, as helpers. Returns a list of
+# [name, wcaid, set of event ids], in file order.
+def load_registrations(config, filename):
+    people = []
+    seen = set()
+    with open(filename, "r", encoding="utf-8-sig", newline="") as fin:
+        for line, header, row in iter_assignment_rows(fin):
+            cols = {col.strip().lower(): j for j, col in enumerate(header)}
+            row += [""] * (len(header) - len(row))
+            if "status" in cols and row[cols["status"]].strip().lower() not in ("a", "accepted"):
+                continue
+            who = row[cols.get("name", 0)].strip()
+            if who == "" or who in seen:
+                continue
+            seen.add(who)
+            wcaid = row[cols["wca id"]].strip() if "wca id" in cols else ""
+            events = {header[j].strip() for j in range(len(header)) if header[j].strip() in config["events"] and
+                      row[j].strip().lower() in ("1", "x", "y", "yes", "true")}
+            people.append([who, wcaid, events])
+    return people
+
+# Builds round 1 assignments for everybody from their registrations, and returns them as an AssignmentTable, like
+# load_data() would. Settings come from the config file's "auto_assign" key:
+#   "groups":     event -> number of competing groups. By default, as few groups as fit on all the stages at once
+#                 (or groups of about "group_size", 20 by default, if there are no stages).
+#   "judges":     judges per competitor in a group (1 by default: everybody gets a judge)
+#   "scramblers": scramblers per group (2 by default)
+#   "runners":    runners per group (2 by default)
+# Roles that aren't in the config's "roles" string aren't assigned.
+#
+# Each event's competitors are dealt into groups, so group sizes differ by at most one. Then each group's staff are
+# picked from everybody who isn't competing in it, judges first, since a group can't run without them: the people
+# who've done the least helping so far across the whole competition go first, so the judging gets spread out evenly.
+# Nobody ever gets two roles in the same group, and people are only put on duty in the group right before their own
+# competing group if nobody else is left. Scramblers and runners are picked from people in the event where possible,
+# because they're around and know the puzzle. It's a single greedy pass, so even a competition with thousands of
+# people takes a few seconds at most.
+def auto_assign(config, registrations):
+    settings = config.get("auto_assign", {})
+    allowed = config.get("roles", "CJRS")
+    stations = sum(s[1] for s in config.get("stages", {}).values())
+    duty = {who: 0 for who, _, _ in registrations} # how many helping roles each person has so far
+    order = {who: i for i, (who, _, _) in enumerate(registrations)}
+    table = AssignmentTable(config)
+    people = {}
+    for number, (who, wcaid, events) in enumerate(registrations):
+        people[who] = Person(who, wcaid, str(number+1))
+    for event in config["events"]:
+        entrants = [who for who, _, events in registrations if event in events]
+        if len(entrants) == 0:
+            continue
+        num_groups = settings.get("groups", {}).get(event)
+        if num_groups is None:
+            size = stations if stations > 0 else settings.get("group_size", 20)
+            num_groups = math.ceil(len(entrants) / size)
+        num_groups = max(1, min(num_groups, len(entrants)))
+        # deal the entrants out in a shuffled (but repeatable) order, so the same people aren't always together
+        entrants.sort(key=lambda who: hashlib.md5(f"{event} {who}".encode("utf-8")).hexdigest())
+        group_of = {who: i % num_groups + 1 for i, who in enumerate(entrants)}
+        members = {g: [] for g in range(1, num_groups+1)} # group -> who competes in it
+        for who in entrants:
+            people[who].roles[event] = [Role("C", str(group_of[who]))]
+            members[group_of[who]].append(who)
+        # Everybody's place in line for each role in this event, smallest first: judges are whoever has helped least,
+        # scramblers and runners are people in the event first. Each role keeps its own heap for the whole event.
+        def entry(role, who):
+            if role == "J":
+                return (duty[who], who not in group_of, order[who], who)
+            return (who not in group_of, duty[who], order[who], who)
+        wanted = [role for role in "JSR" if role in allowed]
+        heaps = {}
+        for role in wanted:
+            heaps[role] = [entry(role, who) for who in duty]
+            heapq.heapify(heaps[role])
+        for g in range(1, num_groups+1):
+            size = len(members[g])
+            busy = set(members[g]) # competing in this group
+            counts = {"J": math.ceil(size * settings.get("judges", 1)), "S": settings.get("scramblers", 2),
+                      "R": settings.get("runners", 2)}
+            for role in wanted:
+                heap = heaps[role]
+                picked, passed, next_up = [], [], [] # next_up: people who compete in the next group
+                while len(picked) < counts[role] and len(heap) > 0:
+                    item = heapq.heappop(heap)
+                    who = item[-1]
+                    if item != entry(role, who):
+                        heapq.heappush(heap, entry(role, who)) # they've picked up a role since this was queued
+                    elif who in busy:
+                        passed.append(item)
+                    elif group_of.get(who) == g + 1:
+                        next_up.append(item)
+                    else:
+                        picked.append(who)
+                # next_up came off the heap in order, so if everybody else has run out, take them from the front.
+                picked += [item[-1] for item in next_up[0:counts[role] - len(picked)]]
+                for who in picked:
+                    people[who].roles.setdefault(event, []).append(Role(role, str(g)))
+                    duty[who] += 1
+                    busy.add(who)
+                for who in picked + [item[-1] for item in passed + next_up]:
+                    heapq.heappush(heap, entry(role, who))
+    for who, _, _ in registrations:
+        table.add(people[who])
+    return table
+
+# Writes an AssignmentTable out as an assignments CSV that load_data() can read back, with a column for each event in
+# the config file.
+def write_assignments(config, assignments, filename):
+    events = list(config["events"].keys())
+    with open(filename, "w", encoding="utf-8", newline="") as fout:
+        writer = csv.writer(fout)
+        writer.writerow(["Name", "WCA ID", "Number"] + events)
+        for person in assignments.people.values():
+            writer.writerow([person.name, person.wcaid, person.number] +
+                            [";".join(r.role + r.group for r in person.roles.get(e, [])) for e in events])
+
 # Draws one subdivided box for a "row" on a scorecard. Includes solve rows,
 # header rows, etc. Draws the box at the origin; caller must translate first.
 def drawScorecardRow(c, cw, hu, vu, h, linePositions=None, labels=None, isStar=False, fs=12):
@@ -226,9 +655,7 @@ def drawScorecardRow(c, cw, hu, vu, h, linePositions=None, labels=None, isStar=F
         for x in linePositions:
             c.line(x*hu,0,x*hu,h*vu)
     if labels is not None: # put labels where desired
-        fudge = fs/6.0
-        for l in labels:
-            c.drawCentredString(l[0]*hu,fudge+(h*vu-fs)/2.0,l[1])
+        drawRowLabels(c, hu, vu, h, labels, fs)
     if isStar and linePositions is not None:
         centerX = (linePositions[0]+linePositions[1])*hu / 2.0 # middle of the scrambler signature space.
         centerY = (h/2.0)*vu
@@ -250,24 +677,106 @@ def drawScorecardRow(c, cw, hu, vu, h, linePositions=None, labels=None, isStar=F
         c.drawPath(p, fill=1)
         c.setFillColorRGB(0,0,0) # opaque black
 
-def draw_one_scorecard(c, comp, who, wcaid, number, event, round, group, stage, solves, attempts, cutoff, limit):
-    global config, w, h, w2, h2, m
-    border = 0.375*72
-    c.saveState()
-    c.translate(border,border)
+# Draws just the labels of a row drawn by drawScorecardRow(), for when the box itself is part of a template.
+def drawRowLabels(c, hu, vu, h, labels, fs=12):
+    fudge = fs/6.0
+    for l in labels:
+        c.drawCentredString(l[0]*hu,fudge+(h*vu-fs)/2.0,l[1])
+
+# Auto-fitting text. Names, WCA IDs and competition names can be longer than the box they go in, so they're drawn
+# with draw_fitted_string(), which shrinks the font until the text fits the box's width. Where there's room for a
+# second line (see wrap), text that would have to shrink below min_scale of its size is split into two lines instead.
+# Text that already fits is drawn exactly as before.
+
+# Width of text at a 1 point font size. Widths scale with the font size, so this one cache serves every size, and
+# a competitor's name is only measured once however many cards it's on.
+@functools.lru_cache(maxsize=65536)
+def text_width(text, font):
+    return stringWidth(text, font, 1)
+
+# Works out how to fit text into max_width points: returns the font size to use and the lines to draw.
+def fit_text(text, font, size, max_width, wrap=False, min_scale=0.6):
+    width = text_width(text, font)
+    if width*size <= max_width:
+        return size, [text]
+    if wrap and width*size*min_scale > max_width and " " in text:
+        # split at the space that makes the longer line shortest
+        words = text.split(" ")
+        lines = min(([" ".join(words[:i]), " ".join(words[i:])] for i in range(1, len(words))),
+                    key=lambda lines: max(text_width(l, font) for l in lines))
+        return min(size, max_width/max(text_width(l, font) for l in lines)), lines
+    return max_width/width, [text]
+
+# Draws text centred at (x, y) (or starting at x, if centred is False) in font at size, or smaller if that's what it
+# takes to fit in max_width. Two-line text keeps its last line on the baseline and grows upwards. Returns the size it
+# was drawn at, which the canvas's font is left set to: most text is followed by more fitted text, which sets its own
+# font, so setting it back would be wasted, and it's one of the costs of shrinking a line.
+def draw_fitted_string(c, x, y, text, font, size, max_width, wrap=False, centred=True, min_scale=0.6):
+    fitted, lines = fit_text(text, font, size, max_width, wrap, min_scale)
+    c.setFont(font, fitted)
+    for i, line in enumerate(lines):
+        if centred:
+            c.drawCentredString(x, y + (len(lines)-1-i)*fitted*1.1, line)
+        else:
+            c.drawString(x, y + (len(lines)-1-i)*fitted*1.1, line)
+    return fitted
+
+# Static page furniture that many cards share is drawn once per PDF as a form XObject (a "template"), and each card
+# just references it with doForm(). A template is named by its builder function plus a hash of the builder's
+# arguments, so the same template gets the same name in every process. This maps template names to (builder, args).
+templates = {}
+
+# Each process also keeps the drawing operators of every template it has drawn, so the next PDF that uses it (and
+# with --per-person, every packet is its own PDF) can copy them instead of drawing it all again. This maps template
+# names to (operators, fonts), where fonts is [(font, PDF font name)] for the fonts the operators use. The PDF font
+# names (/F1, /F2...) depend on the order each PDF first uses its fonts, so they're checked before the copy is used.
+template_ops = {}
+
+def use_template(c, builder, *args):
+    name = builder.__name__ + "_" + hashlib.md5(repr(args).encode("utf-8")).hexdigest()[:12]
+    if name not in templates:
+        templates[name] = (builder, args)
+    if not c.hasForm(name): # first use in this PDF
+        define_template(c, name)
+    c.doForm(name)
 
+def define_template(c, name):
+    builder, args = templates[name]
+    c.beginForm(name, -m, -m, w, h) # let the bounding box overhang the origin so lines along the edges don't get clipped
+    ops, fonts = template_ops.get(name, (None, ()))
+    if ops is not None and all(c._doc.getInternalFontName(font) == internal for font, internal in fonts):
+        c._code.extend(ops)
+    else:
+        builder(c, *args)
+        tokens = set(" ".join(c._code).split())
+        template_ops[name] = (list(c._code), [(font, internal) for font, internal in c._doc.fontMapping.items() if internal in tokens])
+    c.endForm()
+
+# returns the card width, card height, horizontal unit, vertical unit, and vertical row height for a scorecard
+def scorecard_units():
+    border = 0.375*72
     cw = w2-2*border # card width; width of usable horizontal part of the card
     ch = h2-2*border # card height
     hu = cw / 14 # define 14 units across the width
     vu = ch / 19 # define 19 units down the height
     vr = vu * 0.8334 # vertical row (vr) height is 5/6ths of a unit. This is a hack to squeeze in an E2 row into the earlier design.
+    return cw, ch, hu, vu, vr
 
+# Height of everything on a scorecard below the competitor row. Must match the translates in draw_scorecard_skeleton().
+def scorecard_skeleton_height(attempts):
+    cw, ch, hu, vu, vr = scorecard_units()
+    height = 4*vr + vu + 10*vu + 1.2*vu
+    if attempts is not None and 0 <= attempts <= 4: # the cutoff line goes in above solve attempts+1
+        height += 0.5*vu
+    return height
+
+# Draws the part of a scorecard that's the same for every card with this event format and star status: the
+# extra and solve rows, the header row, and the (empty) competitor row boxes. Used as a template.
+def draw_scorecard_skeleton(c, solves, attempts, cutoff, limit, isStar):
+    cw, ch, hu, vu, vr = scorecard_units()
     c.setFont("Helvetica", 12)  # font for the solve numbers
     linePositions = [1,2.5,11,12.5] # grid positions for the vertical lines
 
-    # figure out if this competitor needs a star on their scorecards.
-    isStar = ("stars" in config) and (who in config["stars"]) and (event in config["stars"][who])
-
     # The idea here is that each row consists of a call to drawScorecardRow
     # follows by a vertical translate to account for that row's height. Each
     # thing is responsible for "consuming" its own height out of the State
@@ -300,224 +809,422 @@ def draw_one_scorecard(c, comp, who, wcaid, number, event, round, group, stage,
     ], False, 12)    
     c.translate(0,1.2*vu)
 
-    # Draw the competitor row
-    drawScorecardRow(c, cw, hu, vu*0.8, 1, [4.5], [(2.25,wcaid),(8.25,who),(13,number)], False, 12)
+    # and the boxes of the competitor row
+    drawScorecardRow(c, cw, hu, vu*0.8, 1, [4.5], None, False, 12)
+
+def draw_one_scorecard(c, comp, who, wcaid, number, event, round, group, stage, solves, attempts, cutoff, limit, isStar=None, qr=None):
+    global config, w, h, w2, h2, m
+    border = 0.375*72
+    c.saveState()
+    c.translate(border,border)
+    cw, ch, hu, vu, vr = scorecard_units()
+
+    if isStar is None:
+        isStar = is_star(config, who, event)
+
+    # draw everything up through the competitor row's boxes from a template, then fill in this card's details.
+    use_template(c, draw_scorecard_skeleton, solves, attempts, cutoff, limit, isStar)
+    c.translate(0,scorecard_skeleton_height(attempts))
+
+    # The QR code, if there is one, goes in the top right corner, above the competitor row. The lines of text above
+    # that row stay centred, so they keep clear of it on both sides.
+    header = cw
+    if qr is not None:
+        header = cw - 2*qr_side*vu
+        draw_qr_code(c, cw - qr_side*vu, vu, qr_side*vu, qr)
+
+    # Fill in the competitor row. The ID has the box left of the line at 4.5 units; the name and number share the
+    # box to its right, so the name keeps clear of 12.25 units and the number of the card's edge.
+    pad = 2
+    y = 2.0+(vu*0.8-12)/2.0 # where drawRowLabels() would put it
+    draw_fitted_string(c, 2.25*hu, y, wcaid, "Helvetica", 12, 4.5*hu-2*pad)
+    draw_fitted_string(c, 8.25*hu, y, who, name_font("Helvetica"), 12, 7.5*hu-2*pad)
+    draw_fitted_string(c, 13*hu, y, number, "Helvetica", 12, 1.5*hu)
     c.translate(0,vu)
 
     # skip up a little bit and draw the round, group, and stage
     if stage == "":
-        c.drawCentredString(cw/2,0.5*vu-6,f"Round {round} | Group {group}")
+        draw_fitted_string(c, cw/2, 0.5*vu-6, f"Round {round} | Group {group}", "Helvetica", 12, header-2*pad)
     else:
-        c.drawCentredString(cw/2,0.5*vu-6,f"Round: {round} | Group: {group} | Stage: {stage}")
+        draw_fitted_string(c, cw/2, 0.5*vu-6, f"Round: {round} | Group: {group} | Stage: {stage}", "Helvetica", 12, header-2*pad)
     c.translate(0,0.8*vu)
 
     # draw the event
-    c.setFont("Helvetica-Bold",16)
-    c.drawCentredString(cw/2, .75*vu-8, eventNames[event][0]) # uses the friendly-name of the event
+    draw_fitted_string(c, cw/2, .75*vu-8, eventNames[event][0], "Helvetica-Bold", 16, header-2*pad) # uses the friendly-name of the event
     c.translate(0,1.25*vu)
 
     # and finish off with the competition name
-    c.setFont("Helvetica",12)
-    c.drawCentredString(cw/2,0.5*vu-6,comp)
+    draw_fitted_string(c, cw/2, 0.5*vu-6, comp, "Helvetica", 12, header-2*pad)
     c.restoreState()
 
-# Maps a stage's shorthand form, like "R" or "B", back to its full name, like "Red" or "Blue"
-def get_stage_name(shorthand):
-    _ret = f"Error: stage name not found for shorthand {shorthand}"
-    for stage_name in config["stages"].keys():
-        if config["stages"][stage_name][0] == shorthand:
-            _ret = stage_name
-    return _ret
+# QR codes on named scorecards, for entering results by scanning the card instead of typing the competitor in. With
+# "scorecard_qr": true in the config, each named scorecard gets a code holding the competition, competitor number,
+# WCA ID, event, round and group, separated by |, after a "CG1" that says what the code is, like
+# "CG1|My Sample Competition|11|2017BLAC06|333|1|2". Star competitors' later-round cards have an empty group.
+
+# Size of the QR code's square, in the scorecard's vertical units (see scorecard_units()), quiet zone and all.
+qr_side = 2.9
+
+# The extra scorecard argument for a QR code: (payload,) if the config asks for QR codes, and () if it doesn't, so
+# that the cards (and the page cache's hashes of them) stay the same as they always were without them.
+def scorecard_qr(config, number, wcaid, event, round, group):
+    if config.get("scorecard_qr") is not True:
+        return ()
+    return ("|".join(["CG1", config["competition"], str(number), wcaid, event, str(round), "" if group == "__" else str(group)]),)
+
+# QR encoding. reportlab's QR support, the QrCodeWidget in reportlab.graphics.barcode.qr, takes nearly 20 ms to make
+# a code (over a minute and a half for 5000 scorecards, several times as long as drawing them), mostly on work that's
+# the same for every code of a version: building the Reed-Solomon generator polynomials, laying out the finder,
+# timing and alignment patterns, and scoring all 8 mask patterns. The widget has no way to share that work between
+# codes, so the codes are made in a batch with the encoder behind it, reportlab.graphics.barcode.qrencoder, instead:
+# qr_layout() uses the encoder and its tables once for each version, and qr_code() just fills in each payload's
+# bytes. All codes are byte mode, error correction level M, and mask pattern 0, and each one is the same, module for
+# module, as the encoder makes with that mask (benchmark.py qr checks that, and scans the codes off rendered pages).
+# The mask pattern is written into the code, so readers take any of them; scoring all 8 to pick one is most of the
+# widget's time, and in our scans the codes read just as reliably with mask 0 as with the one it picks.
+
+# What every code of one version has in common: its size in modules, and width in bits (whole bytes); its
+# Reed-Solomon blocks, as (data codewords, error correction codewords, table); the code with the function patterns
+# drawn and every data bit zero, masked, as a whole number (the top row first, each row width bits long, and a
+# module's bit is 1 if it's dark); and for each codeword, a pair of lists of the modules that each value of its top
+# and bottom 4 bits flips from there. A block's table is its generator polynomial times each byte value, as a whole
+# number, so working out the error correction codewords (the remainder of dividing the data codewords by the
+# generator polynomial) takes a shift and an xor for each data codeword.
+#
+# The error correction codewords are xors of the data codewords' bits, so each payload byte flips the same modules
+# whatever the rest of the payload is: "bytes" has a list for each byte of the payload of the modules each of its 256
+# values flips, worked out from qr_image(), and a payload's code is the code for that many zero bytes (qr_blank())
+# with its bytes' flips.
+@functools.lru_cache(maxsize=None)
+def qr_layout(version):
+    from reportlab.graphics.barcode import qrencoder
+    level = qrencoder.QRErrorCorrectLevel.M
+    base = qrencoder.QRCode(version, level)
+    base.addData(qrencoder.QR8bitByte(""))
+    base.makeImpl(False, 0)
+    size = base.getModuleCount()
+    width = 8*math.ceil(size/8)
+    module = lambda row, col: 1 << ((size-1-row)*width + width-1-col)
+    data = [module(row, col) for col, row in base.dataPosIterator()]
+    for col, row in base.dataPosIterator():
+        base.modules[row][col] = (row+col) % 2 == 0 # mask pattern 0
+    image = sum(module(row, col) for row in range(size) for col in range(size) if base.modules[row][col])
+    exp, log = qrencoder.QRMath.gexp, qrencoder.QRMath.glog
+    blocks = []
+    for block in qrencoder.QRRSBlock.getRSBlocks(version, level):
+        checks = block.totalCount - block.dataCount
+        gen = [log(g) for g in qrencoder.QRUtil.getErrorCorrectPolynomial(checks).num[1:]]
+        table = [0] + [int.from_bytes(bytes(exp(log(f) + g) for g in gen), "big") for f in range(1, 256)]
+        blocks.append((block.dataCount, checks, table))
+    flips = lambda bits: [functools.reduce(operator.xor, (bit for i, bit in enumerate(bits) if value & (8 >> i)), 0) for value in range(16)]
+    nibbles = [(flips(data[i:i+4]), flips(data[i+4:i+8])) for i in range(0, len(data) - len(data) % 8, 8)]
+    layout = {"size": size, "width": width, "blocks": blocks, "image": image, "nibbles": nibbles}
+    longest = (8*sum(block[0] for block in blocks) - 4 - qr_count_bits(version)) // 8
+    zeros = qr_image(layout, version, bytes(longest))
+    layout["bytes"] = []
+    for i in range(longest):
+        top = flips([qr_image(layout, version, bytes(i) + bytes([128 >> b]) + bytes(longest-i-1)) ^ zeros for b in range(4)])
+        bottom = flips([qr_image(layout, version, bytes(i) + bytes([8 >> b]) + bytes(longest-i-1)) ^ zeros for b in range(4)])
+        layout["bytes"].append([top[value >> 4] ^ bottom[value & 15] for value in range(256)])
+    return layout
+
+# How many bits a byte mode code of this version gives to the byte count.
+def qr_count_bits(version):
+    return 8 if version < 10 else 16
+
+# The smallest version that holds n bytes at level M, worked out by reportlab.
+@functools.lru_cache(maxsize=None)
+def qr_version(n):
+    from reportlab.graphics.barcode import qrencoder
+    code = qrencoder.QRCode(None, qrencoder.QRErrorCorrectLevel.M)
+    code.addData(qrencoder.QR8bitByte("x"*n))
+    return code.calculate_version()
+
+# Encodes data (bytes) as a code of the given version the long way, codewords and all, and returns its image, as in
+# qr_layout(). qr_layout() uses it to work out what each byte flips.
+def qr_image(layout, version, data):
+    capacity = sum(block[0] for block in layout["blocks"])
+    # byte mode: the mode indicator, the byte count, the bytes, a terminator, and then padding to the capacity
+    count_bits = qr_count_bits(version)
+    bits = ((4 << count_bits | len(data)) << 8*len(data)) | int.from_bytes(data, "big")
+    length = 4 + count_bits + 8*len(data)
+    pad = min(4, 8*capacity - length)
+    pad += -(length + pad) % 8
+    words = list((bits << pad).to_bytes((length + pad)//8, "big"))
+    words += [(0xEC, 0x11)[i % 2] for i in range(capacity - len(words))]
+    # the error correction codewords for each block, and then the blocks interleaved a codeword at a time
+    blocks, checks, offset = [], [], 0
+    for n, count, table in layout["blocks"]:
+        block = words[offset:offset+n]
+        offset += n
+        top, mask, check = 8*(count-1), (1 << 8*count) - 1, 0
+        for word in block:
+            check = ((check << 8) & mask) ^ table[word ^ (check >> top)]
+        blocks.append(block)
+        checks.append(check.to_bytes(count, "big"))
+    words = [w for column in itertools.zip_longest(*blocks) for w in column if w is not None]
+    words += [w for column in itertools.zip_longest(*checks) for w in column if w is not None]
+    # each 1 bit flips its data module from what the mask made it
+    image = layout["image"]
+    for word, (top, bottom) in zip(words, layout["nibbles"]):
+        image ^= top[word >> 4] ^ bottom[word & 15]
+    return image
+
+# The image of the code of n zero bytes.
+@functools.lru_cache(maxsize=None)
+def qr_blank(n):
+    version = qr_version(n)
+    return qr_image(qr_layout(version), version, bytes(n))
+
+# Encodes payload as a QR code, and returns its size in modules and the PDF operators that draw it as a 1 by 1 image
+# mask in the current fill colour. An inline image is a few hundred bytes, where a rectangle for each run of dark
+# modules would be a few thousand. Each payload is only encoded once per process, however many cards it's on.
+@functools.lru_cache(maxsize=8192)
+def qr_code(payload):
+    data = payload.encode("utf-8")
+    layout = qr_layout(qr_version(len(data)))
+    image = qr_blank(len(data))
+    for byte, flips in zip(data, layout["bytes"]):
+        image ^= flips[byte]
+    return layout["size"], f"BI /W {layout['size']} /H {layout['size']} /IM true /D [1 0] /F /AHx ID {image:0{layout['size']*layout['width']//4}X}> EI"
+
+# Draws the QR code for payload in black, in a side by side square with its bottom left corner at (x, y), leaving the
+# quiet zone of four modules all round that the QR spec asks for. The operators are written out in one go, rather than
+# with saveState() and transform(), which are slower than the code itself.
+def draw_qr_code(c, x, y, side, payload):
+    size, image = qr_code(payload)
+    module = side/(size + 8)
+    c.addLiteral(f"q {size*module:.3f} 0 0 {size*module:.3f} {x + 4*module:.3f} {y + 4*module:.3f} cm 0 g {image} Q")
+
+# A page plan describes an output PDF without drawing it. Each page is a (cards, sheet) pair: cards is a list of
+# (x, y, func, args) tuples, each of which draws one card by translating to (x, y) and calling func(c, *args), and
+# sheet is a (scale, guides) pair: the scale the cards are drawn at, and the cut guide lines to draw, if any. Everything a card needs is in its args, so a page can be drawn in
+# another process, and hashed to tell whether it has changed since the last run (see PageCache).
+
+# N-up imposition. impose() works out how to put cards of size card on paper: per_page of them, in whichever grid
+# lets them be biggest, or if per_page is None, as many as fit at full size. They're shrunk if that's what it takes
+# to fit, and centred on the paper, in rows from the top left. mirror=True lays each row out from the right instead,
+# for the backs of double-sided cards, so that each back gets printed behind its own front. Cards are drawn at their
+# design size, and scaled to the card size. Returns a layout: a dict of the paper size, the origins of the cards, the
+# scale to draw them at, and the cut guide lines between (and, if there's a margin, around) them.
+@functools.lru_cache(maxsize=64)
+def impose(paper, card, design=None, per_page=None, mirror=False):
+    design = design or card
+    if per_page is None:
+        across, down = max(1, int(paper[0] // card[0])), max(1, int(paper[1] // card[1]))
+        per_page = across*down
+    else: # the biggest cards, and then the fewest empty places in the grid
+        grids = [(a, math.ceil(per_page/a)) for a in range(1, per_page+1)]
+        across, down = max(grids, key=lambda g: (min(paper[0]/(g[0]*card[0]), paper[1]/(g[1]*card[1])), -g[0]*g[1]))
+    fit = min(1, paper[0]/(across*card[0]), paper[1]/(down*card[1]))
+    cw, ch = card[0]*fit, card[1]*fit
+    mx, my = (paper[0] - across*cw)/2, (paper[1] - down*ch)/2
+    origins = [[mx + (across-1-col if mirror else col)*cw, my + (down-1-row)*ch] for row in range(down) for col in range(across)]
+    cuts = tuple((mx + i*cw, 0, mx + i*cw, paper[1]) for i in range(across+1) if 0 < mx + i*cw < paper[0])
+    cuts += tuple((0, my + j*ch, paper[0], my + j*ch) for j in range(down+1) if 0 < my + j*ch < paper[1])
+    return {"paper": paper, "origins": origins[:per_page], "scale": fit*min(card[0]/design[0], card[1]/design[1]), "cuts": cuts}
+
+# Paper sizes that the "layout" settings can name. Any other size is given as [width, height] in points.
+paper_sizes = {"letter": letter, "legal": legal, "tabloid": TABLOID, "a3": A3, "a4": A4, "a5": A5}
+
+# The "layout" settings in the config file, with the defaults filled in: paper, the size of a scorecard (drawn at
+# half a letter page, and scaled to this) and of a badge, how many of each to put on a sheet, and whether to pack the
+# cards of different events onto the same sheets, in stacks of so many sheets (see stack_pages()).
+def layout_settings(config):
+    cfg = config.get("layout", {})
+    paper = cfg.get("paper", "letter")
+    if isinstance(paper, str):
+        if paper.lower() not in paper_sizes:
+            print(f"Error: unknown paper size {paper} in the layout settings. Use one of {', '.join(paper_sizes)}, or [width, height] in points.")
+            exit()
+        paper = paper_sizes[paper.lower()]
+    settings = {"paper": tuple(paper),
+                "scorecard_size": tuple(cfg.get("scorecard_size", (w2, h2))),
+                "scorecards_per_page": cfg.get("scorecards_per_page", 4),
+                "badge_size": tuple(cfg.get("badge_size", badge_size)),
+                "badges_per_page": cfg.get("badges_per_page", 9),
+                "pack": cfg.get("pack", False) is True,
+                "stack": cfg.get("stack", 100)}
+    for key in ["scorecards_per_page", "badges_per_page", "stack"]:
+        if settings[key] is not None and (not isinstance(settings[key], int) or settings[key] < 1):
+            print(f"Error: the layout setting {key} must be a whole number, 1 or more.")
+            exit()
+    return settings
+
+def scorecard_layout(config):
+    settings = layout_settings(config)
+    return impose(settings["paper"], settings["scorecard_size"], (w2, h2), settings["scorecards_per_page"])
+
+def badge_layout(config, mirror=False):
+    settings = layout_settings(config)
+    return impose(settings["paper"], settings["badge_size"], badge_size, settings["badges_per_page"], mirror)
+
+# Lays a list of (func, args) cards out onto pages with the given layout, in order. Each page's guides are the
+# layout's cut lines, if guides is True, and it carries the scale to draw its cards at. With partial_guides False, a
+# last page that isn't full gets no guides.
+def paginate(cards, layout, guides=False, partial_guides=True):
+    origins = layout["origins"]
+    sheet = (layout["scale"], layout["cuts"] if guides else ())
+    pages = []
+    for i in range(0, len(cards), len(origins)):
+        full = partial_guides or i + len(origins) <= len(cards)
+        pages.append(([(o[0], o[1], func, args) for o, (func, args) in zip(origins, cards[i:i+len(origins)])], sheet if full else (sheet[0], ())))
+    return pages
+
+# Lays cards out like paginate(), but in cut-and-stack order, a stack of sheets at a time: the first card of the stack
+# goes in the first place on the first sheet, the second in the first place on the second sheet, and so on. Once the
+# stack is cut up, putting the piles one on top of another puts the cards back in order. Returns a list of stacks,
+# each a list of pages.
+def stack_pages(cards, layout, guides=False, stack=100):
+    origins = layout["origins"]
+    sheet = (layout["scale"], layout["cuts"] if guides else ())
+    stacks = []
+    for start in range(0, len(cards), stack*len(origins)):
+        chunk = cards[start:start + stack*len(origins)]
+        sheets = math.ceil(len(chunk)/len(origins))
+        stacks.append([([(o[0], o[1], func, args) for o, (func, args) in zip(origins, chunk[p::sheets])], sheet) for p in range(sheets)])
+    return stacks
+
+# How many sheets of paper an output takes: a page each, or for a double-sided output, a page for every two.
+def sheet_count(out):
+    pages = sum(len(shard) for shard in out["shards"])
+    return pages//2 if out.get("duplex") else pages
+
+def draw_page(c, page):
+    cards, (scale, guides) = page
+    for x, y, func, args in cards:
+        c.saveState()
+        c.translate(x, y)
+        if scale != 1:
+            c.scale(scale, scale)
+        func(c, *args)
+        c.restoreState()
+    for line in guides:
+        c.line(*line)
+    c.showPage()
+
+# figure out if this competitor needs a star on their scorecards.
+def is_star(config, who, event):
+    return ("stars" in config) and (who in config["stars"]) and (event in config["stars"][who])
+
+# Plans the round 1 scorecards for one event (or, given an AssignmentTable for a later round from
+# next_round_table(), that round's scorecards). Every event starts on a fresh page.
+def event_scorecard_pages(config, assignments, event, round=1):
+    # iterate over everybody competing in this event
+    cards = [scorecard_card(config, assignments, assignments.people[who], event, round) for who in sorted(assignments.competing_in(event))]
+    return paginate(cards, scorecard_layout(config), config.get("cut_guides") is True)
+
+# The card for one person's scorecard in an event they're competing in.
+def scorecard_card(config, assignments, person, event, round=1):
+    solves, attempts, cutoff, limit = round_settings(config, event, round)
+    role = person.competing(event)
+    if role.stage: # no stage tag means there's no staging going on
+        stage = assignments.stage_name(role.stage) # map the stage's shorthand string back to its full name
+    else:
+        stage = ""
+    return (draw_one_scorecard, (config["competition"], person.name, person.wcaid, person.number, event, round, role.group, stage,
+                                 solves, attempts, cutoff, limit, is_star(config, person.name, event))
+                                + scorecard_qr(config, person.number, person.wcaid, event, round, role.group))
+
+# The [solves, attempts, cutoff, limit] for a round of an event: its own settings, if the config has any for it in
+# "rounds" (which a WCIF file fills in), or else the event's.
+def round_settings(config, event, round):
+    return config.get("rounds", {}).get(event, {}).get(str(round), config["events"][event])[0:4] # the slice at the end skips a stage assignment, if present
+
+# If there are any star competitors, pre-emptively generate scorecards for the later rounds of their events, on the
+# assumption that these people will make it to finals. When the config knows each event's rounds (from a WCIF file),
+# that's every later round there is, with its own settings. Otherwise, the config file doesn't store that information
+# reliably (it might be in scorecard_blanks, but somebody might not have asked for any blanks), so we just barf out
+# star scorecards for round "2" and "Final" of each event that a star competitor is doing. names picks out some of
+# the star competitors, instead of all of them.
+def star_scorecard_cards(config, assignments, names=None):
+    cards = []
+    for who in config["stars"] if names is None else names:
+        wcaid = assignments.people[who].wcaid
+        number = assignments.people[who].number
+        for event in config["stars"][who]:
+            rounds = config["rounds"][event].keys() if event in config.get("rounds", {}) else [2, "Final"]
+            for round in rounds:
+                solves, attempts, cutoff, limit = round_settings(config, event, round)
+                cards.append((draw_one_scorecard, (config["competition"], who, wcaid, number, event, round, "__", "",
+                                                   solves, attempts, cutoff, limit, is_star(config, who, event))
+                                                  + scorecard_qr(config, number, wcaid, event, round, "__")))
+    return cards
+
+# Describes the round 1 scorecards output: one shard per event, plus one for the star competitors' later-round cards.
+def scorecards_output(config, assignments):
+    return plan_outputs(config, assignments, ["scorecard"])[0]
 
 # generates the round 1 scorecards, with names
-def generate_scorecards(config, assignments):
-    global w, h, w2, h2, m
-    c = canvas.Canvas(get_filename(config["competition"],"scorecards"), pagesize=letter)
-    quadrants = [
-        [0,  h2],
-        [w2, h2],
-        [0,   0],
-        [w2,  0] ]
-    # iterate over events in this comp
-    for event in config["events"].keys():  # this will be an event id, like "333"
-        card_count = 0        
-        solves, attempts, cutoff, limit = config["events"][event][0:4] # the slice at the end skips a stage assignment, if present
-        # iterate over everybody
-        for who in sorted(assignments.keys()):
-            # See if this person is competing in this event
-            if "C" in assignments[who][event]:
-                wcaid = assignments[who]["WCA ID"]
-                number = assignments[who]["Number"]
-                junk = assignments[who][event]
-                if "stages" in config.keys(): # whether we do or don't have stages affects how to parse out the group number
-                    group = junk[junk.index("C")+2]
-                    stage = get_stage_name(junk[junk.index("C")+1]) # map the stage's shorthand string back to its full name
-                else:
-                    group = junk[junk.index("C")+1]
-                    stage = ""
-                c.saveState()
-                # Determine which page quadrant to go in -- TO DO: generalize to a configurable number of scorecards per page. Right now is hard coded for 4
-                q = card_count % 4
-                # translate to the origin for this scorecard
-                c.translate(quadrants[q][0], quadrants[q][1])
-                # draw the card:
-                draw_one_scorecard(c, config["competition"], who, wcaid, number, event, 1, group, stage, solves, attempts, cutoff, limit)
-                c.restoreState()
-                if q == 3: # that was the last card on the page
-                    if config["cut_guides"] is True:
-                        c.line(w2,0,w2,h)
-                        c.line(0,h2,w,h2)
-                    c.showPage()
-                card_count += 1
-        if (card_count % 4) != 0: # if we didn't just finish a page
-            if config["cut_guides"] is True: # very not-DRY, I know...
-                c.line(w2,0,w2,h)
-                c.line(0,h2,w,h2)
-            c.showPage()
-    # if there are any star competitors, pre-emptively generate round 2 and Finals scorecards for them on the assumption
-    # that these people will make it to finals. We're also going to take the easy route here and not correlate this
-    # against the actual subsequent rounds each event has. The config file presently doesn't store that information
-    # reliably (it might be in scorecard_blanks, but somebody might not have asked for any blanks), and would have to be
-    # redone anyway when we integrate with WCIF. So for now, we're just going to barf out star scorecards for round "2" and
-    # "Final" of each event that a star competitor is doing.
-    # This is so horrible and non-DRY with the above main scorecard logic. Oy... Refactor and fix when we do WCIF integration.
-    if "stars" in config and len(config["stars"]) > 0: 
-        card_count = 0
-        for who in config["stars"]:
-            for event in config["stars"][who]: # The inside of this loop should really just be two calls to draw_one_scorecard, but we need all the page layout logic. Need a more global mechanism for that.
-                solves, attempts, cutoff, limit = config["events"][event][0:4] # the slice at the end skips a stage assignment, if present
-                wcaid = assignments[who]["WCA ID"]
-                number = assignments[who]["Number"]
-                c.saveState()
-                q = card_count % 4
-                c.translate(quadrants[q][0], quadrants[q][1])
-                draw_one_scorecard(c, config["competition"], who, wcaid, number, event, 2, "__", "", solves, attempts, cutoff, limit)
-                c.restoreState()
-                if q == 3: # that was the last card on the page
-                    if config["cut_guides"] is True:
-                        c.line(w2,0,w2,h)
-                        c.line(0,h2,w,h2)
-                    c.showPage()
-                card_count += 1
-                c.saveState()
-                q = card_count % 4
-                c.translate(quadrants[q][0], quadrants[q][1])
-                draw_one_scorecard(c, config["competition"], who, wcaid, number, event, "Final", "__", "", solves, attempts, cutoff, limit)
-                c.restoreState()
-                if q == 3: # that was the last card on the page
-                    if config["cut_guides"] is True:
-                        c.line(w2,0,w2,h)
-                        c.line(0,h2,w,h2)
-                    c.showPage()
-                card_count += 1
-        if (card_count % 4) != 0: # if we didn't just finish a page
-            if config["cut_guides"] is True: # very not-DRY, I know...
-                c.line(w2,0,w2,h)
-                c.line(0,h2,w,h2)
-            c.showPage()
-    c.save()
-    print(f"Saving scorecards to: {get_filename(config['competition'],'scorecards')}")
+def generate_scorecards(config, assignments, pool=None, cache=None):
+    render_outputs(config, assignments, [scorecards_output(config, assignments)], pool, cache)
 
-# This is kind of a poorly named routine, since it does cards for second..final rounds and completely blank cards by means of a "blank" event hack.
+# The blanks for every round of one event that we want blanks for, as a list of cards for each round.
 # Here, interpret "blank" to mean "missing the competitor name, event name, or both"
-def generate_blank_scorecards(config):
-    global w, h, w2, h2, m
-    c = canvas.Canvas(get_filename(config["competition"],"scorecard blanks"), pagesize=letter)
-    quadrants = [
-        [0,  h2],
-        [w2, h2],
-        [0,   0],
-        [w2,  0] ]
+def blank_scorecard_cards(config, event):
     amounts = config["scorecard_blanks"]
-    for event in sorted(amounts.keys()): # for each event that we want blanks for
+    rounds = []
+    for round in amounts[event]:     # and for each round in that event that we want blanks for
+        num = amounts[event][round]  # Get the number of blanks requested in the config file
         if event == "blank":
             solves, attempts, cutoff, limit = config["events"]["333"][0:4] # blank scorecards get the same settings as 3x3. This is a reasonable default.
         else:
-            solves, attempts, cutoff, limit = config["events"][event][0:4]
-        for round in amounts[event]:     # and for each round in that event that we want blanks for
-            num = amounts[event][round]  # Get the number of blanks requested in the config file
-            for i in range(num):         # and loop over that many blanks. This is very non-DRY with the logic in generate_scorecards
-                c.saveState()
-                q = i % 4
-                c.translate(quadrants[q][0], quadrants[q][1])
-                draw_one_scorecard(c, config["competition"], "", "", "", event, round, "__", "", solves, attempts, cutoff, limit)
-                c.restoreState()
-                if q == 3: # that was the last card on the page
-                    if config["cut_guides"] is True:
-                        c.line(w2,0,w2,h)
-                        c.line(0,h2,w,h2)
-                    c.showPage()
-            if (num % 4) != 0: # weirdo user asked for a partial page at the end
-                c.showPage()
-    c.save()
-    print(f"Saving blank scorecards to: {get_filename(config['competition'],'scorecard blanks')}")
+            solves, attempts, cutoff, limit = round_settings(config, event, round)
+        card = (draw_one_scorecard, (config["competition"], "", "", "", event, round, "__", "", solves, attempts, cutoff, limit, False))
+        rounds.append([card]*num)
+    return rounds
+
+# Describes the blank scorecards output, one shard per event that we want blanks for.
+def blank_scorecards_output(config):
+    return plan_outputs(config, None, ["blank"])[0]
+
+# This is kind of a poorly named routine, since it does cards for second..final rounds and completely blank cards by means of a "blank" event hack.
+def generate_blank_scorecards(config, pool=None, cache=None):
+    render_outputs(config, None, [blank_scorecards_output(config)], pool, cache)
 
 # Returns True if the person is competing in any events.
 def isCompetitor(who):
-    ret = False
-    assn = assignments[who]
-    for event in assn.keys(): # scan through their assignments looking for any "C" assignment
-        if "C" in assn[event]:
-            ret = True
-    return ret
+    return who in assignments.competitors
 
 # Draw a single badge front
-def drawBadgeFront(c, who, wcaid):
+def drawBadgeFront(c, who, wcaid, isHelper=None):
     cfg = config["badge_config"] # convenience variable
-    c.drawImage(cfg["template_image"], 0,0, 72*2.5, 72*3.5)
+    c.doForm("BadgeTemplate") # set up once per PDF by setup_badge_canvas()
     nameX = cfg["name_conf"][0]
     nameY = cfg["name_conf"][1]
     nameSize = cfg["name_conf"][2]
     idX = cfg["id_conf"][0]
     idY = cfg["id_conf"][1]
     idSize = cfg["id_conf"][2]
-    c.setFont("Helvetica-Bold",nameSize)
-    c.drawCentredString(nameX, nameY, who)
-    c.setFont("Helvetica-Bold",idSize)
-    c.drawCentredString(idX, idY, wcaid)
-    if not isCompetitor(who): # a "helper" is a person who is not competing in any events, but does have assignments
+    # text is centred on its x, so it can only be as wide as twice the distance to the nearer edge of the badge
+    draw_fitted_string(c, nameX, nameY, who, name_font("Helvetica-Bold"), nameSize, badge_text_width(nameX), wrap=True)
+    draw_fitted_string(c, idX, idY, wcaid, "Helvetica-Bold", idSize, badge_text_width(idX))
+    if isHelper is None:
+        isHelper = not isCompetitor(who) # a "helper" is a person who is not competing in any events, but does have assignments
+    if isHelper:
         helperX = cfg["helper_conf"][0]
         helperY = cfg["helper_conf"][1]
         helperSize = cfg["helper_conf"][2]
         c.setFont("Helvetica-Bold",helperSize)
         c.drawCentredString(helperX, helperY, "Helper")
 
-# parse an assignment string into a dict of roles/groups
-def parseRoles(roles):
-    ret = {"C":"","H":""}
-    if len(roles) == 0:
-        return ret
-    _l = roles.split(";")
-    for elem in _l:
-        if elem[0] == "C":
-            ret["C"] = elem[1:] # strip off the "C" in the front, as it is redundant here
-        else:
-            ret["H"] = ret["H"] + elem + " "
-    return ret
+def badge_text_width(x, pad=6):
+    return 2*min(x, badge_size[0]-x) - 2*pad
 
-# Draw a single badge back
-def drawBadgeBack(c, config, who, assignments):
+# Draws the part of a badge back that's the same for everybody: the frame, the event column of the assignments
+# grid, the header row and the key. Used as a template, keyed by the event list (and the stages, for the key).
+def draw_badge_back_skeleton(c, events, shortNames, stages):
     hu = vu = 0.25*72 # going with a straight quarter inch grid, 10x14 units
     c.rect(0,0,10*hu,14*vu,stroke=1,fill=0)
 
-    # Draw competitor number and competition name across the top, small
-    c.setFont("Helvetica", 8)
-    c.drawCentredString(0.5*hu, 13.5*vu, assignments[who]["Number"])
-    c.drawCentredString(5*hu, 13.5*vu, config["competition"])
-
-    # Draw competitor's name, big
-    c.setFont("Helvetica-Bold",16)
-    c.drawCentredString(5*hu, 12.5*vu, who)
-
     # Draw the assignments grid. This has to happen before drawing the header row so the white header row text doesn't get clipped by the boxes around these scorecardRow() calls.
     # Available vertical space = 2 through 11.5, ~9.5 units
+    c.setFont("Helvetica-Bold",16)
     c.saveState()
-    numEvents = len(config["events"])
-    rowHeight = 9.5/numEvents
+    rowHeight = 9.5/len(events)
     c.translate(0, (11.5-rowHeight)*vu)
-    for event in config["events"]:
-        roles = parseRoles(assignments[who][event]) # split the roles string into a dictionary of C and H column info.
-        drawScorecardRow(c, 10*hu, hu, vu, rowHeight, [3,6.5], [(1.5,eventNames[event][1]), (4.75,roles["C"]),(8.25,roles["H"].strip())]) # this uses the short-name of the event
+    for shortName in shortNames:
+        drawScorecardRow(c, 10*hu, hu, vu, rowHeight, [3,6.5], [(1.5,shortName)]) # this uses the short-name of the event
         c.translate(0,-rowHeight*vu)
     c.restoreState()
 
@@ -528,7 +1235,7 @@ def drawBadgeBack(c, config, who, assignments):
     c.setFont("Helvetica-Bold", 8)
     c.setFillColorRGB(1,1,1) # opaque white
     c.drawCentredString( 1.5*hu, 11.5*vu+2, "Event")
-    if "stages" in config.keys():
+    if stages is not None:
         c.drawCentredString(4.75*hu, 11.5*vu+2, "Stage & Group")
     else:
         c.drawCentredString(4.75*hu, 11.5*vu+2, "Group")
@@ -537,10 +1244,10 @@ def drawBadgeBack(c, config, who, assignments):
  
     # Draw key at the bottom
     c.setFont("Helvetica",12)
-    if "stages" in config.keys():
-        stage_key =  "/".join([config["stages"][_][0] for _ in config["stages"].keys()])
+    if stages is not None:
+        stage_key =  "/".join([stages[_][0] for _ in stages.keys()])
         stage_key = stage_key + ": "
-        stage_key = stage_key + "/".join(config["stages"].keys())
+        stage_key = stage_key + "/".join(stages.keys())
         c.drawString(0.5*hu, 1.25*vu, stage_key)
     else:
         c.drawString(0.5*hu, 1.25*vu, "C: Competing")
@@ -548,81 +1255,2132 @@ def drawBadgeBack(c, config, who, assignments):
     c.drawString(5.5*hu, 1.25*vu, "R: Running")
     c.drawString(5.5*hu, 0.25*vu, "S: Scrambling")
 
-# Handles the looping over a batch of 9 people, with the translation junk and the showPage() calls
-def badge_page_loop(c, config, name_list, assignments, side, idx_start, idx_end):
-    x0, x1, x2 = [36, 36+(2.5*72),36+(5*72)]  # set up the grid locations so they can be indexed easily
-    y0, y1, y2 = [18, 18+(3.5*72),18+(7*72)]
-    if side == "front":                       # front side are laid out left-to-right in rows
-        origins = [
-            [x0,y2],[x1,y2],[x2,y2],
-            [x0,y1],[x1,y1],[x2,y1],
-            [x0,y0],[x1,y0],[x2,y0]
-        ]
-    elif side == "back":                      # back side are laid out right-to-left in rows
-        origins = [                           # this is so double-sided printing keeps the
-            [x2,y2],[x1,y2],[x0,y2],          # correct back with its matching front.
-            [x2,y1],[x1,y1],[x0,y1],
-            [x2,y0],[x1,y0],[x0,y0]
-        ]
+# Draw a single badge back. rows gives the (competing, helping) text for each event, in the same order as events.
+def drawBadgeBack(c, comp, number, who, events, stages, rows):
+    hu = vu = 0.25*72 # going with a straight quarter inch grid, 10x14 units
+    use_template(c, draw_badge_back_skeleton, events, [eventNames[e][1] for e in events], stages)
+
+    # Draw competitor number and competition name across the top, small
+    # The number gets the first unit; the name keeps clear of it on both sides.
+    draw_fitted_string(c, 0.5*hu, 13.5*vu, number, "Helvetica", 8, hu)
+    draw_fitted_string(c, 5*hu, 13.5*vu, comp, "Helvetica", 8, 8*hu-4)
+
+    # Draw competitor's name, big. A name that would have to shrink below 11 points to fit on one line goes on two
+    # lines of up to 11 points instead, moved down to fit between the header row and the competition name.
+    font = name_font("Helvetica-Bold")
+    if len(fit_text(who, font, 16, 10*hu-8, True, 11/16)[1]) > 1:
+        fitted = draw_fitted_string(c, 5*hu, 12*vu+4, who, font, 11, 10*hu-8, wrap=True, min_scale=1)
     else:
-        print("Error: 'side' parameter must be 'front' or 'back'.")
-        exit()
+        fitted = draw_fitted_string(c, 5*hu, 12.5*vu, who, font, 16, 10*hu-8)
+    if (font, fitted) != ("Helvetica-Bold", 16):
+        c.setFont("Helvetica-Bold", 16) # the roles below are drawn in the font the name leaves set
 
-    for i in range(idx_start, idx_end):
-        who = name_list[i]
-        c.saveState()
-        c.translate(origins[i-idx_start][0], origins[i-idx_start][1])
-        if side == "front":
-            drawBadgeFront(c, who, assignments[who]["WCA ID"])  
-        if side == "back":
-            drawBadgeBack(c, config, who, assignments)
-        c.restoreState()
+    # Fill in this person's roles in the assignments grid
+    c.saveState()
+    rowHeight = 9.5/len(events)
+    c.translate(0, (11.5-rowHeight)*vu)
+    for competing, helping in rows:
+        drawRowLabels(c, hu, vu, rowHeight, [(4.75,competing),(8.25,helping)])
+        c.translate(0,-rowHeight*vu)
+    c.restoreState()
 
-def generate_badges(config,assignments):
-    c = canvas.Canvas(get_filename(config["competition"], "badges"), pagesize=letter)
-    name_list = list(assignments.keys()) # make a list of names so they have indexes.
-    # Iterate over all the assignments in groups of 9
-    for idx_start in range(0,len(name_list),9):
-        idx_end = min(idx_start + 9, len(name_list))
-        badge_page_loop(c, config, name_list, assignments, "front", idx_start, idx_end)
-        c.showPage()
-        badge_page_loop(c, config, name_list, assignments,  "back", idx_start, idx_end)
+# the arguments to drawBadgeBack() for one person
+def badge_back_args(config, person):
+    events = list(config["events"].keys())
+    rows = []
+    for event in events:
+        roles = person.roles.get(event, [])
+        competing = "".join(r.stage + r.group for r in roles if r.role == "C")
+        helping = " ".join(str(r) for r in roles if r.role != "C")
+        rows.append((competing, helping))
+    return (config["competition"], person.number, person.name, events, config.get("stages"), rows)
+
+# Plans both sides of one sheet of (up to) 9 badges
+def badge_sheet_pages(config, assignments, names):
+    people = [assignments.people[who] for who in names]
+    fronts = [(drawBadgeFront, (p.name, p.wcaid, p.name not in assignments.competitors)) for p in people]
+    backs = [(drawBadgeBack, badge_back_args(config, p)) for p in people]
+    return paginate(fronts, badge_layout(config)) + paginate(backs, badge_layout(config, mirror=True))
+
+# The badge template image goes into the PDF once, as a form that every badge front draws with doForm().
+def setup_badge_canvas(c, config):
+    cfg = config["badge_config"]
+    c.beginForm("BadgeTemplate", 0, 0, *badge_size)
+    draw_shared_image(c, cfg["template_image"], 0,0, *badge_size, cfg.get("template_dpi", 300), cfg.get("template_quality"))
+    c.endForm()
+
+# Loaded image XObjects, by (path, modification time, size and settings). Loading and encoding an image for the PDF is
+# the slow part of drawImage(), so each process only does it once per image, and every PDF it makes after that (every
+# competition in a --batch worker, for instance) gets a copy of the same loaded image. Each entry is
+# [source, XObject], where source is what gets passed to drawImage() (see draw_shared_image()).
+image_xobjects = {}
+
+# Draws an image file like c.drawImage(filename, x, y, width, height), but through prepare_image() and
+# image_xobjects. Use it for any template image that goes on a lot of pages. If prepare_image() made a new version of
+# the image, it's registered in the PDF ahead of time under the name drawImage() would give a made-up source name,
+# so drawImage() finds it there and never goes looking for the made-up file.
+def draw_shared_image(c, filename, x, y, width, height, dpi=None, quality=None):
+    key = (os.path.abspath(filename), os.path.getmtime(filename), width, height, dpi, quality, rl_config.useA85) # the loaded image is ASCII85-encoded or not
+    if key not in image_xobjects:
+        data = prepare_image(filename, width, height, dpi, quality)
+        if data is None:
+            image_xobjects[key] = [filename, None] # use the file as it is; drawImage() loads it below
+        else:
+            source = f"{filename} ({dpi} dpi, quality {quality})"
+            img = pdfdoc.PDFImageXObject(_digester(f"{source}None".encode("utf-8")))
+            img.loadImageFromJPEG(io.BytesIO(data))
+            image_xobjects[key] = [source, img]
+    source, img = image_xobjects[key]
+    name = _digester(f"{source}None".encode("utf-8")) # the name drawImage() gives it
+    regName = c._doc.getXObjectName(name)
+    if img is not None and regName not in c._doc.idToObject:
+        img = copy.copy(img)
+        img.__dict__.pop("__InternalName__", None) # so this PDF can register it under its own object number
+        c._setXObjects(img)
+        c._doc.Reference(img, regName)
+        c._doc.addForm(name, img)
+    c.drawImage(source, x, y, width, height)
+    if img is None:
+        image_xobjects[key][1] = c._doc.idToObject[regName]
+
+# Gets an image ready to be printed at width x height points: if it has more pixels than it needs to print at dpi
+# dots per inch, it's scaled down to that, and then it's JPEG-compressed at the given quality (90 if it was scaled down
+# and no quality was given). Returns the JPEG data, or None if the image is fine the way it is (it isn't any bigger
+# than it needs to be, and no quality was asked for), or if the PIL module that does this isn't installed.
+def prepare_image(filename, width, height, dpi=None, quality=None):
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    with Image.open(filename) as im:
+        size = im.size
+        if dpi is not None:
+            size = (min(im.size[0], round(width/72*dpi)), min(im.size[1], round(height/72*dpi)))
+        if size == im.size and quality is None:
+            return None
+        im = im.convert("L" if im.mode in ("1", "L") else "RGB")
+        if size != im.size:
+            im = im.resize(size, Image.LANCZOS)
+        out = io.BytesIO()
+        im.save(out, "JPEG", quality=quality or 90, optimize=True)
+        return out.getvalue()
+
+# Describes the badges output, one shard per sheet of 9 badges. It's "duplex" because each shard is a front page and
+# a back page that have to be printed on the same sheet, so it can't be split in the middle of a shard.
+def badges_output(config, assignments):
+    return plan_outputs(config, assignments, ["badge"])[0]
+
+def generate_badges(config, assignments, pool=None, cache=None):
+    render_outputs(config, assignments, [badges_output(config, assignments)], pool, cache)
+
+# Group lists and stage lists: who is in each group of each event, for the people running the groups, and who
+# competes on each stage in each group, for announcers and runners. Both are lists drawn as cards, a page of list
+# for each group, and a quarter-page card (so the stage lists can be cut up and handed out) for each stage's share of
+# a group. columns is a list of (heading, width) pairs, with the widths as fractions of the card's width.
+list_row_height = 14
+
+# The parts of a list card that are the same on every card of the list: the competition name at the top, and the
+# column headings with a line under them. It's drawn once per PDF, as a template.
+def draw_list_skeleton(c, size, comp, columns):
+    width, height = size
+    pad = 18
+    tw = width - 2*pad
+    y = height - pad - 12
+    draw_fitted_string(c, width/2, y, comp, "Helvetica", 12, tw)
+    y -= 42
+    c.line(pad, y - 4, width - pad, y - 4)
+    x = pad
+    for heading, fraction in columns:
+        draw_fitted_string(c, x + 2, y, heading, "Helvetica-Bold", 10, fraction*tw - 4, centred=False)
+        x += fraction*tw
+
+def draw_list_card(c, size, comp, title, columns, rows):
+    width, height = size
+    pad = 18
+    tw = width - 2*pad
+    use_template(c, draw_list_skeleton, size, comp, columns)
+    draw_fitted_string(c, width/2, height - pad - 32, title, "Helvetica-Bold", 16, tw)
+    # There can be a lot of rows, so each column is one run of lines in a single text object, rather than a
+    # drawString() for every cell.
+    t = c.beginText()
+    x = pad
+    font = name_font("Helvetica")
+    for col, (_, fraction) in enumerate(columns):
+        t.setTextOrigin(x + 2, height - pad - 54 - list_row_height)
+        space = fraction*tw - 4
+        for text in [row[col] for row in rows]:
+            fitted, line = list_lines.get((font, text, space), (None, None))
+            if fitted is None:
+                fitted, _ = fit_text(text, font, 10, space)
+            if (t._fontname, t._fontsize) != (font, fitted):
+                t.setFont(font, fitted, list_row_height)
+            if line is None:
+                line = f"{t._formatText(text)} T*"
+                if font not in name_fonts.values() and " Tf " not in line:
+                    if len(list_lines) >= 65536:
+                        list_lines.clear()
+                    list_lines[(font, text, space)] = (fitted, line)
+            t._code.append(line) # what textLine() adds; the next column moves the text origin itself
+        x += fraction*tw
+    c.drawText(t)
+
+# The font size and the operators that draw each line of list text, "(text) Tj T*", by (font, text, column width). A
+# name is on list after list, and fitting, escaping and encoding it for the PDF is most of what drawing a list costs,
+# so each line is only worked out once. Lines in a TrueType name font aren't kept, and nor is text that needs one of
+# reportlab's fallback fonts, since the font changes those write depend on the PDF they're in.
+list_lines = {}
+
+# How many rows fit on a list card of the given size, under the titles and the column headings.
+def list_card_rows(size):
+    return int((size[1] - 2*18 - 12 - 20 - 22 - 4) // list_row_height)
+
+# The cards for one list, as many as it takes to fit all the rows.
+def list_cards(comp, size, title, columns, rows):
+    per_card = list_card_rows(size)
+    cards = []
+    for i in range(0, max(len(rows), 1), per_card):
+        cards.append((draw_list_card, (size, comp, title if i == 0 else f"{title} (continued)", columns, rows[i:i+per_card])))
+    return cards
+
+role_names = {"C": "Competing", "J": "Judging", "S": "Scrambling", "R": "Running"}
+group_list_columns = (("Name", 0.5), ("WCA ID", 0.22), ("Role", 0.28))
+stage_list_columns = (("#", 0.15), ("Name", 0.6), ("WCA ID", 0.25))
+
+# Group numbers sort as numbers where they are numbers, so group 10 comes after group 9.
+def group_order(group):
+    return (0, int(group), "") if group.isdigit() else (1, 0, group)
+
+# Certificates for the winners of each event, one per page of landscape letter paper, drawn from a winners file like
+# samples/sample_winners.json. Each *_conf key is [center_x, baseline_y, font_size], in points from the bottom left
+# corner of the page, like the badge settings.
+certificate_size = (letter[1], letter[0])
+certificate_fields = ["comp_name_conf", "competitor_name_conf", "place_conf", "event_name_conf", "result_conf"]
+
+# Draws the text on one certificate. The template image is a form that setup_certificate_canvas() puts in the PDF
+# once; confs is the list of *_conf settings, in the order of certificate_fields.
+def draw_certificate(c, comp, who, place, eventName, result, confs, template):
+    if template:
+        c.doForm("CertificateTemplate")
+    for i, (text, conf) in enumerate(zip([comp, who, place, eventName, result], confs)):
+        if conf is not None and text:
+            c.setFont(name_font("Helvetica-Bold") if i == 1 else "Helvetica-Bold", conf[2])
+            c.drawCentredString(conf[0], conf[1], text)
+
+def setup_certificate_canvas(c, winners):
+    if winners.get("certificate_template"):
+        c.beginForm("CertificateTemplate", 0, 0, *certificate_size)
+        draw_shared_image(c, winners["certificate_template"], 0, 0, *certificate_size, winners.get("template_dpi", 300), winners.get("template_quality"))
+        c.endForm()
+
+# Describes the certificates output: one shard per event, each with a page for every place in the order the winners
+# file lists them ("First", "Second", "Third", or anything else, like a regional record category). comp is the
+# competition's name, from the winners file's "competition" key if it has one.
+def certificates_output(winners, comp):
+    comp = winners.get("competition", comp)
+    confs = [winners.get(field) for field in certificate_fields]
+    template = bool(winners.get("certificate_template"))
+    labels = list(winners["winners"].keys())
+    shards = []
+    for event in labels:
+        cards = [(draw_certificate, (comp, who, place, eventNames.get(event, (event,))[0], result, confs, template))
+                 for place, (who, result) in winners["winners"][event].items()]
+        shards.append(paginate(cards, impose(certificate_size, certificate_size)))
+    return {"name": "certificates", "filename": get_filename(comp, "certificates"), "setup": setup_certificate_canvas, "shards": shards, "labels": labels,
+            "paper": certificate_size}
+
+# The config file settings that apply to certificates as well as everything else.
+certificate_config_keys = ["output_profile", "name_font"]
+
+# What the certificates are rendered with: the winners file, plus the config file's settings from
+# certificate_config_keys (the winners file can't have those).
+def certificate_settings(winners, config):
+    return dict(winners, **{key: config[key] for key in certificate_config_keys if key in config})
+
+def generate_certificates(winners, comp, pool=None, cache=None):
+    render_outputs(winners, None, [certificates_output(winners, comp)], pool, cache)
+
+# Fonts used anywhere in the output, plus the two that reportlab falls back to for characters like "≤" that
+# Helvetica doesn't have. They're registered up front, in this order, so that every canvas (including the scratch
+# canvases in --jobs worker processes) maps them to the same internal /F1, /F2... font names.
+pdf_fonts = ["Helvetica", "Helvetica-Bold", "Symbol", "ZapfDingbats"]
+
+# Output profiles: how the PDFs get written, picked with "output_profile" in the config or --output-profile. The
+# drawing is the same either way. "fast" leaves the page streams uncompressed, which is quicker to write than the
+# default (and to print straight from the same computer) but makes files several times bigger. "compact" compresses
+# them, and leaves out the ASCII85 encoding reportlab puts on top of the compression by default, which makes every
+# stream a quarter bigger. With ascii85_encode() doing that encoding (see load_reportlab()), "compact" takes about as
+# long to write as "fast", and often a little less. Without a profile, the PDFs come out the way they always have,
+# with reportlab's defaults.
+output_profiles = {"default": {"compression": 1, "a85": True},
+                   "fast": {"compression": 0, "a85": False},
+                   "compact": {"compression": 1, "a85": False}}
+
+# The --output-profile given on the command line, if any, which wins over the config file's "output_profile".
+output_profile_override = None
+
+def output_profile(config):
+    return output_profiles[output_profile_override or config.get("output_profile", "default")]
+
+# Makes a canvas to draw on. filename can also be a file-like object, such as an io.BytesIO. With recording=True, it's
+# a RecordingCanvas instead. profile is one of output_profiles, for a canvas that's going to be saved. Whether streams
+# are ASCII85-encoded is a reportlab-wide setting, which images read as they're loaded, so it's set here for the
+# images drawn on this canvas (recording canvases leave it alone), and again by save_canvas().
+def new_canvas(filename, recording=False, pagesize=letter, profile=output_profiles["default"]):
+    load_reportlab()
+    if not recording:
+        rl_config.useA85 = int(profile["a85"])
+    c = (RecordingCanvas if recording else canvas.Canvas)(filename, pagesize=pagesize, pageCompression=profile["compression"])
+    for font in pdf_fonts:
+        c._doc.getInternalFontName(font)
+    return c
+
+# Saves a canvas made by new_canvas() with the same profile. Other canvases (the recording ones -i draws the pages that
+# aren't in the cache on, say) can be made in between, so the ASCII85 setting is put back the way the profile wants it
+# just for the save.
+def save_canvas(c, profile):
+    a85 = rl_config.useA85
+    rl_config.useA85 = int(profile["a85"])
+    try:
+        c.save()
+    finally:
+        rl_config.useA85 = a85
+
+# Names can be drawn in a TrueType font instead of Helvetica, for names in alphabets that Helvetica doesn't have:
+# "name_font" in the config is the font's .ttf file. Every PDF gets just the characters it uses out of the font
+# embedded in it (a subset). This maps each font file to the name it's registered with reportlab under.
+name_fonts = {}
+
+# The font to draw a name (or the other text in a list of names) in: font, or the "name_font" if the config has one.
+def name_font(font):
+    path = config.get("name_font")
+    if path is None:
+        return font
+    if path not in name_fonts:
+        from reportlab.pdfbase.ttfonts import TTFont
+        from reportlab.pdfbase.pdfmetrics import registerFont
+        name_fonts[path] = f"NameFont{len(name_fonts)}"
+        registerFont(TTFont(name_fonts[path], path))
+    return name_fonts[path]
+
+def load_reportlab():
+    global canvas, pdfdoc, _digester, RecordingCanvas, stringWidth, rl_config
+    if canvas is not None:
+        return
+    from reportlab import rl_config
+    from reportlab.pdfgen import canvas
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    from reportlab.pdfbase import pdfdoc
+    from reportlab.lib.utils import _digester
+    from reportlab.lib import rl_accel
+    RecordingCanvas = type("RecordingCanvas", (PageRecorder, canvas.Canvas), {})
+    if pdfdoc.asciiBase85Encode is rl_accel._py_funcs.get("asciiBase85Encode"):
+        pdfdoc.asciiBase85Encode = ascii85_encode
+
+# ASCII85 encoding, for the default output profile. Unless the optional rl_accel module is installed, reportlab does
+# it in Python a byte at a time, which takes longer than compressing the streams does. Python's base64.a85encode()
+# gives exactly the same text about three times as fast, so load_reportlab() has reportlab use this instead.
+def ascii85_encode(data):
+    if isinstance(data, str):
+        data = data.encode("latin-1")
+    return base64.a85encode(data).decode("latin-1") + "~>"
+
+# Mixed into reportlab's Canvas to make a RecordingCanvas: a canvas that keeps each finished page's operator stream
+# instead of adding it to a PDF document. Worker processes and the page cache draw onto one of these, and
+# replay_pages() splices the recorded pages into the real output. It only carries the per-page state this script
+# actually produces: the content stream and the forms/images it uses.
+class PageRecorder:
+    def __init__(self, filename, **kwargs):
+        super().__init__(filename, **kwargs)
+        self.pages = []
+
+    def showPage(self):
+        self.pages.append((self._code, self._formsinuse))
+        self._startPage()
+
+# Templates are defined in the PDF at their first use, so when a page uses one that this PDF doesn't have yet, it's
+# defined just before the page goes in. That's the same place a serial run would have defined it.
+def replay_pages(c, pages):
+    for code, forms in pages:
+        for name in forms:
+            if name in templates and not c.hasForm(name):
+                define_template(c, name)
+        c._code.extend(code)
+        c._formsinuse.extend(forms)
         c.showPage()
-    # save the PDF file
-    c.save()
-    print(f"Saving badges to: {get_filename(config['competition'],'badges')}")
+
+# Sets up the globals that the drawing code relies on inside a worker process.
+def init_worker(cfg, assn):
+    global config, assignments
+    config = cfg
+    assignments = assn
+    for _e in cfg.get("custom_events", []):
+        eventNames[_e[0]] = tuple(_e[1:])
+
+# Draws a list of planned pages onto a RecordingCanvas and returns the recorded pages, along with the templates
+# they use so that another process can define any it hasn't seen.
+def record_pages(pages):
+    c = new_canvas(os.devnull, recording=True)
+    for page in pages:
+        draw_page(c, page)
+    used = {name: templates[name] for _, forms in c.pages for name in forms if name in templates}
+    return c.pages, used
+
+# An on-disk cache of recorded pages, keyed by a hash of everything that goes into drawing the page. Each entry is a
+# pickled (recorded page, templates it uses) pair in its own file. When the cache grows past max_bytes, the least
+# recently used entries are thrown out.
+class PageCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.reused = 0   # how many cards came out of the cache this run
+        self.rendered = 0 # and how many had to be drawn
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".page")
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def get(self, key):
+        with open(self.path(key), "rb") as fin:
+            record, used = pickle.load(fin)
+        os.utime(self.path(key)) # mark it as recently used
+        templates.update(used)
+        return record
+
+    def put(self, key, record):
+        used = {name: templates[name] for name in record[1] if name in templates}
+        tmp = self.path(key) + f".{os.getpid()}.tmp" # --batch workers can share a cache directory
+        with open(tmp, "wb") as fout:
+            pickle.dump((record, used), fout)
+        os.replace(tmp, self.path(key))
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".page"):
+                st = os.stat(os.path.join(self.directory, name))
+                entries.append((st.st_mtime, st.st_size, name))
+        total = sum(e[1] for e in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+# Everything outside a page's own cards that changes how it draws: this script's code, the event names, and the
+# badge layout settings.
+def render_context(config):
+    with open(__file__, "rb") as fin:
+        code = fin.read()
+    return hashlib.md5(code + repr((eventNames, config.get("badge_config"), pdf_fonts)).encode("utf-8")).hexdigest()
+
+def page_key(context, page):
+    cards, sheet = page
+    desc = repr((context, sheet, [(x, y, func.__name__, args) for x, y, func, args in cards]))
+    return hashlib.md5(desc.encode("utf-8")).hexdigest()
+
+# Instrumentation for --profile. A phase records its wall time, the peak RSS of this process (and of any --jobs
+# workers) as of when it finished, and the pages and cards drawn inside it. Phases can nest, e.g. one per event inside
+# the scorecards. When --profile is off, profiler stays None and profile_phase() hands back the same do-nothing
+# context manager every time.
+class Profiler:
+    def __init__(self):
+        self.phases = [] # one dict per phase, in the order they started
+        self.open = []   # the phases we're inside right now
+        self.files = []  # one dict per output file
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        record = {"phase": name, "depth": len(self.open), "seconds": 0.0, "peak_rss_mb": None, "pages": 0, "cards": 0}
+        self.phases.append(record)
+        self.open.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = round(time.perf_counter() - start, 4)
+            record["peak_rss_mb"] = peak_rss_mb()
+            self.open.pop()
+
+    def count(self, pages, cards):
+        for record in self.open:
+            record["pages"] += pages
+            record["cards"] += cards
+
+    # called with the phase record for writing an output file, once the file is saved
+    def output(self, filename, record):
+        self.files.append({"file": filename, "pages": record["pages"], "cards": record["cards"], "bytes": os.path.getsize(filename)})
+
+    def show(self):
+        print(f"\n{'Phase':<32} {'Seconds':>9} {'Peak RSS MB':>12} {'Pages':>7} {'Cards':>7}")
+        for r in self.phases:
+            rss = "-" if r["peak_rss_mb"] is None else f"{r['peak_rss_mb']:.1f}"
+            print(f"{'  '*r['depth'] + r['phase']:<32} {r['seconds']:>9.3f} {rss:>12} {r['pages']:>7} {r['cards']:>7}")
+        print(f"\n{'Output file':<44} {'Pages':>7} {'Cards':>7} {'Bytes':>12}")
+        for f in self.files:
+            print(f"{f['file']:<44} {f['pages']:>7} {f['cards']:>7} {f['bytes']:>12}")
+
+    def save(self, filename):
+        with open(filename, "w") as fout:
+            json.dump({"phases": self.phases, "files": self.files}, fout, indent=2)
+
+profiler = None
+no_profiling = contextlib.nullcontext()
+
+def profile_phase(name):
+    return no_profiling if profiler is None else profiler.phase(name)
+
+# Peak resident set size in MB, of this process or its biggest child process, whichever is bigger.
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    scale = 1024*1024 if os.uname().sysname == "Darwin" else 1024 # macOS reports bytes, Linux kilobytes
+    return round(peak / scale, 1)
+
+# Renders a list of outputs (see scorecards_output() and friends). Each output is a list of shards, each of which is
+# a list of planned pages. In the plain case, the pages are drawn straight onto the output canvas. With a pool, the
+# shards are drawn on the workers, up to `ahead` shards ahead of the one being put into the PDF (so finished pages
+# don't pile up in memory), and with a cache, pages that are in the cache are taken from there and only the rest get
+# drawn (each distinct page just once). Either way the recorded pages are spliced back in order, so the pages come
+# out exactly the same as a plain run.
+def render_outputs(config, assignments, outputs, pool=None, cache=None, ahead=16):
+    if config.get("name_font") is not None:
+        # A TrueType font's subset lives in the PDF it's drawn in, so pages that use one can't be drawn anywhere else
+        # (in a worker process, or into the page cache) and spliced in later.
+        pool, cache = None, None
+    context = render_context(config) if cache is not None else None
+    queued = []
+    for out in outputs:
+        shards = []
+        for shard in out["shards"]:
+            if cache is None:
+                keys, todo = None, shard
+            else:
+                keys = [page_key(context, page) for page in shard]
+                todo = {} # key -> page, for the pages that need drawing
+                for page, key in zip(shard, keys):
+                    if key not in todo and key not in cache:
+                        todo[key] = page
+            shards.append([shard, keys, todo, None])
+        queued.append(shards)
+    pending = [entry for shards in queued for entry in shards if len(entry[2]) > 0] if pool is not None else []
+    submitted = consumed = 0
+
+    for out, shards in zip(outputs, queued):
+        if "rows" in out:
+            write_rows(out)
+            continue
+        with profile_phase(f"render {out['name']}") as record:
+            path = out["filename"]
+            if isinstance(path, str):
+                path += ".tmp" # written next to the real file and then renamed over it, so nobody sees half a PDF
+            profile = output_profile(config)
+            c = new_canvas(path, pagesize=out.get("paper", letter), profile=profile)
+            if out["setup"] is not None:
+                out["setup"](c, config)
+            labels = out.get("labels") if profiler is not None else None
+            for i, entry in enumerate(shards):
+                while submitted < len(pending) and submitted < consumed + ahead:
+                    todo = pending[submitted][2]
+                    pending[submitted][3] = pool.submit(record_pages, list(todo.values()) if cache is not None else todo)
+                    submitted += 1
+                shard, keys, todo, future = entry
+                with profile_phase(labels[i]) if labels else no_profiling:
+                    render_shard(c, shard, keys, todo, future, cache)
+                    if profiler is not None:
+                        profiler.count(len(shard), sum(len(page[0]) for page in shard))
+                if future is not None:
+                    consumed += 1
+                    entry[3] = None # done with the recorded pages
+            save_canvas(c, profile)
+            if isinstance(out["filename"], str):
+                os.replace(path, out["filename"])
+                if out.get("index", True):
+                    write_index(config, out)
+            if profiler is not None and isinstance(out["filename"], str):
+                profiler.output(out["filename"], record)
+        if isinstance(out["filename"], str): # and not an in-memory buffer, from output_pdf()
+            print(f"Saving {out['name']} to: {out['filename']}")
+
+# Writes an output that's a CSV file rather than a PDF, the same way: to a temporary file that's renamed into place.
+def write_rows(out):
+    with profile_phase(f"write {out['name']}") as record:
+        with open(out["filename"] + ".tmp", "w", encoding="utf-8", newline="") as fout:
+            csv.writer(fout).writerows(out["rows"])
+        os.replace(out["filename"] + ".tmp", out["filename"])
+        if profiler is not None:
+            profiler.output(out["filename"], record)
+    print(f"Saving {out['name']} to: {out['filename']}")
+
+# Puts one shard's pages onto the output canvas, drawing them, replaying them from a worker, or taking them from the
+# cache, as render_outputs() set up.
+def render_shard(c, shard, keys, todo, future, cache):
+    if future is None and cache is None:
+        for page in shard:
+            draw_page(c, page)
+        return
+    records = []
+    if future is not None:
+        records, used = future.result()
+        templates.update(used)
+    elif len(todo) > 0:
+        records, used = record_pages(list(todo.values()))
+    if cache is None:
+        replay_pages(c, records)
+        return
+    fresh = dict(zip(todo.keys(), records))
+    for page, key in zip(shard, keys):
+        if key in fresh:
+            record = fresh.pop(key)
+            cache.put(key, record)
+            cache.rendered += len(page[0])
+        else:
+            record = cache.get(key)
+            cache.reused += len(page[0])
+        replay_pages(c, [record])
+
+# Splits an output into volumes, each of which is a separate PDF file. That bounds how many pages reportlab holds in
+# memory at once, since it keeps every page of a canvas until save(). With split="event", outputs that have a shard
+# per event get one volume per event (outputs that don't are left alone); with a number, each volume gets that many
+# pages (or, for duplex outputs, the first sheet boundary after that many). Volumes are named by putting the event or
+# part number on the end of the output's file name. split="auto" only splits outputs of more than auto_split_pages
+# pages, into volumes of that many pages, and leaves smaller ones as a single file, so a big competition's memory use
+# stays bounded and everybody else's PDFs come out as they always have.
+auto_split_pages = 1000
+
+def split_output(out, split):
+    if "rows" in out:
+        return [out]
+    if split == "auto":
+        if sum(len(shard) for shard in out["shards"]) <= auto_split_pages:
+            return [out]
+        split = auto_split_pages
+    base = out["filename"][:-len(".pdf")]
+    if split == "event":
+        if out.get("labels") is None:
+            return [out]
+        return [dict(out, name=f"{out['name']} ({label})", filename=get_filename(base, label), shards=[shard], labels=[label])
+                for label, shard in zip(out["labels"], out["shards"])]
+    volumes = []
+    shards = []
+    pages = 0
+    for shard in out["shards"]:
+        while len(shard) > 0:
+            take = len(shard) if out.get("duplex") else min(len(shard), split - pages)
+            shards.append(shard[:take])
+            shard = shard[take:]
+            pages += take
+            if pages >= split:
+                volumes.append(shards)
+                shards, pages = [], 0
+    if len(shards) > 0 or len(volumes) == 0:
+        volumes.append(shards)
+    return [dict(out, name=f"{out['name']} (part {i+1})", filename=get_filename(base, f"part {i+1}"), shards=v, labels=None)
+            for i, v in enumerate(volumes)]
+
+# Glues volumes back together into one PDF file, then deletes them. pypdf is optional: without it, the volumes are
+# left as they are. The volumes are copied into the merged file one at a time, object by object, with their objects
+# renumbered, so only one volume is ever read into memory. Each volume carries its own copy of things like the fonts
+# and the badge template image, so an object that comes out exactly the same as one that's already been written (once
+# the objects it refers to have been renumbered) isn't written again. The merged file has a catalog, a page tree with
+# every volume's pages in order and the first volume's document info, in objects 1 to 3.
+def merge_volumes(filenames, target):
+    try:
+        import pypdf
+        from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject
+    except ImportError:
+        print(f"Can't merge into {target} without the pypdf module (pip install pypdf); leaving the volumes as they are.")
+        return False
+    offsets = [None, None, None, None] # where each object starts in the file, by number; 0 isn't an object
+    written = {} # an object's bytes, hashed -> its number, to write each distinct object once
+    kids = ArrayObject()
+    info = None
+    with open(target + ".tmp", "wb") as fout:
+        def write_object(number, obj):
+            offsets[number] = fout.tell()
+            fout.write(f"{number} 0 obj\n".encode("latin-1"))
+            obj.write_to_stream(fout)
+            fout.write(b"\nendobj\n")
+        for filename in filenames:
+            reader = pypdf.PdfReader(filename)
+            if fout.tell() == 0:
+                fout.write(reader.pdf_header.encode("latin-1") + b"\n%\x93\x8c\x8b\x9e\n")
+            numbers = {} # the volume's object numbers -> the merged file's
+            busy = set() # objects being copied, which only a reference loop would come back to
+
+            # Copies the objects obj refers to (and the ones they refer to, and so on) and points obj at the copies.
+            def relink(obj):
+                if isinstance(obj, IndirectObject):
+                    return IndirectObject(copy(obj.idnum), 0, None)
+                if isinstance(obj, DictionaryObject):
+                    for key, value in list(dict.items(obj)):
+                        obj[key] = relink(value)
+                elif isinstance(obj, ArrayObject):
+                    for i, value in enumerate(list(obj)):
+                        obj[i] = relink(value)
+                return obj
+
+            def copy(idnum):
+                if idnum in numbers:
+                    return numbers[idnum]
+                if idnum in busy: # a loop: this one gets its number now, and can't be shared
+                    numbers[idnum] = len(offsets)
+                    offsets.append(None)
+                    return numbers[idnum]
+                busy.add(idnum)
+                obj = relink(reader.get_object(idnum))
+                busy.discard(idnum)
+                buf = io.BytesIO()
+                obj.write_to_stream(buf)
+                key = hashlib.md5(buf.getvalue()).digest()
+                if idnum not in numbers and key in written:
+                    numbers[idnum] = written[key]
+                    return written[key]
+                if idnum not in numbers:
+                    numbers[idnum] = len(offsets)
+                    offsets.append(None)
+                    written[key] = numbers[idnum]
+                write_object(numbers[idnum], obj)
+                return numbers[idnum]
+
+            for page in reader.pages:
+                page = page.get_object()
+                page.pop(NameObject("/Parent"), None)
+                page = relink(page)
+                page[NameObject("/Parent")] = IndirectObject(2, 0, None)
+                offsets.append(None)
+                write_object(len(offsets) - 1, page)
+                kids.append(IndirectObject(len(offsets) - 1, 0, None))
+            if info is None and "/Info" in reader.trailer:
+                info = relink(DictionaryObject(dict.items(reader.trailer["/Info"].get_object())))
+            del reader # done with this volume
+        write_object(1, DictionaryObject({NameObject("/Type"): NameObject("/Catalog"), NameObject("/Pages"): IndirectObject(2, 0, None)}))
+        write_object(2, DictionaryObject({NameObject("/Type"): NameObject("/Pages"), NameObject("/Kids"): kids, NameObject("/Count"): NumberObject(len(kids))}))
+        write_object(3, info if info is not None else DictionaryObject())
+        xref = fout.tell()
+        fout.write(f"xref\n0 {len(offsets)}\n0000000000 65535 f \n".encode("latin-1"))
+        fout.write("".join(f"{offset:010d} 00000 n \n" for offset in offsets[1:]).encode("latin-1"))
+        fout.write(f"trailer\n<< /Size {len(offsets)} /Root 1 0 R /Info 3 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1"))
+    os.replace(target + ".tmp", target)
+    for filename in filenames:
+        os.remove(filename)
+    print(f"Merged {len(filenames)} volume{'s' if len(filenames) != 1 else ''} into: {target}")
+    return True
+
+# render_outputs(), with each output split into volumes first (if split isn't None) and optionally merged back into
+# one file afterwards. Returns the names of the files it made.
+def render_volumes(config, assignments, outputs, pool=None, cache=None, split=None, merge=False):
+    if split is None:
+        render_outputs(config, assignments, outputs, pool, cache)
+        return [out["filename"] for out in outputs]
+    volumes = [split_output(out, split) for out in outputs]
+    render_outputs(config, assignments, [v for vs in volumes for v in vs], pool, cache)
+    made = []
+    for out, vs in zip(outputs, volumes):
+        if merge and vs[0]["filename"] != out["filename"] and merge_volumes([v["filename"] for v in vs], out["filename"]):
+            made.append(out["filename"])
+            for v in vs:
+                if os.path.exists(index_filename(v["filename"])):
+                    os.remove(index_filename(v["filename"]))
+            write_index(config, out) # the merged PDF's pages are the volumes' pages, in order
+        else:
+            made += [v["filename"] for v in vs]
+    return made
+
+# Page indexes. Every PDF with people's scorecards or badges in it gets a sidecar index next to it (the PDF's name with
+# _index.jsonl instead of .pdf), saying which page each card is on and which place on the page it's in, along with
+# what it takes to draw the card again. --reprint looks people up in the indexes, so when a scorecard gets coffee on it
+# or a badge goes missing, just those cards can be printed again without planning the whole competition, let alone
+# redrawing it.
+
+# The cards that go in the index, and how to tell from a card's args whose card it is: (kind, name, event, round,
+# side). Badges have no event or round, and a badge back goes on the back of the sheet.
+indexed_cards = {draw_one_scorecard: lambda args: ("scorecard", args[1], args[4], args[5], "front"),
+                 drawBadgeFront: lambda args: ("badge", args[0], None, None, "front"),
+                 drawBadgeBack: lambda args: ("badge", args[2], None, None, "back")}
+index_setups = {setup.__name__: setup for setup in [setup_badge_canvas]}
+
+# An index is a line of JSON about the output as a whole, then a line for each card: a JSON list of these. Pages and
+# slots count from 1, like a person would. Every card line starts with the person's name, so looking somebody up only
+# has to decode their own lines, however big the competition is.
+index_columns = ("name", "event", "round", "page", "slot", "side", "card", "args")
+
+def index_filename(filename):
+    return filename[:-len(".pdf")] + "_index.jsonl"
+
+# Writes the index for an output, or deletes a stale one if nothing in the output is indexed any more. The header's
+# "slots" has the places on the page for each side, from its fullest page, so a reprint can put the cards in the same
+# places they were in (the back of a badge has to stay behind its front).
+def write_index(config, out):
+    target = index_filename(out["filename"])
+    lines = []
+    kinds = set()
+    slots = {}
+    scale = 1
+    page_number = 0
+    for shard in out["shards"]:
+        for page in shard:
+            page_number += 1
+            scale = page[1][0]
+            for slot, (x, y, func, args) in enumerate(page[0]):
+                if func not in indexed_cards:
+                    continue
+                kind, name, event, round, side = indexed_cards[func](args)
+                if name == "": # a blank scorecard
+                    continue
+                kinds.add(kind)
+                if len(page[0]) > len(slots.get(side, [])):
+                    slots[side] = [[x, y] for x, y, _, _ in page[0]]
+                lines.append(json.dumps([name, event, round, page_number, slot+1, side, func.__name__, args], ensure_ascii=False))
+    if len(lines) == 0:
+        if os.path.exists(target):
+            os.remove(target)
+        return
+    setup = out["setup"].__name__ if out["setup"] is not None else None
+    header = {"competition": config.get("competition"), "output": out["name"], "pdf": out["filename"], "kinds": sorted(kinds),
+              "paper": list(out.get("paper", letter)), "setup": setup, "scale": scale, "slots": slots}
+    with open(target + ".tmp", "w", encoding="utf-8") as fout:
+        fout.write(json.dumps(header, ensure_ascii=False) + "\n")
+        fout.write("\n".join(lines) + "\n")
+    os.replace(target + ".tmp", target)
+
+# Finds the indexes of a competition's PDFs, in the current directory, for the kinds of output in make_list. Returns a
+# list of (index file, header).
+def load_indexes(config, make_list):
+    prefix = get_filename(config["competition"], "")[:-len(".pdf")]
+    indexes = []
+    for filename in sorted(os.listdir(".")):
+        if not filename.startswith(prefix) or not filename.endswith("_index.jsonl"):
+            continue
+        with open(filename, "r", encoding="utf-8") as fin:
+            header = json.loads(fin.readline())
+        if header.get("competition") != config["competition"]:
+            continue
+        if "all" in make_list or any(kind in make_list for kind in header["kinds"]):
+            indexes.append((filename, header))
+    return indexes
+
+# The index entries (as dicts of index_columns) for these people's cards. With an event (or round), only scorecards
+# for it are picked, and no badges. Names are matched without regard to case.
+def select_cards(filename, names, event=None, round=None):
+    starts = tuple(json.dumps([name], ensure_ascii=False)[:-1].lower() + "," for name in names)
+    entries = []
+    with open(filename, "r", encoding="utf-8") as fin:
+        fin.readline() # the header
+        for line in fin:
+            if line.lower().startswith(starts):
+                entry = dict(zip(index_columns, json.loads(line)))
+                if (event is None or entry["event"] == event) and (round is None or str(entry["round"]) == str(round)):
+                    entries.append(entry)
+    return entries
+
+# Puts the selected cards onto fresh sheets, in the places they had on the original pages: each person's card (or,
+# for badges, front and back) takes the next place, so a handful of reprints share a sheet.
+def reprint_pages(header, entries):
+    funcs = {func.__name__: func for func in indexed_cards}
+    units = {} # (name, event, round) -> the entries for that card
+    for entry in entries:
+        units.setdefault((entry["name"], entry["event"], entry["round"]), []).append(entry)
+    sides = [side for side in ["front", "back"] if side in header["slots"]]
+    per_sheet = min(len(header["slots"][side]) for side in sides)
+    pages = []
+    for i, unit in enumerate(units.values()):
+        if i % per_sheet == 0:
+            pages += [([], (header["scale"], ())) for side in sides]
+        for entry in unit:
+            x, y = header["slots"][entry["side"]][i % per_sheet]
+            pages[len(pages) - len(sides) + sides.index(entry["side"])][0].append((x, y, funcs[entry["card"]], tuple(entry["args"])))
+    return pages
+
+# Copies the pages with the selected cards out of the original PDF, whole. Needs pypdf; returns False without it.
+def extract_pages(header, entries, target):
+    try:
+        import pypdf
+    except ImportError:
+        print(f"Can't copy pages out of {header['pdf']} without the pypdf module (pip install pypdf); drawing the cards again instead.")
+        return False
+    reader = pypdf.PdfReader(header["pdf"])
+    writer = pypdf.PdfWriter()
+    for page in sorted({entry["page"] for entry in entries}):
+        writer.add_page(reader.pages[page-1])
+    with open(target + ".tmp", "wb") as fout:
+        writer.write(fout)
+    os.replace(target + ".tmp", target)
+    return True
+
+# --reprint: makes a "<output> reprint" PDF for each indexed output that has any of these people's cards in it.
+# Normally the cards are drawn again, onto as few sheets as they fit on; with from_pdf, the pages they're on are copied
+# out of the original PDF instead, which is exactly what was printed (but with everybody else's cards still on them).
+def reprint(config, names, event=None, round=None, make_list="all", from_pdf=False):
+    indexes = load_indexes(config, make_list)
+    if len(indexes) == 0:
+        print(f"Error: there are no page indexes for {config['competition']} here. Make the scorecards or badges first.")
+        exit()
+    found = set()
+    for filename, header in indexes:
+        entries = select_cards(filename, names, event, round)
+        if len(entries) == 0:
+            continue
+        found.update(entry["name"].lower() for entry in entries)
+        target = get_filename(config["competition"], f"{header['output']} reprint")
+        if from_pdf and extract_pages(header, entries, target):
+            print(f"Saving pages {', '.join(str(p) for p in sorted({e['page'] for e in entries}))} of {header['pdf']} to: {target}")
+            continue
+        out = {"name": f"{header['output']} reprint", "filename": target, "setup": index_setups.get(header["setup"]),
+               "shards": [reprint_pages(header, entries)], "paper": tuple(header["paper"]), "index": False}
+        render_outputs(config, None, [out])
+    for name in names:
+        if name.lower() not in found:
+            print(f"Couldn't find any cards for {name}.")
+
+# Reads the results of a finished round, exported from WCA Live or a spreadsheet, and returns a list of
+# [rank, name, wcaid] for everybody who got a result, best first. A CSV file needs a "Name" column and a rank column
+# ("Rank", "Ranking", "Place" or "#"); a "WCA ID" column is optional. A JSON file is a list of objects with "name" and
+# "rank" keys (and optionally "wcaid"), or an object with that list in its "results" key. People with no rank (e.g. no
+# successful attempts) are left out. A file that isn't laid out like that is reported, and CompGenerator stops.
+def load_results(filename):
+    rows = []
+    if filename.lower().endswith(".json"):
+        with open(filename, "r", encoding="utf-8-sig") as fin:
+            try:
+                data = json.load(fin)
+            except ValueError:
+                print(f"Error loading results file {filename}. Make sure it's a valid JSON file.")
+                exit(1)
+        if isinstance(data, dict):
+            data = data.get("results")
+        if not isinstance(data, list) or not all(isinstance(r, dict) and "name" in r for r in data):
+            print(f"Error: results file {filename} should be a list of results with \"name\" and \"rank\" keys.")
+            exit(1)
+        for r in data:
+            r = {k.lower(): v for k, v in r.items()}
+            rows.append([r.get("rank", r.get("ranking")), r["name"], r.get("wcaid", r.get("wca id", ""))])
+    else:
+        with open(filename, "r", encoding="utf-8-sig", newline="") as fin:
+            reader = csv.reader(fin)
+            header = [col.strip().lower() for col in next(reader, [])]
+            rank_cols = [i for i, col in enumerate(header) if col in ("rank", "ranking", "place", "#")]
+            if "name" not in header or len(rank_cols) == 0:
+                print(f"Error: results file {filename} needs a \"Name\" column and a rank column (\"Rank\", \"Ranking\", "
+                      "\"Place\" or \"#\").")
+                exit(1)
+            rank_col = rank_cols[0]
+            name_col = header.index("name")
+            id_col = header.index("wca id") if "wca id" in header else None
+            for row in reader:
+                if len(row) > max(rank_col, name_col) and row[name_col].strip() != "":
+                    rows.append([row[rank_col], row[name_col], row[id_col] if id_col is not None and id_col < len(row) else ""])
+    results = []
+    for rank, name, wcaid in rows:
+        rank = str(rank if rank is not None else "").strip()
+        if rank.isdigit():
+            results.append([int(rank), str(name).strip(), str(wcaid or "").strip()])
+    return sorted(results, key=lambda r: r[0])
+
+# Applies an advancement rule to load_results() output and returns the results rows of the people who go through.
+# rule is a number of people ("16") or a percentage of the people with a result ("75%"). Anybody tied with the last
+# person in goes through too. A rule that's neither is reported, and CompGenerator stops.
+def advancing(results, rule):
+    rule = rule.strip()
+    if rule.endswith("%") and rule[:-1].replace(".", "", 1).isdigit():
+        n = math.floor(len(results) * float(rule[:-1]) / 100)
+    elif rule.isdigit():
+        n = int(rule)
+    else:
+        print(f"Error: --advance should be a number of people, like '16', or a percentage, like '75%', not '{rule}'.")
+        exit(1)
+    if n <= 0 or len(results) == 0:
+        return []
+    last = results[min(n, len(results)) - 1][0]
+    return [r for r in results if r[0] <= last]
+
+# Makes an AssignmentTable for the next round of an event, with the advancing people (best first) split into
+# num_groups competing groups, and staged the same way round 1 is. The best people go in the last group, which is the
+# usual way to run later rounds. People who aren't in the assignments file (say, a late registration) are added with
+# the WCA ID from the results.
+def next_round_table(config, assignments, event, advancing, num_groups=None):
+    stations = sum(s[1] for s in config.get("stages", {}).values())
+    if num_groups is None:
+        num_groups = max(1, math.ceil(len(advancing) / stations)) if stations > 0 else 1
+    table = AssignmentTable(config)
+    per_group = math.ceil(len(advancing) / num_groups) if len(advancing) > 0 else 1
+    for i, (rank, who, wcaid) in enumerate(reversed(advancing)): # worst first, so group 1 gets the slowest
+        old = assignments.people.get(who)
+        person = Person(who, old.wcaid if old is not None else wcaid, old.number if old is not None else "")
+        person.roles[event] = [Role("C", str(min(i // per_group, num_groups-1) + 1))]
+        table.add(person)
+    if len(config.get("stages", {})) > 0:
+        assign_stages(dict(config, events={event: config["events"][event]}), table)
+    return table
+
+# Describes the output for --generate next-round: named scorecards for just the people going through to the next
+# round of one event.
+def next_round_output(config, assignments, results_file, event, round, rule, num_groups=None):
+    table = next_round_table(config, assignments, event, advancing(load_results(results_file), rule), num_groups)
+    print(f"{len(table.people)} people go through to {eventNames.get(event, (event,))[0]} round {round}.")
+    filename = get_filename(config["competition"], f"{event} round {round} scorecards")
+    return {"name": f"{event} round {round} scorecards", "filename": filename, "setup": None,
+            "shards": [event_scorecard_pages(config, table, event, round)], "labels": [event]}
+
+# Planning the outputs. plan_outputs() goes through the assignments once, handing each person, in file order, to a
+# "sink" for each output it's been asked for, and then has each sink turn what it collected into its output. A sink
+# has add(person), and output(), which returns the output's description (see render_outputs()).
+
+# The round 1 scorecards: one shard per event, plus one for the star competitors' later-round cards.
+class ScorecardSink:
+    def __init__(self, config, assignments):
+        self.config = config
+        self.assignments = assignments
+        self.cards = {event: [] for event in config["events"].keys()} # event ids, like "333"
+
+    def add(self, person):
+        for event in person.roles:
+            if event in self.cards and person.competing(event) is not None:
+                self.cards[event].append((person.name, scorecard_card(self.config, self.assignments, person, event)))
+
+    def output(self):
+        config = self.config
+        runs = []
+        for event, cards in self.cards.items():
+            cards.sort(key=lambda card: card[0])
+            runs.append([card for who, card in cards])
+        if "stars" in config and len(config["stars"]) > 0:
+            runs.append(star_scorecard_cards(config, self.assignments))
+        labels = list(config["events"].keys()) + ["stars"]
+        out = {"name": "scorecards", "filename": get_filename(config["competition"],"scorecards"), "setup": None, "labels": labels}
+        return impose_runs(config, out, runs, scorecard_layout(config))
+
+# The blank scorecards, one shard per event that we want blanks for. Nothing in them comes from the assignments.
+class BlankSink:
+    def __init__(self, config, assignments):
+        self.config = config
+
+    def add(self, person):
+        pass
+
+    def output(self):
+        config = self.config
+        labels = sorted(config["scorecard_blanks"].keys())
+        out = {"name": "blank scorecards", "filename": get_filename(config["competition"],"scorecard blanks"), "setup": None, "labels": labels}
+        # each round's partial last page has never had cut guides
+        return impose_runs(config, out, [blank_scorecard_cards(config, event) for event in labels], scorecard_layout(config), partial_guides=False)
+
+# The badges, one shard per sheet of 9. It's "duplex" because each shard is a front page and a back page that have to
+# be printed on the same sheet, so it can't be split in the middle of a shard.
+class BadgeSink:
+    def __init__(self, config, assignments):
+        self.config = config
+        self.assignments = assignments
+        self.names = []
+
+    def add(self, person):
+        self.names.append(person.name)
+
+    def output(self):
+        config = self.config
+        # Iterate over all the assignments in groups of 9
+        per_sheet = len(badge_layout(config)["origins"])
+        shards = [badge_sheet_pages(config, self.assignments, self.names[i:i+per_sheet]) for i in range(0,len(self.names),per_sheet)]
+        return {"name": "badges", "filename": get_filename(config["competition"], "badges"), "setup": setup_badge_canvas, "shards": shards, "duplex": True,
+                "paper": layout_settings(config)["paper"]}
+
+# The group lists: a page (or more) for each group of each event, listing everybody with a role in it, competitors
+# (with their stage) first, then judges, scramblers and runners. One shard per event.
+class GroupListSink:
+    def __init__(self, config, assignments):
+        self.config = config
+        self.assignments = assignments
+        self.groups = {event: {} for event in config["events"].keys()}
+
+    def add(self, person):
+        for event, roles in person.roles.items():
+            if event in self.groups:
+                for r in roles:
+                    role = role_names.get(r.role, r.role)
+                    if r.stage:
+                        role += f" ({self.assignments.stage_name(r.stage)})"
+                    row = ("CJSR".find(r.role), person.name, (person.name, person.wcaid, role))
+                    self.groups[event].setdefault(r.group, []).append(row)
+
+    def output(self):
+        comp = self.config["competition"]
+        paper = layout_settings(self.config)["paper"]
+        layout = impose(paper, paper)
+        shards = []
+        for event, groups in self.groups.items():
+            cards = []
+            for group in sorted(groups, key=group_order):
+                rows = [row for _, _, row in sorted(groups[group], key=lambda row: row[0:2])]
+                cards += list_cards(comp, paper, f"{eventNames[event][0]} | Group {group}", group_list_columns, rows)
+            shards.append(paginate(cards, layout))
+        labels = list(self.groups.keys())
+        return {"name": "group lists", "filename": get_filename(comp, "group lists"), "setup": None, "shards": shards, "labels": labels, "paper": paper}
+
+# The stage lists: a quarter-page card for each stage's share of each group of each event, listing who competes
+# there. One shard per stage. Without staging, everybody is on one stage, "All stages".
+class StageListSink:
+    def __init__(self, config, assignments):
+        self.config = config
+        self.assignments = assignments
+        self.stages = {s[0]: {} for s in config.get("stages", {}).values()} # stage tag -> (event, group) -> rows
+
+    def add(self, person):
+        for event in person.roles:
+            role = person.competing(event)
+            if role is not None and event in self.config["events"]:
+                row = (person.number, person.name, person.wcaid)
+                self.stages.setdefault(role.stage, {}).setdefault((event, role.group), []).append(row)
+
+    def output(self):
+        config = self.config
+        comp = config["competition"]
+        events = list(config["events"].keys())
+        runs = []
+        labels = []
+        for tag, groups in self.stages.items():
+            stage = self.assignments.stage_name(tag) if tag else "All stages"
+            cards = []
+            for event, group in sorted(groups, key=lambda k: (events.index(k[0]), group_order(k[1]))):
+                rows = sorted(groups[(event, group)], key=lambda row: row[1])
+                cards += list_cards(comp, (w2, h2), f"{stage} | {eventNames[event][1]} | Group {group}", stage_list_columns, rows)
+            runs.append(cards)
+            labels.append(stage)
+        out = {"name": "stage lists", "filename": get_filename(comp, "stage lists"), "setup": None, "labels": labels}
+        return impose_runs(config, out, runs, scorecard_layout(config))
+
+# The assignments after staging, as a CSV file: the same columns as the assignments file, each event followed by a
+# column with the stage the person competes on. This isn't a PDF, so instead of shards it has rows, which
+# render_outputs() writes out as they are.
+class StageCsvSink:
+    def __init__(self, config, assignments):
+        self.config = config
+        self.assignments = assignments
+        events = list(config["events"].keys())
+        self.rows = [["Name", "WCA ID", "Number"] + [column for e in events for column in (e, f"{e} stage")]]
+
+    def add(self, person):
+        row = [person.name, person.wcaid, person.number]
+        for event in self.config["events"].keys():
+            roles = person.roles.get(event, [])
+            role = person.competing(event)
+            row.append(";".join(r.role + r.group for r in roles))
+            row.append(self.assignments.stage_name(role.stage) if role is not None and role.stage else "")
+        self.rows.append(row)
+
+    def output(self):
+        filename = get_filename(self.config["competition"], "stage assignments")[:-len(".pdf")] + ".csv"
+        return {"name": "stage assignments", "filename": filename, "setup": None, "shards": [], "rows": self.rows}
+
+# Fills in an output's shards and paper from runs of cards, one run per label (a run can also be a list of runs,
+# like the rounds of an event's blanks, each of which starts on a fresh page). Normally each run is a shard and starts
+# on a fresh page. With the "pack" layout setting, the cards all go one after another, in cut-and-stack order, and
+# each stack of sheets is a shard, so no sheet is left part empty except the last. partial_guides is paginate()'s.
+def impose_runs(config, out, runs, layout, partial_guides=True):
+    settings = layout_settings(config)
+    guides = config.get("cut_guides") is True
+    if settings["pack"]:
+        cards = [card for run in runs for part in (run if run and isinstance(run[0], list) else [run]) for card in part]
+        return dict(out, shards=stack_pages(cards, layout, guides, settings["stack"]), labels=None, paper=layout["paper"])
+    shards = []
+    for run in runs:
+        parts = run if run and isinstance(run[0], list) else [run]
+        shards.append([page for part in parts for page in paginate(part, layout, guides, partial_guides)])
+    return dict(out, shards=shards, paper=layout["paper"])
+
+# What --generate can ask for, in the order the outputs get made, and the sink that makes each one.
+output_sinks = {"scorecard": ScorecardSink, "blank": BlankSink, "badge": BadgeSink,
+                "groups": GroupListSink, "stages": StageListSink, "csv": StageCsvSink}
+output_kinds = list(output_sinks.keys())
+
+# What "all" (the default) makes: the outputs CompGenerator has always made. The lists and the CSV are only made
+# when they're asked for by name.
+all_kinds = ["scorecard", "blank", "badge"]
+
+def wanted_outputs(make_list):
+    return [kind for kind in output_kinds if ("all" in make_list and kind in all_kinds) or kind in make_list]
+
+# Plans the outputs of the given kinds, in one pass over the assignments. assignments can be None if the only kind is
+# "blank".
+def plan_outputs(config, assignments, kinds):
+    sinks = [output_sinks[kind](config, assignments) for kind in kinds]
+    if assignments is not None:
+        for person in assignments.people.values():
+            for sink in sinks:
+                sink.add(person)
+    return [sink.output() for sink in sinks]
+
+def plan_output(config, assignments, kind):
+    return plan_outputs(config, assignments, [kind])[0]
+
+# Per-person packets. --per-person makes a small PDF for each person, for emailing to them: the back of their badge
+# (their schedule) on the first page, and then their named scorecards, round 1 and (for a star competitor) the later
+# rounds, laid out the same as the scorecards PDF. The packets go in a directory, or in one zip file.
+
+def packet_pages(config, assignments, person):
+    settings = layout_settings(config)
+    pages = paginate([(drawBadgeBack, badge_back_args(config, person))], impose(settings["paper"], settings["badge_size"], badge_size, 1))
+    cards = [scorecard_card(config, assignments, person, event) for event in config["events"] if person.competing(event) is not None]
+    if person.name in config.get("stars", {}):
+        cards += star_scorecard_cards(config, assignments, [person.name])
+    return pages + paginate(cards, scorecard_layout(config), config.get("cut_guides") is True)
+
+def packet_pdf(config, assignments, person):
+    buf = io.BytesIO()
+    profile = output_profile(config)
+    c = new_canvas(buf, pagesize=layout_settings(config)["paper"], profile=profile)
+    for page in packet_pages(config, assignments, person):
+        draw_page(c, page)
+    save_canvas(c, profile)
+    return buf.getvalue()
+
+# Makes the packets for a list of people, in a worker process (or this one), and returns [(name, PDF bytes)]. Each
+# process keeps its fonts, templates and text widths from one packet to the next, so only the first packet it makes
+# pays for setting them up.
+def packet_job(names):
+    return [(who, packet_pdf(config, assignments, assignments.people[who])) for who in names]
+
+# A packet's file name: the person's name, with anything that can't go in a file name replaced by _, and their
+# competitor number added if two people's names come out the same.
+def packet_filename(person, taken):
+    name = "".join(ch if ch.isalnum() or ch in "-." else "_" for ch in person.name)
+    if name.lower() in taken:
+        name += f"_{person.number}"
+    taken.add(name.lower())
+    return name + ".pdf"
+
+# Makes everybody's packets, in chunks of people spread over the pool's worker processes (if there's a pool), and
+# writes them into the directory target, or the zip file target if it ends in .zip. The PDFs are already compressed,
+# so they go into the zip file as they are.
+def write_packets(config, assignments, target, pool=None, chunk=25):
+    names = list(assignments.people.keys())
+    chunks = [names[i:i+chunk] for i in range(0, len(names), chunk)]
+    packets = pool.map(packet_job, chunks) if pool is not None else map(packet_job, chunks)
+    taken = set()
+    with profile_phase("write packets"):
+        if target.lower().endswith(".zip"):
+            with zipfile.ZipFile(target + ".tmp", "w", zipfile.ZIP_STORED) as zout:
+                for done in packets:
+                    for who, pdf in done:
+                        zout.writestr(packet_filename(assignments.people[who], taken), pdf)
+            os.replace(target + ".tmp", target)
+        else:
+            os.makedirs(target, exist_ok=True)
+            for done in packets:
+                for who, pdf in done:
+                    with open(os.path.join(target, packet_filename(assignments.people[who], taken)), "wb") as fout:
+                        fout.write(pdf)
+    print(f"Saving {len(names)} packets to: {target}")
+
+# Dry runs. --plan checks the config file against config_schema and against the assignments, does the staging, and
+# plans every output the way a real run would, but doesn't draw anything (or even load reportlab's drawing code). It
+# prints what each output will take: cards, pages and sheets of paper, and roughly how long it will take to draw,
+# going by how fast the outputs were drawn in earlier --profile runs (see save_timings()).
+
+# A schema is one of:
+#   a type (str, int, float or bool)  the value has to be one of those (a float can be given as a whole number)
+#   None                              the value has to be null
+#   a tuple of schemas                the value has to match one of them
+#   a list of schemas                 a list with an item matching each schema in turn; if the last schema is ...,
+#                                     any number of other items can follow
+#   {"key": schema, "key?": schema}   a dict with these keys, and no others, where the ones ending in ? are optional
+#   {str: schema}                     a dict with any keys, whose values all match schema
+#   {list: schema}                    a list of any length, whose items all match schema
+#   a function                        takes the value and returns what's wrong with it, or None if nothing is
+# compile_schema() turns a schema into a function that checks a value against it, once, when CompGenerator starts.
+# The function takes the value and where it is (like 'events["333"]', or "" for the whole config file), and returns a
+# list of problems. Keys a dict schema doesn't have come back as SchemaWarnings among them.
+def compile_schema(schema):
+    if schema is None:
+        return lambda value, where: [] if value is None else [f"{where} should be null"]
+    if schema in (str, int, float, bool):
+        types = (int, float) if schema is float else schema
+        name = {str: "a string", int: "a whole number", float: "a number", bool: "true or false"}[schema]
+        def check(value, where):
+            if isinstance(value, types) and (schema is bool or not isinstance(value, bool)):
+                return []
+            return [f"{where} should be {name}, not {json.dumps(value)}"]
+        return check
+    if isinstance(schema, tuple):
+        options = [compile_schema(option) for option in schema]
+        def check(value, where):
+            found = [option(value, where) for option in options]
+            return min(found, key=lambda f: (sum(1 for p in f if not isinstance(p, SchemaWarning)), len(f)))
+        return check
+    if isinstance(schema, list):
+        more = len(schema) > 0 and schema[-1] is ...
+        items = [compile_schema(item) for item in (schema[:-1] if more else schema)]
+        def check(value, where):
+            if not isinstance(value, list):
+                return [f"{where} should be a list, not {json.dumps(value)}"]
+            if len(value) < len(items) or (len(value) > len(items) and not more):
+                return [f"{where} should have {len(items)}{' or more' if more else ''} items, not {len(value)}"]
+            return [problem for i, item in enumerate(items) for problem in item(value[i], f"{where}[{i}]")]
+        return check
+    if isinstance(schema, dict) and list in schema:
+        items = compile_schema(schema[list])
+        def check(value, where):
+            if not isinstance(value, list):
+                return [f"{where} should be a list, not {json.dumps(value)}"]
+            return [problem for i, item in enumerate(value) for problem in items(item, f"{where}[{i}]")]
+        return check
+    if isinstance(schema, dict) and str in schema:
+        values = compile_schema(schema[str])
+        def check(value, where):
+            if not isinstance(value, dict):
+                return [f"{where} should be a set of {{\"key\": value}} pairs, not {json.dumps(value)}"]
+            return [problem for key, item in value.items() for problem in values(item, schema_path(where, key))]
+        return check
+    if isinstance(schema, dict):
+        keys = {key.rstrip("?"): (compile_schema(item), not key.endswith("?")) for key, item in schema.items()}
+        def check(value, where):
+            if not isinstance(value, dict):
+                return [f"{where} should be a set of {{\"key\": value}} pairs, not {json.dumps(value)}"]
+            problems = [f"{where or 'The config file'} is missing {json.dumps(key)}" for key, (_, required) in keys.items() if required and key not in value]
+            for key, item in value.items():
+                if key not in keys:
+                    problems.append(SchemaWarning(f"{where or 'The config file'} has {json.dumps(key)}, which isn't a setting CompGenerator knows, so it's ignored. Is it misspelled?"))
+                else:
+                    problems += keys[key][0](item, schema_path(where, key))
+            return problems
+        return check
+    return lambda value, where: [f"{where} {problem}" for problem in [schema(value)] if problem is not None]
+
+# A key in the config file that CompGenerator doesn't know. It could be a misspelling, but it could just as well be a
+# comment or a setting for some other program, and a run ignores it, so it's only a warning, not a problem.
+class SchemaWarning(str):
+    pass
+
+# Where a dict's item is, for problem descriptions: like 'events["333"]', or just 'events' at the top level.
+def schema_path(where, key):
+    return key if where == "" else f"{where}[{json.dumps(key)}]"
+
+def at_least_one(value):
+    if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+        return f"should be a whole number, 1 or more, not {json.dumps(value)}"
+
+def paper_size(value):
+    if isinstance(value, str) and value.lower() in paper_sizes:
+        return None
+    if isinstance(value, list) and len(value) == 2 and all(isinstance(_, (int, float)) and _ > 0 for _ in value):
+        return None
+    return f"should be one of {', '.join(paper_sizes)}, or [width, height] in points, not {json.dumps(value)}"
+
+def profile_name(value):
+    if isinstance(value, str) and value in output_profiles:
+        return None
+    return f"should be one of {', '.join(output_profiles)}, not {json.dumps(value)}"
+
+# [center_x, baseline_y, font_size], and then anything (the sample config keeps a comment there)
+text_conf = [float, float, float, ...]
+
+config_schema = {
+    "competition": str,
+    "assignments?": str,
+    "wcif?": str,
+    "events": {str: ([int, (int, None), str, str], [int, (int, None), str, str, str])},
+    "rounds?": {str: {str: [int, (int, None), str, str]}},
+    "custom_events?": {list: [str, str, str]},
+    "stages?": {str: [str, at_least_one]},
+    "roles?": str,
+    "stars?": {str: {list: str}},
+    "badge_config?": {"template_image": str, "name_conf": text_conf, "id_conf": text_conf, "helper_conf": text_conf,
+                      "template_dpi?": at_least_one, "template_quality?": at_least_one},
+    "cut_guides?": bool,
+    "scorecard_qr?": bool,
+    "output_profile?": profile_name,
+    "name_font?": str,
+    "scorecard_blanks?": {str: {str: int}},
+    "staging_max_moves?": at_least_one,
+    "auto_assign?": {"groups?": {str: at_least_one}, "group_size?": at_least_one, "judges?": float, "scramblers?": int, "runners?": int},
+    "layout?": {"paper?": paper_size, "scorecards_per_page?": at_least_one, "badges_per_page?": at_least_one,
+                "scorecard_size?": [float, float], "badge_size?": [float, float], "pack?": bool, "stack?": at_least_one} }
+
+check_config_schema = compile_schema(config_schema)
+
+# Checks a config file for everything that would otherwise stop a run partway through: first against config_schema,
+# and then that the things it refers to exist. kinds are the outputs that are going to be made, since, say, the badge
+# settings only matter if there are badges to make. assignments can be None if they couldn't be loaded. Returns a
+# list of problems and a list of warnings (SchemaWarnings).
+def check_config(config, assignments, kinds):
+    found = check_config_schema(config, "")
+    warnings = [p for p in found if isinstance(p, SchemaWarning)]
+    problems = [p for p in found if not isinstance(p, SchemaWarning)]
+    if len(problems) > 0:
+        return problems, warnings # the rest of the checks can count on everything being the right shape
+    events = config["events"]
+    stages = config.get("stages", {})
+    for event, settings in events.items():
+        if event not in eventNames:
+            problems.append(f"events has {json.dumps(event)}, which isn't a WCA event id or in custom_events")
+        if len(settings) == 5 and settings[4] not in stages:
+            problems.append(f"events[{json.dumps(event)}] puts it on stage {json.dumps(settings[4])}, which isn't in stages")
+    tags = [s[0] for s in stages.values()]
+    for tag in set(tags):
+        if tags.count(tag) > 1:
+            problems.append(f"stages has more than one stage with the tag {json.dumps(tag)}")
+    for role in config.get("roles", "CJRS"):
+        if role not in role_names:
+            problems.append(f"roles has {json.dumps(role)}, which isn't one of {''.join(role_names)}")
+    for who, stars in config.get("stars", {}).items():
+        if assignments is not None and who not in assignments.people:
+            problems.append(f"stars has {json.dumps(who)}, who isn't in the assignments file")
+        for event in stars:
+            if event not in events:
+                problems.append(f"stars[{json.dumps(who)}] has {json.dumps(event)}, which isn't in events")
+    if "blank" in kinds:
+        if "scorecard_blanks" not in config:
+            problems.append("there are blank scorecards to make, but no scorecard_blanks")
+        for event in config.get("scorecard_blanks", {}):
+            if event not in events and event != "blank":
+                problems.append(f"scorecard_blanks has {json.dumps(event)}, which isn't in events (or \"blank\")")
+            if event == "blank" and "333" not in events:
+                problems.append("scorecard_blanks has \"blank\", which takes its settings from 333, but 333 isn't in events")
+    if "badge" in kinds:
+        if "badge_config" not in config:
+            problems.append("there are badges to make, but no badge_config")
+        elif not os.path.exists(config["badge_config"]["template_image"]):
+            problems.append(f"can't find the badge template image {config['badge_config']['template_image']}")
+    if "name_font" in config and not os.path.exists(config["name_font"]):
+        problems.append(f"can't find the name font {config['name_font']}")
+    for event, rounds in config.get("rounds", {}).items():
+        if event not in events:
+            problems.append(f"rounds has {json.dumps(event)}, which isn't in events")
+    if "assignments" not in config and "wcif" not in config:
+        problems.append("there's no assignments file, and no wcif file to take the assignments from")
+    elif not os.path.exists(assignments_file(config)):
+        problems.append(f"can't find the assignments file {assignments_file(config)}")
+    return problems, warnings
+
+# Seconds per card to draw each output, for when there are no timings from earlier runs. These are from a 3000-person
+# competition on one core of a modest laptop, and they're only meant to be the right order of magnitude.
+default_timings = {"scorecards": 0.0004, "blank scorecards": 0.0004, "badges": 0.0006, "group lists": 0.0007,
+                   "stage lists": 0.0003, "certificates": 0.005}
+
+# Timings from earlier --profile runs, kept in a JSON file of {output name: {"seconds_per_card": s, "jobs": n}}.
+def load_timings(filename):
+    timings = {name: {"seconds_per_card": s, "jobs": 1} for name, s in default_timings.items()}
+    if filename is not None and os.path.exists(filename):
+        with open(filename) as fin:
+            try:
+                timings.update(json.load(fin))
+            except ValueError:
+                pass # a broken timings file just means no calibration
+    return timings
+
+# After a --profile run, saves how long each output took per card. Volumes of an output are added up together.
+def save_timings(filename, profiler, jobs):
+    totals = {}
+    for r in profiler.phases:
+        if r["depth"] == 0 and r["phase"].startswith("render ") and r["cards"] > 0:
+            name = r["phase"][len("render "):].split(" (")[0]
+            seconds, cards = totals.get(name, (0, 0))
+            totals[name] = (seconds + r["seconds"], cards + r["cards"])
+    timings = {}
+    if os.path.exists(filename):
+        with open(filename) as fin:
+            try:
+                timings = json.load(fin)
+            except ValueError:
+                pass
+    for name, (seconds, cards) in totals.items():
+        timings[name] = {"seconds_per_card": seconds/cards, "jobs": jobs}
+    with open(filename, "w") as fout:
+        json.dump(timings, fout, indent=2)
+
+# The --plan dry run. Returns the number of problems it found. The page counts come from the same plan_outputs() a
+# real run uses, so they're exact, but that means building every card's arguments: for a 3000-person competition it
+# takes about half a second, split between reading the assignments file and planning the cards, not milliseconds.
+def plan_run(config_file, make_list, jobs=1, timings_file=None):
+    start = time.perf_counter()
+    config = load_config(config_file)
+    kinds = wanted_outputs(make_list)
+    assignments = None
+    if all(isinstance(p, SchemaWarning) for p in check_config_schema(config, "")) and os.path.exists(assignments_file(config) or ""):
+        assignments = load_data(config)
+        assignments.report.show()
+    problems, warnings = check_config(config, assignments, kinds)
+    for warning in warnings:
+        print(f"Warning: {warning}")
+    if len(problems) > 0:
+        print(f"Found {len(problems)} problem(s) in {config_file}:")
+        for problem in problems:
+            print(f"  {problem}")
+        return len(problems)
+    if len(config.get("stages", {})) > 0:
+        assign_stages(config, assignments)
+    timings = load_timings(timings_file)
+    print(f"\n{'Output':<44} {'Cards':>7} {'Pages':>7} {'Sheets':>7} {'Seconds':>8}")
+    total = 0
+    for out in plan_outputs(config, assignments, kinds):
+        if "rows" in out:
+            print(f"{out['filename']:<44} {len(out['rows'])-1:>7} {'-':>7} {'-':>7} {'-':>8}")
+            continue
+        cards = sum(len(page[0]) for shard in out["shards"] for page in shard)
+        pages = sum(len(shard) for shard in out["shards"])
+        timing = timings.get(out["name"], {"seconds_per_card": 0.001, "jobs": 1})
+        seconds = cards * timing["seconds_per_card"] * timing["jobs"] / max(jobs, 1)
+        total += seconds
+        print(f"{out['filename']:<44} {cards:>7} {pages:>7} {sheet_count(out):>7} {seconds:>8.1f}")
+    print(f"\nEstimated drawing time: {total:.1f} seconds{f' with -j {jobs}' if jobs > 1 else ''}. Checked and planned in {time.perf_counter()-start:.2f} seconds.")
+    print(f"{len(assignments.report)} problem(s) in the assignments file." if len(assignments.report) > 0 else "No problems found.")
+    return len(assignments.report)
+
+# The files a competition is loaded from: the config file, and the assignments file and WCIF file it names.
+def input_files(config_file, config):
+    return [config_file] + [config[key] for key in ["assignments", "wcif"] if key in config]
+
+# Snapshots. Loading a competition means parsing the config file, the assignments file or WCIF export (which can run
+# to many megabytes for a championship), and doing the staging, every time. load_competition() can keep the result
+# in a snapshot file: a pickle of the loaded config and AssignmentTable, along with the size, modification time and
+# SHA-256 of each input file, and a hash of this script. As long as none of those have changed, the next run loads
+# the snapshot instead. A file whose modification time changed but whose contents didn't (because it was saved again
+# without changes, or copied) still matches. Snapshots are only kept when asked for, with --snapshot.
+#
+# The files a config file names are found from the current directory, so the same config file run from another
+# directory can be a different competition: a snapshot is for one config file run from one directory. The input files
+# are recorded by their paths relative to the config file's directory.
+def snapshot_filename(directory, config_file):
+    key = os.path.abspath(config_file) + "\0" + os.getcwd()
+    return os.path.join(directory, "snapshot_" + hashlib.md5(key.encode("utf-8")).hexdigest()[:16] + ".pickle")
+
+def snapshot_path(config_file, filename):
+    return os.path.relpath(os.path.abspath(filename), os.path.dirname(os.path.abspath(config_file)))
+
+def file_digest(filename):
+    with open(filename, "rb") as fin:
+        return hashlib.sha256(fin.read()).hexdigest()
+
+def file_stamp(filename):
+    st = os.stat(filename)
+    return [st.st_mtime_ns, st.st_size, file_digest(filename)]
+
+def code_digest():
+    with open(__file__, "rb") as fin:
+        return hashlib.md5(fin.read()).hexdigest()
+
+# Returns the snapshot's (config, assignments), or None if there isn't a snapshot or it's out of date. The header,
+# with the stamps, is a pickle of its own at the front of the file, so an out of date snapshot is spotted without
+# loading the rest. Loading the rest makes a great many small objects, and Python's cycle collector would keep
+# stopping to look through all of them (which takes most of the time). There are no cycles in there to find, so it's
+# switched off while the snapshot loads. With freeze=True, the loaded objects are then frozen so the collector doesn't
+# keep looking through them while the PDFs are drawn either. Freezing is for the whole process and lasts until it
+# exits, so it's only for runs that make their PDFs and stop, not ones that keep going, like --watch.
+def read_snapshot(filename, config_file, freeze=False):
+    try:
+        with open(filename, "rb") as fin:
+            header = pickle.load(fin)
+            if header["code"] != code_digest():
+                return None
+            base = os.path.dirname(os.path.abspath(config_file))
+            for path, (mtime, size, digest) in header["inputs"].items():
+                path = os.path.join(base, path)
+                st = os.stat(path)
+                if (st.st_mtime_ns, st.st_size) != (mtime, size) and (st.st_size != size or file_digest(path) != digest):
+                    return None
+            collecting = gc.isenabled()
+            gc.disable()
+            try:
+                loaded = pickle.load(fin)
+                if freeze:
+                    gc.freeze()
+                return loaded
+            finally:
+                if collecting:
+                    gc.enable()
+    except (OSError, EOFError, pickle.UnpicklingError, KeyError, AttributeError, ValueError):
+        return None
+
+def write_snapshot(filename, inputs, config, assignments):
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    tmp = filename + f".{os.getpid()}.tmp" # --batch workers can share a cache directory
+    with open(tmp, "wb") as fout:
+        pickle.dump({"code": code_digest(), "inputs": inputs}, fout, pickle.HIGHEST_PROTOCOL)
+        pickle.dump((config, assignments), fout, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, filename)
+
+# Loads a competition's config and assignments and does its staging, like a normal run does before drawing anything.
+# With snapshot_dir, it uses (and keeps up to date) a snapshot of the result in that directory. Each input file is
+# stamped before it's read, so one that changes while it's being read makes the snapshot out of date. freeze is passed
+# on to read_snapshot().
+def load_competition(config_file, snapshot_dir=None, freeze=False):
+    snapshot = snapshot_filename(snapshot_dir, config_file) if snapshot_dir is not None else None
+    if snapshot is not None:
+        with profile_phase("load snapshot"):
+            loaded = read_snapshot(snapshot, config_file, freeze)
+        if loaded is not None:
+            config, assignments = loaded
+            for _e in config.get("custom_events", []):
+                eventNames[_e[0]] = tuple(_e[1:])
+            return config, assignments
+    inputs = {snapshot_path(config_file, config_file): file_stamp(config_file)} if snapshot is not None else None
+    with profile_phase("load_config"):
+        config = load_config(config_file)
+    if snapshot is not None:
+        for f in input_files(config_file, config)[1:]:
+            if os.path.exists(f):
+                inputs[snapshot_path(config_file, f)] = file_stamp(f)
+    with profile_phase("load_data"):
+        assignments = load_data(config)
+    if len(config.get("stages", {})) > 0:
+        with profile_phase("assign_stages"):
+            assign_stages(config, assignments)
+    if snapshot is not None:
+        write_snapshot(snapshot, inputs, config, assignments)
+    return config, assignments
+
+# In-memory versions of the outputs, for programs that use CompGenerator as a library (like the --serve service).
+# Each returns the PDF as bytes instead of writing a file. config and assignments come from load_competition().
+def output_pdf(config, assignments, out):
+    init_worker(config, assignments) # the drawing code reads these as globals
+    buf = io.BytesIO()
+    render_outputs(config, assignments, [dict(out, filename=buf)])
+    return buf.getvalue()
+
+# Both sides of one person's badge.
+def badge_pdf(config, assignments, who):
+    out = badges_output(config, assignments)
+    return output_pdf(config, assignments, dict(out, shards=[badge_sheet_pages(config, assignments, [who])]))
+
+def badges_pdf(config, assignments):
+    return output_pdf(config, assignments, badges_output(config, assignments))
+
+# Round 1 scorecards for one event, or for everything (including the star competitors' cards) if event is None.
+def scorecards_pdf(config, assignments, event=None):
+    out = scorecards_output(config, assignments)
+    if event is not None:
+        out = dict(out, shards=[event_scorecard_pages(config, assignments, event)], labels=[event])
+    return output_pdf(config, assignments, out)
+
+def blank_scorecards_pdf(config):
+    return output_pdf(config, None, blank_scorecards_output(config))
+
+# The competition that the --serve service works from. It's loaded once and kept, along with everything the drawing
+# code keeps around (fonts, template images, scorecard templates), and reloaded if the config or assignments file
+# changes.
+class Competition:
+    def __init__(self, config_file):
+        self.config_file = config_file
+        self.stamp = None
+        self.load()
+
+    def load(self):
+        config = load_config(self.config_file) if self.stamp is None else self.config
+        stamp = tuple(os.path.getmtime(f) for f in input_files(self.config_file, config))
+        if stamp != self.stamp:
+            self.config, self.assignments = load_competition(self.config_file)
+            self.stamp = stamp
+            print(f"Loaded {self.config['competition']}: {len(self.assignments.people)} people", flush=True)
+
+    # Reloads the competition if it's changed. If it can't be loaded (say the config file is only half saved, so
+    # load_config() exits), this keeps the last good copy, along with the event names it was loaded with, and returns
+    # False. The request is served from that copy, and the next request tries the reload again.
+    def refresh(self):
+        names = dict(eventNames)
+        try:
+            self.load()
+        except (SystemExit, OSError, ValueError) as e:
+            eventNames.clear()
+            eventNames.update(names) # the failed load may have added the new config's custom events
+            reason = "" if isinstance(e, SystemExit) else f": {e}"
+            print(f"Couldn't reload {self.config_file}{reason}. Still serving the last good copy.", flush=True)
+            return False
+        return True
+
+# Serves PDFs over HTTP from a warm Competition, so a local web page (or curl) can get them in milliseconds:
+#   GET /people                  JSON list of everybody, with their WCA ID, number, and whether they're competing
+#   GET /badge?name=Ada%20Ke     one person's badge
+#   GET /badges                  everybody's badges
+#   GET /scorecards?event=333    one event's round 1 scorecards (leave out event for all of them)
+#   GET /blanks                  the blank scorecards
+# address is a port ("8000"), host:port ("0.0.0.0:8000"), or the path of a Unix socket ("/tmp/compgenerator.sock").
+# Requests are handled one at a time, since the drawing code works from globals.
+def serve(config_file, address):
+    import http.server
+    import socketserver
+    import urllib.parse
+    comp = Competition(config_file)
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            query = {k: v[0] for k, v in urllib.parse.parse_qs(url.query).items()}
+            comp.refresh() # if the reload fails, this request gets the last good copy
+            config, assignments = comp.config, comp.assignments
+            if url.path == "/people":
+                people = [{"name": p.name, "wcaid": p.wcaid, "number": p.number, "competitor": p.name in assignments.competitors}
+                          for p in assignments.people.values()]
+                return self.reply(200, "application/json", json.dumps(people).encode("utf-8"))
+            if url.path == "/badge":
+                if query.get("name") not in assignments.people:
+                    return self.reply(404, "text/plain", b"no such person\n")
+                return self.reply(200, "application/pdf", badge_pdf(config, assignments, query["name"]))
+            if url.path == "/badges":
+                return self.reply(200, "application/pdf", badges_pdf(config, assignments))
+            if url.path == "/scorecards":
+                if "event" in query and query["event"] not in config["events"]:
+                    return self.reply(404, "text/plain", b"no such event\n")
+                return self.reply(200, "application/pdf", scorecards_pdf(config, assignments, query.get("event")))
+            if url.path == "/blanks":
+                return self.reply(200, "application/pdf", blank_scorecards_pdf(config))
+            return self.reply(404, "text/plain", b"not found\n")
+
+        def reply(self, status, content_type, body):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    if "/" in address:
+        if os.path.exists(address):
+            os.remove(address)
+        class UnixHTTPServer(socketserver.UnixStreamServer):
+            def get_request(self): # Unix sockets don't have a client address, which the request log wants
+
+                request, _ = super().get_request()
+                return request, ("local", 0)
+        server = UnixHTTPServer(address, Handler)
+    else:
+        host, _, port = address.rpartition(":")
+        server = http.server.HTTPServer((host or "127.0.0.1", int(port)), Handler)
+    print(f"Serving {comp.config['competition']} on {address}. Press Ctrl-C to stop.", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+# Batch mode. Every (competition, output) pair is a job for the worker pool, and each worker keeps the competitions
+# it has loaded, along with reportlab's fonts, the loaded template images and the scorecard templates, warm from one
+# job to the next. A job runs in its config file's directory, so the paths in each config file work the same as
+# running it on its own from there, and the PDFs end up next to the config file.
+batch_loaded = {} # config file -> (config, assignments), in each worker
+batch_event_names = dict(eventNames) # the built-in event names, which each job starts from before adding its own
+
+def batch_job(config_file, kind, cache_dir=None, cache_size=0, split=None, merge=False, snapshot_dir=None, profile=None):
+    global output_profile_override
+    output_profile_override = profile
+    os.chdir(os.path.dirname(config_file))
+    eventNames.clear()
+    eventNames.update(batch_event_names) # so one competition's custom events don't carry over into the next
+    try:
+        if config_file not in batch_loaded:
+            batch_loaded[config_file] = load_competition(config_file, snapshot_dir)
+        config, assignments = batch_loaded[config_file]
+    except SystemExit: # load_config() gives up this way on a broken config file
+        raise RuntimeError("couldn't load the config file")
+    init_worker(config, assignments)
+    out = plan_output(config, assignments, kind)
+    cache = PageCache(cache_dir, cache_size) if cache_dir is not None else None
+    made = render_volumes(config, assignments, [out], None, cache, split, merge)
+    reused = cache.reused if cache is not None else 0
+    rendered = cache.rendered if cache is not None else 0
+    return [os.path.join(os.path.dirname(config_file), f) for f in made], len(assignments.report), reused, rendered
+
+# Finds the config files for --batch: each argument is a config file, or a directory whose *.json config files all
+# get used. Only JSON files with an "assignments" or "wcif" key count as config files, so a winners file (or a WCIF
+# file) sitting next to them is skipped, but one that isn't valid JSON at all is kept so that it shows up as a failure
+# instead of vanishing.
+def batch_config_files(paths):
+    found = []
+    for path in paths:
+        if not os.path.isdir(path):
+            found.append(os.path.abspath(path))
+            continue
+        for name in sorted(os.listdir(path)):
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(path, name), "r") as fin:
+                        is_config = not {"assignments", "wcif"}.isdisjoint(json.load(fin))
+                except ValueError:
+                    is_config = True
+                except (AttributeError, TypeError): # valid JSON, but not a dict
+                    is_config = False
+                if is_config:
+                    found.append(os.path.abspath(os.path.join(path, name)))
+    return found
+
+# Runs every competition in the batch and prints how each one went. One competition failing doesn't stop the others.
+# Returns the number of competitions that had a failure.
+def run_batch(config_files, make_list, jobs, cache_dir=None, cache_size=0, split=None, merge=False, snapshot_dir=None, profile=None):
+    results = {f: [] for f in config_files}
+    failures = {f: [] for f in config_files}
+    problems = {}
+    reused = rendered = 0
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {}
+        for config_file in config_files:
+            for kind in wanted_outputs(make_list):
+                futures[pool.submit(batch_job, config_file, kind, cache_dir, cache_size, split, merge, snapshot_dir, profile)] = (config_file, kind)
+        for future, (config_file, kind) in futures.items():
+            try:
+                made, problems[config_file], r, d = future.result()
+                results[config_file] += made
+                reused += r
+                rendered += d
+            except Exception as e:
+                failures[config_file].append(f"{kind}s: {type(e).__name__}: {e}")
+    print(f"\nBatch results for {len(config_files)} competitions:")
+    for config_file in config_files:
+        print(f"  {config_file}: {'FAILED' if failures[config_file] else 'ok'}")
+        if problems.get(config_file, 0) > 0:
+            print(f"    {problems[config_file]} problem(s) in the assignments file; run this one on its own to see them")
+        for filename in results[config_file]:
+            print(f"    made {filename}")
+        for failure in failures[config_file]:
+            print(f"    failed to make the {failure}")
+    if cache_dir is not None:
+        PageCache(cache_dir, cache_size).evict()
+        print(f"Reused {reused} cards from the cache, re-rendered {rendered}.")
+    return sum(1 for f in config_files if failures[f])
+
+# Watch mode. After the normal run, CompGenerator keeps an eye on the config file, the assignments file and the badge
+# template image, and when any of them changes it updates the PDFs. Editors tend to save in bursts (and some save by
+# writing a new file and renaming it over the old one), so it waits until the files have been quiet for
+# watch_debounce seconds before doing anything.
+watch_debounce = 0.5
+
+# Watches files with Linux's inotify, through ctypes. It watches the directories the files are in, rather than the
+# files themselves, so that it still works when an editor replaces a file instead of writing to it. Raises OSError
+# where inotify isn't available.
+class InotifyWatcher:
+    def __init__(self, paths):
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("no inotify here")
+        self.paths = {os.path.abspath(p) for p in paths}
+        self.fd = libc.inotify_init1(os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = {}
+        mask = 0x8 | 0x80 | 0x100 | 0x200 # IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        for d in {os.path.dirname(p) for p in self.paths}:
+            wd = libc.inotify_add_watch(self.fd, d.encode(), mask)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"can't watch {d}")
+            self.dirs[wd] = d
+
+    # Waits up to timeout seconds (forever if None) for any of the files to change, and returns the set of the ones
+    # that did (which is empty if it timed out).
+    def wait(self, timeout):
+        import select
+        import struct
+        changed = set()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while len(changed) == 0:
+            left = None if deadline is None else deadline - time.monotonic()
+            if left is not None and left <= 0:
+                break
+            if not select.select([self.fd], [], [], left)[0]:
+                break
+            data = os.read(self.fd, 65536)
+            i = 0
+            while i < len(data):
+                wd, mask, cookie, size = struct.unpack_from("iIII", data, i)
+                name = data[i+16:i+16+size].rstrip(b"\0").decode(errors="replace")
+                i += 16 + size
+                path = os.path.join(self.dirs.get(wd, ""), name)
+                if path in self.paths:
+                    changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+# The fallback for where there's no inotify: checks each file's modification time and size every `interval` seconds.
+class PollingWatcher:
+    def __init__(self, paths, interval=0.5):
+        self.interval = interval
+        self.stamps = {os.path.abspath(p): self.stamp(p) for p in paths}
+
+    def stamp(self, path):
+        try:
+            st = os.stat(path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def wait(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = set()
+            for path, old in self.stamps.items():
+                new = self.stamp(path)
+                if new != old:
+                    self.stamps[path] = new
+                    changed.add(path)
+            if len(changed) > 0 or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+            time.sleep(self.interval if deadline is None else max(0, min(self.interval, deadline - time.monotonic())))
+
+    def close(self):
+        pass
+
+def new_watcher(paths):
+    try:
+        return InotifyWatcher(paths)
+    except (OSError, AttributeError):
+        return PollingWatcher(paths)
+
+# The files a competition's outputs are made from.
+def watched_files(config_file, config):
+    files = input_files(config_file, config)
+    if "badge_config" in config:
+        files.append(config["badge_config"]["template_image"])
+    return [os.path.abspath(f) for f in files]
+
+# Everything about an event's competing groups that staging depends on.
+def event_signature(assignments, event):
+    return tuple((g, tuple(names)) for g, names in assignments.groups.get(event, {}).items())
+
+# Stages a freshly loaded AssignmentTable, re-running assign_stages() only for the events whose competing groups
+# changed since the old table; the rest keep the stages they had. Returns the events that were re-staged.
+def restage(config, old, new):
+    changed = [e for e in config["events"] if event_signature(old, e) != event_signature(new, e)]
+    for event in config["events"]:
+        if event not in changed:
+            for who in new.competing_in(event):
+                new.people[who].competing(event).stage = old.people[who].competing(event).stage
+    if len(changed) > 0 and len(config.get("stages", {})) > 0:
+        assign_stages(dict(config, events={e: config["events"][e] for e in changed}), new)
+    return changed
+
+# What an output's PDF looks like, as far as watch() is concerned: its pages, and the template image that its setup
+# draws. If that hasn't changed, neither has the PDF.
+def output_signature(config, context, out):
+    stamp = None
+    if out["setup"] is not None and "badge_config" in config:
+        st = os.stat(config["badge_config"]["template_image"])
+        stamp = (st.st_mtime_ns, st.st_size)
+    return (stamp, out.get("rows"), [page_key(context, page) for shard in out["shards"] for page in shard])
+
+# Plans the outputs that --generate asks for, split into volumes if asked, and returns them along with their
+# signatures.
+def watched_outputs(config, assignments, make_list, split):
+    context = render_context(config)
+    outputs = []
+    for out in plan_outputs(config, assignments, wanted_outputs(make_list)):
+        outputs += split_output(out, split) if split is not None else [out]
+    return [(out, output_signature(config, context, out)) for out in outputs]
+
+# Runs until Ctrl-C, updating the PDFs whenever their files change. config and assignments are what the PDFs were last
+# made from. Only the PDFs (or, with --split, the volumes) whose pages changed get written again, and the pages that
+# didn't change come out of the page cache.
+def watch(config_file, config, assignments, make_list, jobs, cache, split=None):
+    last = {out["filename"]: sig for out, sig in watched_outputs(config, assignments, make_list, split)}
+    pool = None
+    watcher = None
+    try:
+        while True:
+            if watcher is None:
+                watcher = new_watcher(watched_files(config_file, config))
+                print(f"Watching {', '.join(os.path.basename(f) for f in watched_files(config_file, config))} for changes. Press Ctrl-C to stop.", flush=True)
+            changed = watcher.wait(None)
+            while True: # wait for the burst of saves to finish
+                more = watcher.wait(watch_debounce)
+                if len(more) == 0:
+                    break
+                changed |= more
+            start = time.perf_counter()
+            try:
+                if os.path.abspath(config_file) in changed or ("wcif" in config and os.path.abspath(config["wcif"]) in changed):
+                    config = load_config(config_file)
+                    assignments = load_data(config)
+                    assignments.report.show()
+                    if len(config.get("stages", {})) > 0:
+                        assign_stages(config, assignments)
+                    watcher.close()
+                    watcher = None # the assignments file or template image might be different ones now
+                    if pool is not None:
+                        pool.shutdown()
+                        pool = None # the workers need the new config
+                elif os.path.abspath(assignments_file(config)) in changed:
+                    new = load_data(config)
+                    new.report.show()
+                    restaged = restage(config, assignments, new)
+                    if len(restaged) > 0:
+                        print(f"Re-staged {', '.join(restaged)}.")
+                    assignments = new
+                if pool is None and jobs > 1:
+                    from concurrent.futures import ProcessPoolExecutor
+                    pool = ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(config, assignments))
+                init_worker(config, assignments)
+                outputs = [(out, sig) for out, sig in watched_outputs(config, assignments, make_list, split)
+                           if last.get(out["filename"]) != sig or not os.path.exists(out["filename"])]
+                cache.reused = cache.rendered = 0
+                render_outputs(config, assignments, [out for out, _ in outputs], pool, cache)
+                for out, sig in outputs:
+                    last[out["filename"]] = sig
+                cache.evict()
+                print(f"Updated {len(outputs)} PDF(s) in {time.perf_counter() - start:.1f} seconds, re-drawing {cache.rendered} cards.", flush=True)
+            except (Exception, SystemExit) as e: # e.g. a half-edited config file. Keep watching; the next save may fix it.
+                print(f"Couldn't update the PDFs: {e}", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if watcher is not None:
+            watcher.close()
+        if pool is not None:
+            pool.shutdown()
 
 if __name__ == '__main__':
     # set up arg parser and parse args
     parser = argparse.ArgumentParser(add_help=False)
-    parser.add_argument("--config", "-c", required=True, help="JSON file of config information")
-#    parser.add_argument("--winners", "-w", required=False, default=None, help="JSON file of winner information")
-    parser.add_argument("--generate", "-g", required=False, default="all", help="a string specifying what you want generated: any combination of 'scorecards', 'blank', 'badges', or 'all'")
+    parser.add_argument("--config", "-c", required=False, default=None, help="JSON file of config information")
+    parser.add_argument("--batch", "-b", required=False, nargs="+", default=None, help="config files, or directories of them, to generate all in one go")
+    parser.add_argument("--winners", "-w", required=False, default=None, help="JSON file of winner information, to make certificates from")
+    parser.add_argument("--generate", "-g", required=False, default="all", help="a string specifying what you want generated: any combination of 'scorecards', 'blank', 'badges', 'groups', 'stages' and 'csv', or 'all' (the scorecards, blanks and badges), or 'next-round'")
+    parser.add_argument("--assign", "-a", required=False, default=None, help="registrations CSV to make the assignments file from, instead of making it by hand")
+    parser.add_argument("--assign-output", required=False, default=None, help="where --assign writes the assignments file (default: the config file's \"assignments\" file, if that doesn't exist yet)")
+    parser.add_argument("--results", "-r", required=False, default=None, help="with '-g next-round', the CSV or JSON results of the round that just finished")
+    parser.add_argument("--event", "-e", required=False, default=None, help="with '-g next-round', the event id, like '333'; with --reprint, only this event's scorecards")
+    parser.add_argument("--round", required=False, default=None, help="with '-g next-round', the name of the next round, like '2' or 'Final' (default 2); with --reprint, only this round's scorecards")
+    parser.add_argument("--advance", required=False, default="75%", help="with '-g next-round', how many people go through: a number, like '16', or a percentage, like '75%%'")
+    parser.add_argument("--groups", required=False, type=int, default=None, help="with '-g next-round', how many groups the next round has")
+    parser.add_argument("--jobs", "-j", required=False, type=int, default=1, help="number of worker processes to render with")
+    parser.add_argument("--incremental", "-i", action="store_true", help="only re-render pages that changed since the last run, using the page cache")
+    parser.add_argument("--cache-dir", required=False, default=".compgenerator_cache", help="directory for the --incremental page cache, and the --snapshot of the loaded competition")
+    parser.add_argument("--snapshot", action="store_true", help="keep a snapshot of the loaded competition in the cache directory, and load that instead while the input files haven't changed")
+    parser.add_argument("--cache-size", required=False, type=int, default=500, help="size limit for the page cache, in megabytes")
+    parser.add_argument("--split", required=False, default="none", help=f"split each PDF into volumes: 'event' for one per event, a number of pages per volume, or 'auto' to split only PDFs of more than {auto_split_pages} pages; 'none' (the default) never splits")
+    parser.add_argument("--merge", action="store_true", help="merge the volumes of each split PDF back into one PDF afterwards, a volume at a time (needs pypdf)")
+    parser.add_argument("--output-profile", required=False, choices=list(output_profiles), default=None, help="how to write the PDFs: 'fast' (uncompressed) or 'compact' (compressed, binary); overrides the config's \"output_profile\"")
+    parser.add_argument("--profile", action="store_true", help="time each phase of the run and print a summary")
+    parser.add_argument("--profile-json", required=False, default=None, help="also save the --profile numbers to this JSON file")
+    parser.add_argument("--profile-stats", required=False, default=None, help="also run under cProfile and save its stats to this file")
+    parser.add_argument("--watch", action="store_true", help="after making the PDFs, keep watching the input files and update the PDFs whenever they change")
+    parser.add_argument("--serve", required=False, default=None, help="keep running and serve PDFs over HTTP on this port, host:port, or Unix socket path")
+    parser.add_argument("--plan", action="store_true", help="check the config and assignments files and print what the outputs will take, without making them")
+    parser.add_argument("--timings", required=False, default=".compgenerator_timings.json", help="where --profile runs save drawing speeds, for --plan's time estimates")
+    parser.add_argument("--per-person", required=False, nargs="?", const="", default=None, help="instead of the usual PDFs, make a PDF for each person with their badge back and scorecards, in this directory or .zip file (default: <competition>_packets)")
+    parser.add_argument("--reprint", required=False, nargs="+", default=None, help="print these people's scorecards and badges again, using the page indexes from the last run")
+    parser.add_argument("--from-pdf", action="store_true", help="with --reprint, copy the pages out of the original PDF instead of drawing the cards again (needs pypdf)")
     parser.add_argument("--help", "-h", action="store_true")
 
     args = parser.parse_args()
     if args.help is True:
         show_help()
         exit()
+    output_profile_override = args.output_profile
+    split = args.split
+    if split == "none":
+        split = None
+    elif split not in ("event", "auto"):
+        if not split.isdigit() or int(split) < 1:
+            print("Error: --split must be 'auto', 'none', 'event' or a number of pages.")
+            exit()
+        split = int(split)
+    if args.winners is not None:
+        # certificates are made instead of any of the other stuff. The config file is optional; it's only used for the
+        # competition name (and custom event names) if the winners file doesn't have them.
+        config = load_config(args.config) if args.config is not None else {"competition": ""}
+        winners = certificate_settings(load_config(args.winners), config)
+        if winners.get("certificate_template") and not os.path.exists(winners["certificate_template"]):
+            print(f"Error: can't find the certificate template image {winners['certificate_template']}.")
+            exit()
+        if winners.get("name_font") and not os.path.exists(winners["name_font"]):
+            print(f"Error: can't find the name font {winners['name_font']}.")
+            exit()
+        outputs = [certificates_output(winners, config["competition"])]
+        cache = PageCache(args.cache_dir, args.cache_size*1024*1024) if args.incremental else None
+        if args.jobs > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=args.jobs, initializer=init_worker, initargs=(config, None)) as pool:
+                render_volumes(winners, None, outputs, pool, cache, split, args.merge)
+        else:
+            render_volumes(winners, None, outputs, None, cache, split, args.merge)
+        exit()
+    if args.batch is not None:
+        cache_dir = os.path.abspath(args.cache_dir) if args.incremental else None
+        snapshot_dir = os.path.abspath(args.cache_dir) if args.snapshot else None
+        failed = run_batch(batch_config_files(args.batch), args.generate, max(args.jobs, 1), cache_dir, args.cache_size*1024*1024, split, args.merge,
+                           snapshot_dir, args.output_profile)
+        exit(1 if failed > 0 else 0)
     if args.config is None:
         show_help()
         print("\nError: missing config file. Use '--config' option to specify one.")
         exit()
-    config = load_config(args.config)
-    assignments = load_data(config)
-    # check whether we need to assign competing stages to each person
-    if "stages" in config.keys():
-        if len(config["stages"].keys()) > 0:
-            assign_stages(config, assignments)
+    if args.plan:
+        exit(1 if plan_run(args.config, args.generate, args.jobs, args.timings) > 0 else 0)
+    if args.reprint is not None:
+        config = load_config(args.config) # the drawing code reads it
+        reprint(config, args.reprint, args.event, args.round, args.generate, args.from_pdf)
+        exit()
+    if args.serve is not None:
+        serve(args.config, args.serve)
+        exit()
+    if args.profile or args.profile_json or args.profile_stats:
+        profiler = Profiler()
+    if args.profile_stats:
+        import cProfile
+        stats = cProfile.Profile()
+        stats.enable()
+    if args.assign is None:
+        config, assignments = load_competition(args.config, args.cache_dir if args.snapshot else None, freeze=not args.watch)
+    else:
+        with profile_phase("load_config"):
+            config = load_config(args.config)
+        target = args.assign_output or config.get("assignments")
+        if target is None:
+            print("Error: the config file has no assignments file for --assign to write. Use --assign-output to choose one.")
+            exit()
+        if args.assign_output is None and os.path.exists(target):
+            print(f"Error: {target} already exists. Use --assign-output to choose where the new assignments go, or delete it.")
+            exit()
+        with profile_phase("auto_assign"):
+            write_assignments(config, auto_assign(config, load_registrations(config, args.assign)), target)
+        print(f"Saving assignments to: {target}")
+        config["assignments"] = target
+        with profile_phase("load_data"):
+            assignments = load_data(config)
+        # check whether we need to assign competing stages to each person
+        if "stages" in config.keys():
+            if len(config["stages"].keys()) > 0:
+                with profile_phase("assign_stages"):
+                    assign_stages(config, assignments)
+    assignments.report.show()
 
-    make_list = args.generate
-    if "all" in make_list or "scorecard" in make_list:
-        generate_scorecards(config, assignments)
-    if "all" in make_list or "blank" in make_list:
-        generate_blank_scorecards(config)
-    if "all" in make_list or "badge" in make_list:
-        generate_badges(config, assignments)
- 
-    # TO DO: support generating winner certificates. If the -w flag is specified, then
-    # load_config() of that config to get the winner information,
-    # and call a generate_certificates() function instead of any of the other stuff.
+    make_list = args.generate if args.per_person is None else "" # the packets are made instead of the usual outputs
+    outputs = []
+    with profile_phase("plan pages"):
+        outputs += plan_outputs(config, assignments, wanted_outputs(make_list))
+        if "next-round" in make_list:
+            if args.results is None or args.event not in config["events"]:
+                print("Error: '-g next-round' needs a results file (--results) and an event from the config file (--event).")
+                exit(1)
+            outputs.append(next_round_output(config, assignments, args.results, args.event, args.round or "2", args.advance, args.groups))
+    for out in outputs:
+        if "rows" not in out: # the CSV file isn't printed
+            print(f"The {out['name']} take {sheet_count(out)} sheet(s) of paper{' (double-sided)' if out.get('duplex') else ''}.")
+    cache = PageCache(args.cache_dir, args.cache_size*1024*1024) if args.incremental or args.watch else None
+    if args.jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=args.jobs, initializer=init_worker, initargs=(config, assignments)) as pool:
+            render_volumes(config, assignments, outputs, pool, cache, split, args.merge)
+            if args.per_person is not None:
+                write_packets(config, assignments, args.per_person or get_filename(config["competition"], "packets")[:-len(".pdf")], pool)
+    else:
+        render_volumes(config, assignments, outputs, None, cache, split, args.merge)
+        if args.per_person is not None:
+            init_worker(config, assignments)
+            write_packets(config, assignments, args.per_person or get_filename(config["competition"], "packets")[:-len(".pdf")])
+    if cache is not None:
+        cache.evict()
+        print(f"Reused {cache.reused} cards from the cache, re-rendered {cache.rendered}.")
+    if args.profile_stats:
+        stats.disable()
+        stats.dump_stats(args.profile_stats)
+    if profiler is not None:
+        profiler.show()
+        if args.profile_json:
+            profiler.save(args.profile_json)
+        if cache is None: # drawing speeds for --plan, unless the cache meant some of the cards weren't drawn
+            save_timings(args.timings, profiler, args.jobs)
+    if args.watch:
+        watch(args.config, config, assignments, make_list, args.jobs, cache, split)
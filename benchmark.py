@@ -0,0 +1,632 @@
+#! /usr/bin/python
+# Benchmarks for CompGenerator. Run them from this directory, e.g.:
+#
+#   python benchmark.py staging
+#   python benchmark.py assign
+#   python benchmark.py suite
+#   python benchmark.py fit
+#   python benchmark.py wcif
+#   python benchmark.py qr
+#   python benchmark.py profiles
+#
+# Each benchmark prints a table of results and exits with an error if anything took longer than it should.
+
+import argparse
+import csv
+import json
+import math
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import CompGenerator
+
+# Makes up one event's worth of single-staging input: num_groups groups spread over num_stages stages. Stage sizes
+# are between 8 and 30 stations, and every group fits on at least one stage.
+def synthetic_staging(num_groups, num_stages, seed):
+    rng = random.Random(seed)
+    stages = [[f"S{i}", rng.randint(8, 30)] for i in range(num_stages)]
+    biggest = max(s[1] for s in stages)
+    groups = {str(g+1): rng.randint(1, biggest) for g in range(num_groups)}
+    return groups, stages
+
+# Times solve_single_staging() on synthetic events with hundreds of groups. Every event it's given has a feasible
+# mapping, so it should find one every time, and well inside a second.
+def bench_staging(args):
+    ok = True
+    print(f"{'groups':>8} {'stages':>7} {'seconds':>9} {'groups/stage':>14} {'people/stage':>20}")
+    for num_groups in [10, 50, 100, 200, 500, 1000]:
+        for num_stages in [4, 6]:
+            groups, stages = synthetic_staging(num_groups, num_stages, seed=num_groups*10+num_stages)
+            start = time.perf_counter()
+            mapping = CompGenerator.solve_single_staging(groups, stages)
+            elapsed = time.perf_counter() - start
+            if mapping is None or len(mapping) != num_groups:
+                print(f"{num_groups:>8} {num_stages:>7}  FAILED to find a mapping")
+                ok = False
+                continue
+            counts = [sum(1 for g in mapping if mapping[g] == s[0]) for s in stages]
+            loads = [sum(groups[g] for g in mapping if mapping[g] == s[0]) for s in stages]
+            print(f"{num_groups:>8} {num_stages:>7} {elapsed:>9.4f} {min(counts):>6}-{max(counts):<7} {min(loads):>9}-{max(loads):<10}")
+            if elapsed > args.limit:
+                ok = False
+    return ok
+
+# Makes up the registrations for an --assign run: competitors people, each registered in each of the first `events`
+# events with a 60% chance, plus a few helpers with no events. Returns a config and the registrations, in the form
+# CompGenerator.load_registrations() returns them.
+def synthetic_registrations(competitors, events, stages, stations, seed):
+    rng = random.Random(seed)
+    event_ids = [e for e in CompGenerator.eventNames.keys() if e != "blank"][0:events]
+    config = {
+        "competition": f"Synthetic {competitors}",
+        "stages": {f"Stage {i}": [f"S{i}", stations] for i in range(stages)},
+        "events": {e: [5,2,"1:00","3:00"] for e in event_ids},
+        "roles": "CJRS" }
+    registrations = [[f"Competitor {i:05d}", "", {e for e in event_ids if rng.random() < 0.6}] for i in range(competitors)]
+    registrations += [[f"Helper {i:03d}", "", set()] for i in range(competitors // 50)]
+    return config, registrations
+
+# Times CompGenerator.auto_assign() on a big competition, and checks what it made: no problems when the assignments
+# are checked the way load_data() checks them, group sizes within one of each other, and judging duty spread evenly.
+def bench_assign(args):
+    config, registrations = synthetic_registrations(args.competitors, args.events, 4, 24, seed=args.competitors)
+    start = time.perf_counter()
+    table = CompGenerator.auto_assign(config, registrations)
+    elapsed = time.perf_counter() - start
+    report = CompGenerator.ValidationReport()
+    for person in table.people.values():
+        for event, roles in person.roles.items():
+            CompGenerator.validate_assignment(report, 0, person.name, event, roles, config["roles"])
+    spread = max(max(len(names) for names in groups.values()) - min(len(names) for names in groups.values()) for groups in table.groups.values())
+    duty = [sum(1 for roles in p.roles.values() for r in roles if r.role != "C") for p in table.people.values()]
+    print(f"{'people':>8} {'events':>7} {'seconds':>9} {'problems':>9} {'group size spread':>18} {'duties/person':>14}")
+    print(f"{len(registrations):>8} {args.events:>7} {elapsed:>9.3f} {len(report):>9} {spread:>18} {min(duty):>6}-{max(duty):<7}")
+    return len(report) == 0 and spread <= 1 and elapsed <= args.limit
+
+# Competition sizes for the suite benchmark, from a small local comp up to a continental championship:
+# [name, competitors, events, stages, stations per stage, star competitors, blanks per round]
+suite_sizes = [
+    ["local",         50,   6, 1, 10,  2,  8],
+    ["regional",     300,  12, 2, 16,  8, 16],
+    ["national",    1000,  17, 3, 20, 20, 24],
+    ["continental", 3000,  17, 4, 24, 40, 32] ]
+
+# The phases of a normal run, in the order CompGenerator does them.
+suite_phases = ["load_config", "load_data", "assign_stages", "generate_scorecards", "generate_blank_scorecards", "generate_badges"]
+
+# Writes a synthetic competition into directory: a config file, an assignments CSV, and a copy of the sample badge
+# template. Each competitor enters each event with a 60% chance, and is put in a competing group, plus a judging
+# group (the next group along) and now and then a scrambling or running group too. Groups are about as big as the
+# number of stations, so most events are round-robin staged, and small events at small comps get single staged.
+# Returns the path to the config file.
+def synthetic_competition(directory, competitors, events, stages, stations, stars, blanks, seed):
+    rng = random.Random(seed)
+    event_ids = [e for e in CompGenerator.eventNames.keys() if e != "blank"][0:events]
+    tags = "RBGYOP"
+    stage_list = {f"Stage {tags[i]}": [tags[i], stations] for i in range(stages)}
+    entrants = {e: [i for i in range(competitors) if rng.random() < 0.6] for e in event_ids}
+    names = [f"Competitor {i:05d}" for i in range(competitors)]
+    rows = [[names[i], f"20{10+i%15}SYNT{i%100:02d}"] for i in range(competitors)]
+    for e in event_ids:
+        num_groups = max(2, math.ceil(len(entrants[e]) / (stages*stations)))
+        for i in range(competitors):
+            rows[i].append("")
+        for n, i in enumerate(entrants[e]):
+            g = n % num_groups + 1
+            roles = [f"C{g}", f"J{g % num_groups + 1}"]
+            if rng.random() < 0.1:
+                roles.append(f"{rng.choice('SR')}{(g+1) % num_groups + 1}")
+            rows[i][-1] = ";".join(roles)
+    with open(os.path.join(directory, "synthetic_assignments.csv"), "w", newline="") as fout:
+        writer = csv.writer(fout)
+        writer.writerow(["Name", "WCA ID"] + event_ids)
+        writer.writerows(rows)
+
+    config = {
+        "competition": f"Synthetic {competitors}",
+        "stages": stage_list,
+        "events": {e: ([3,1,"5:00","10:00"] if e in ["666","777","333bf","444bf","555bf","333fm","333mbf"] else [5,2,"1:00","3:00"]) for e in event_ids},
+        "roles": "CJRS",
+        "assignments": "synthetic_assignments.csv",
+        "stars": {names[i]: [rng.choice(event_ids)] for i in rng.sample(range(competitors), min(stars, competitors))},
+        "badge_config": {
+            "template_image": "sample_comp_badge_template.jpg",
+            "name_conf":   [90, 42.5, 16],
+            "id_conf":     [90, 22.25, 14],
+            "helper_conf": [90, 5.25, 14] },
+        "cut_guides": False,
+        "scorecard_blanks": {"blank": {"__": blanks}} }
+    for e in event_ids[0:3]:
+        config["scorecard_blanks"][e] = {"2": blanks, "Final": blanks//2}
+    here = os.path.dirname(os.path.abspath(__file__))
+    shutil.copy(os.path.join(here, "samples", "sample_comp_badge_template.jpg"), directory)
+    config_file = os.path.join(directory, "synthetic_config.json")
+    with open(config_file, "w") as fout:
+        json.dump(config, fout, indent=2)
+    return config_file
+
+# Runs each phase of a normal CompGenerator run on one competition, in the current directory, and returns
+# {phase: seconds}. With memory=True, the phases are traced with tracemalloc and it returns {phase: peak MB}
+# instead, since tracing slows everything down too much for the times to mean anything.
+def run_phases(config_file, memory=False):
+    results = {}
+    state = {}
+    steps = {
+        "load_config": lambda: state.update(config=CompGenerator.load_config(config_file)),
+        "load_data": lambda: state.update(assignments=CompGenerator.load_data(state["config"])),
+        "assign_stages": lambda: CompGenerator.assign_stages(state["config"], state["assignments"]),
+        "generate_scorecards": lambda: CompGenerator.generate_scorecards(state["config"], state["assignments"]),
+        "generate_blank_scorecards": lambda: CompGenerator.generate_blank_scorecards(state["config"]),
+        "generate_badges": lambda: CompGenerator.generate_badges(state["config"], state["assignments"]) }
+    for phase in suite_phases:
+        if phase == "generate_scorecards":
+            CompGenerator.init_worker(state["config"], state["assignments"]) # the drawing code reads these as globals
+        if memory:
+            tracemalloc.start()
+            steps[phase]()
+            results[phase] = round(tracemalloc.get_traced_memory()[1] / (1024*1024), 2)
+            tracemalloc.stop()
+        else:
+            start = time.perf_counter()
+            steps[phase]()
+            results[phase] = round(time.perf_counter() - start, 4)
+    return results
+
+# Checks one size's results against the baseline. A phase has regressed if it got more than tolerance (a fraction)
+# slower or bigger, and by more than a small absolute amount, so that phases that only take a few milliseconds
+# don't fail on noise. Returns a list of complaints.
+def compare_to_baseline(name, result, baseline, tolerance):
+    problems = []
+    if name not in baseline:
+        return problems
+    for phase in suite_phases:
+        for measure, slack, unit in [["seconds", 0.05, "s"], ["peak_mb", 1.0, " MB"]]:
+            old = baseline[name].get(phase, {}).get(measure)
+            new = result[phase].get(measure)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + tolerance) and new - old > slack:
+                problems.append(f"{name} {phase}: {measure} went from {old}{unit} to {new}{unit}")
+    return problems
+
+# Builds synthetic competitions of each size, times and memory-profiles each phase, saves the results as JSON, and
+# compares them to the stored baseline.
+def bench_suite(args):
+    sizes = [s for s in suite_sizes if args.sizes is None or s[0] in args.sizes]
+    results = {}
+    home = os.getcwd()
+    for name, competitors, events, stages, stations, stars, blanks in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            config_file = synthetic_competition(directory, competitors, events, stages, stations, stars, blanks, seed=competitors)
+            os.chdir(directory) # the PDFs get written to the current directory
+            try:
+                times = [run_phases(config_file) for _ in range(args.repeat)]
+                peaks = run_phases(config_file, memory=True) if args.memory else {}
+                outputs = {f: os.path.getsize(f) for f in os.listdir(directory) if f.endswith(".pdf")}
+            finally:
+                os.chdir(home)
+        results[name] = {phase: {"seconds": min(t[phase] for t in times), "peak_mb": peaks.get(phase)} for phase in suite_phases}
+        results[name]["competitors"] = competitors
+        results[name]["output_bytes"] = sum(outputs.values())
+
+    print(f"{'size':<12} {'phase':<26} {'seconds':>9} {'peak MB':>9}")
+    for name in results:
+        for phase in suite_phases:
+            peak = results[name][phase]["peak_mb"]
+            print(f"{name:<12} {phase:<26} {results[name][phase]['seconds']:>9.4f} {'-' if peak is None else peak:>9}")
+    with open(args.output, "w") as fout:
+        json.dump(results, fout, indent=2)
+    print(f"Saved results to: {args.output}")
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as fin:
+                baseline = json.load(fin)
+        baseline.update(results)
+        with open(args.baseline, "w") as fout:
+            json.dump(baseline, fout, indent=2)
+        print(f"Saved baseline to: {args.baseline}")
+        return True
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline} to compare with. Use --save-baseline to make one.")
+        return True
+    with open(args.baseline) as fin:
+        baseline = json.load(fin)
+    problems = []
+    for name in results:
+        problems += compare_to_baseline(name, results[name], baseline, args.tolerance)
+    for p in problems:
+        print("Regression: " + p)
+    return len(problems) == 0
+
+# Gives every tenth competitor of a synthetic competition a name too long for a scorecard or badge, in both the
+# assignments CSV and the stars, so the fit benchmark has some shrinking and wrapping to do.
+def lengthen_names(config_file):
+    directory = os.path.dirname(config_file)
+    with open(config_file) as fin:
+        config = json.load(fin)
+    long_name = lambda name: name + " Bartholomew Alexander Montgomery-Featherstonehaugh" if int(name.split()[-1]) % 10 == 0 else name
+    filename = os.path.join(directory, config["assignments"])
+    with open(filename, newline="") as fin:
+        rows = list(csv.reader(fin))
+    for row in rows[1:]:
+        row[0] = long_name(row[0])
+    with open(filename, "w", newline="") as fout:
+        csv.writer(fout).writerows(rows)
+    config["stars"] = {long_name(name): events for name, events in config["stars"].items()}
+    with open(config_file, "w") as fout:
+        json.dump(config, fout, indent=2)
+
+# Times drawing the scorecards and badges of a big competition, and how much of that time goes on working out how
+# to fit the text (CompGenerator.fit_text(), with an empty width cache to start with).
+def bench_fit(args):
+    home = os.getcwd()
+    fit = CompGenerator.fit_text
+    spent = [0.0, 0]
+    def timed_fit(*a, **kw):
+        start = time.perf_counter()
+        try:
+            return fit(*a, **kw)
+        finally:
+            spent[0] += time.perf_counter() - start
+            spent[1] += 1
+    with tempfile.TemporaryDirectory() as directory:
+        config_file = synthetic_competition(directory, args.competitors, 17, 4, 24, 40, 0, seed=args.competitors)
+        lengthen_names(config_file)
+        os.chdir(directory)
+        CompGenerator.fit_text = timed_fit
+        try:
+            config = CompGenerator.load_config(config_file)
+            assignments = CompGenerator.load_data(config)
+            CompGenerator.assign_stages(config, assignments)
+            CompGenerator.init_worker(config, assignments)
+            CompGenerator.load_reportlab()
+            CompGenerator.text_width.cache_clear()
+            start = time.perf_counter()
+            CompGenerator.generate_scorecards(config, assignments)
+            CompGenerator.generate_badges(config, assignments)
+            total = time.perf_counter() - start
+        finally:
+            CompGenerator.fit_text = fit
+            os.chdir(home)
+    share = spent[0] / total
+    cache = CompGenerator.text_width.cache_info()
+    print(f"{'people':>8} {'render s':>9} {'fit s':>8} {'fit %':>6} {'fits':>8} {'widths measured':>16} {'cache hits':>11}")
+    print(f"{args.competitors:>8} {total:>9.3f} {spent[0]:>8.4f} {100*share:>6.2f} {spent[1]:>8} {cache.misses:>16} {cache.hits:>11}")
+    return share < args.limit
+
+# The modules of the QR code CompGenerator.qr_code() makes for payload, as rows of 0s and 1s (1 is dark), read back
+# out of the inline image it draws.
+def qr_modules(payload):
+    size, image = CompGenerator.qr_code(payload)
+    width = 8*math.ceil(size/8)
+    bits = int(image.split(" ID ")[1].split(">")[0], 16)
+    return [[(bits >> ((size-1-row)*width + width-1-col)) & 1 for col in range(size)] for row in range(size)]
+
+# The same code made by reportlab's own encoder, which works out every codeword and module from scratch, with the
+# same mask pattern.
+def qr_reference(payload):
+    from reportlab.graphics.barcode import qrencoder
+    data = payload.encode("utf-8")
+    code = qrencoder.QRCode(CompGenerator.qr_version(len(data)), qrencoder.QRErrorCorrectLevel.M)
+    code.addData(qrencoder.QR8bitByte(data))
+    code.makeImpl(False, 0)
+    return [[1 if dark else 0 for dark in row] for row in code.modules]
+
+# Checks that the QR codes are right: every tenth payload's code has to match reportlab's encoder module for module,
+# and if OpenCV and PyMuPDF are installed (pip install opencv-python pymupdf), the first pages of the PDF are
+# rendered and every code on them has to scan as its payload, with OpenCV's ArUco-based QR reader (its older reader
+# misses the odd code when there are several on a page, whichever mask pattern they use). Returns a list of what's
+# wrong.
+def qr_problems(payloads, pdf):
+    problems = [f"{p!r} doesn't match reportlab's encoder" for p in payloads[::10] if qr_modules(p) != qr_reference(p)]
+    try:
+        import cv2
+        import numpy
+        import pymupdf
+    except ImportError:
+        print("OpenCV or PyMuPDF isn't installed, so the codes in the PDF weren't scanned.")
+        return problems
+    drawn, scanned = 0, set()
+    with pymupdf.open(pdf) as doc:
+        for page in doc.pages(0, min(10, doc.page_count)):
+            drawn += page.read_contents().count(b"BI /W")
+            pix = page.get_pixmap(dpi=200, colorspace=pymupdf.csGRAY)
+            image = numpy.frombuffer(pix.samples, numpy.uint8).reshape(pix.height, pix.width)
+            found, texts, _, _ = cv2.QRCodeDetectorAruco().detectAndDecodeMulti(image)
+            scanned.update(texts if found else ())
+    if len(scanned & set(payloads)) < drawn:
+        problems.append(f"only {len(scanned & set(payloads))} of the {drawn} codes on the first pages scanned")
+    return problems
+
+# Times drawing the scorecards of a synthetic competition with and without QR codes, a few times each way (alternately
+# with and without them first, and in CPU time, which other programs on the computer throw off less than the clock), and how much of the time with them goes on encoding (CompGenerator.qr_code(), with an
+# empty cache each run). Each QR code has to be encoded once: the cache gets a miss for every card. The PDFs are
+# written with the default output profile, the one people get unless they ask for another, unless --output-profile
+# says otherwise. Then the codes in the last PDF are checked with qr_problems().
+def bench_qr(args):
+    home = os.getcwd()
+    encode = CompGenerator.qr_code
+    spent = [0.0]
+    payloads = set()
+    def timed_encode(payload):
+        start = time.perf_counter()
+        try:
+            return encode(payload)
+        finally:
+            spent[0] += time.perf_counter() - start
+            payloads.add(payload)
+    times = {False: [], True: []}
+    with tempfile.TemporaryDirectory() as directory:
+        config_file = synthetic_competition(directory, args.competitors, 17, 4, 24, 40, 0, seed=args.competitors)
+        os.chdir(directory)
+        CompGenerator.qr_code = timed_encode
+        try:
+            config = CompGenerator.load_config(config_file)
+            assignments = CompGenerator.load_data(config)
+            CompGenerator.assign_stages(config, assignments)
+            CompGenerator.init_worker(config, assignments)
+            CompGenerator.load_reportlab()
+            config["output_profile"] = args.output_profile
+            for run in range(args.repeat):
+                for qr in ((False, True) if run % 2 == 0 else (True, False)):
+                    config["scorecard_qr"] = qr
+                    encode.cache_clear()
+                    spent[0] = 0.0
+                    start = time.process_time()
+                    CompGenerator.generate_scorecards(config, assignments)
+                    times[qr].append((time.process_time() - start, spent[0]))
+            cache = encode.cache_info()
+            CompGenerator.qr_code = encode
+            problems = qr_problems(sorted(payloads), CompGenerator.get_filename(config["competition"], "scorecards"))
+        finally:
+            CompGenerator.qr_code = encode
+            os.chdir(home)
+    plain, (with_qr, encoding) = min(times[False])[0], min(times[True])
+    # The overhead is the median of each run's, since a run's two drawings (one after the other, in turn order) are
+    # much closer to each other in speed than drawings a few runs apart on a busy or throttled machine.
+    overhead = statistics.median(q[0]/p[0] for p, q in zip(times[False], times[True])) - 1
+    print(f"{'people':>8} {'profile':>8} {'cards':>7} {'plain s':>8} {'with QR s':>10} {'overhead %':>11} {'encoding s':>11} {'ms/code':>8}")
+    print(f"{args.competitors:>8} {args.output_profile:>8} {cache.misses:>7} {plain:>8.3f} {with_qr:>10.3f} {100*overhead:>11.1f} {encoding:>11.3f} {1000*encoding/max(1, cache.misses):>8.3f}")
+    for problem in problems:
+        print(f"QR code problem: {problem}")
+    return overhead < args.limit and len(problems) == 0
+
+# Writes a WCIF export of a synthetic competition, with the same people and round 1 groups as its assignments file:
+# a room for each stage, with each group's activity in every room, and three rounds of every event (with a cutoff
+# and time limit for each). Returns the path to the WCIF file.
+def synthetic_wcif(config_file):
+    directory = os.path.dirname(config_file)
+    with open(config_file) as fin:
+        config = json.load(fin)
+    with open(os.path.join(directory, config["assignments"]), newline="") as fin:
+        rows = list(csv.reader(fin))
+    header = rows[0]
+    codes = {"C": "competitor", "J": "staff-judge", "S": "staff-scrambler", "R": "staff-runner"}
+    activities = {} # (event, group) -> activity id in the first room
+    rooms = [{"id": i+1, "name": name, "activities": []} for i, name in enumerate(config["stages"])]
+    events = []
+    for e in header[2:]:
+        groups = sorted({role[1:] for row in rows[1:] for role in row[header.index(e)].split(";") if role}, key=int)
+        for room in rooms:
+            children = []
+            for g in groups:
+                activity_id = len(activities) * len(rooms) + room["id"]
+                activities.setdefault((e, g), activity_id)
+                children.append({"id": activity_id, "activityCode": f"{e}-r1-g{g}", "childActivities": []})
+            room["activities"].append({"id": 100000 + len(room["activities"])*len(rooms) + room["id"], "activityCode": f"{e}-r1", "childActivities": children})
+        events.append({"id": e, "rounds": [{"id": f"{e}-r{r}", "format": "a", "timeLimit": {"centiseconds": 60000, "cumulativeRoundIds": []},
+                                            "cutoff": {"numberOfAttempts": 2, "attemptResult": 6000}} for r in range(1, 4)]})
+    persons = []
+    for n, row in enumerate(rows[1:], 1):
+        assignments = []
+        entered = []
+        for j, e in enumerate(header[2:], 2):
+            for role in filter(None, row[j].split(";")):
+                assignments.append({"activityId": activities[(e, role[1:])], "assignmentCode": codes[role[0]], "stationNumber": None})
+                if role[0] == "C":
+                    entered.append(e)
+        persons.append({"registrantId": n, "name": row[0], "wcaId": row[1], "registration": {"status": "accepted", "eventIds": entered, "isCompeting": True},
+                        "assignments": assignments})
+    wcif = {"formatVersion": "1.0", "id": "Synthetic", "name": config["competition"], "events": events, "persons": persons,
+            "schedule": {"venues": [{"id": 1, "name": "Venue", "rooms": rooms}]}}
+    filename = os.path.join(directory, "synthetic_wcif.json")
+    with open(filename, "w") as fout:
+        json.dump(wcif, fout)
+    return filename
+
+# Everybody's roles in each event, without the stages, as name -> event -> sorted list of roles like "C3".
+def group_roles(assignments):
+    return {p.name: {e: sorted(r.role + r.group for r in roles) for e, roles in p.roles.items()} for p in assignments.people.values()}
+
+# Loads a big synthetic competition from its WCIF export: from scratch, then from the snapshot that load saved, then
+# again after touching every input file (so the snapshot has to check their contents). The people and groups it gets
+# have to match the ones from the assignments file, and loading the snapshot has to be quicker by some margin.
+def bench_wcif(args):
+    home = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        config_file = synthetic_competition(directory, args.competitors, 17, 4, 24, 40, 0, seed=args.competitors)
+        wcif_file = synthetic_wcif(config_file)
+        with open(config_file) as fin:
+            config = json.load(fin)
+        os.chdir(directory)
+        try:
+            csv_roles = group_roles(CompGenerator.load_data(config))
+            for key in ["assignments", "events"]:
+                del config[key]
+            config["wcif"] = os.path.basename(wcif_file)
+            with open(config_file, "w") as fout:
+                json.dump(config, fout)
+            snapshots = os.path.join(directory, "snapshots")
+            times = {}
+            for step in ["from scratch", "saving snapshot", "from snapshot", "after touching"]:
+                if step == "after touching":
+                    for f in [config_file, wcif_file]:
+                        os.utime(f)
+                CompGenerator.wcif_loaded.clear()
+                start = time.perf_counter()
+                # freeze=True, like a normal one-shot run
+                loaded, assignments = CompGenerator.load_competition(config_file, None if step == "from scratch" else snapshots, freeze=True)
+                times[step] = time.perf_counter() - start
+            wcif_roles = group_roles(assignments)
+            rounds = len(loaded["rounds"]["333"])
+            size = os.path.getsize(wcif_file)
+        finally:
+            os.chdir(home)
+    print(f"{'people':>8} {'WCIF MB':>8} {'from scratch':>13} {'saving':>8} {'snapshot':>9} {'touched':>8} {'speedup':>8}")
+    speedup = times["from scratch"] / times["from snapshot"]
+    print(f"{args.competitors:>8} {size/1e6:>8.1f} {times['from scratch']:>13.3f} {times['saving snapshot']:>8.3f} {times['from snapshot']:>9.3f} "
+          f"{times['after touching']:>8.3f} {speedup:>7.1f}x")
+    ok = True
+    if wcif_roles != csv_roles:
+        print("The people and groups from the WCIF don't match the assignments file.")
+        ok = False
+    if rounds != 2:
+        print(f"Expected 2 later rounds of 333 from the WCIF, got {rounds}.")
+        ok = False
+    return ok and speedup >= args.speedup
+
+# Makes the sample winners' certificates (without a template image) with each output profile, with the sample config
+# set to draw names in the Vera font that comes with reportlab, in directory. Returns {profile: (whether the PDF has a
+# TrueType font embedded in it, whether it's ASCII85-encoded)}.
+def certificate_fonts(directory):
+    import reportlab
+    here = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(here, "samples", "sample_winners.json")) as fin:
+        winners = json.load(fin)
+    del winners["certificate_template"]
+    config = CompGenerator.load_config(os.path.join(directory, "sample_comp_config.json"))
+    config["name_font"] = os.path.join(os.path.dirname(reportlab.__file__), "fonts", "Vera.ttf")
+    CompGenerator.init_worker(config, None) # name_font() reads the config as a global
+    results = {}
+    for profile in CompGenerator.output_profiles:
+        config["output_profile"] = profile
+        output = CompGenerator.certificates_output(winners, config["competition"])
+        CompGenerator.render_outputs(CompGenerator.certificate_settings(winners, config), None, [output])
+        with open(output["filename"], "rb") as fin:
+            pdf = fin.read()
+        results[profile] = (b"/FontFile2" in pdf, b"/ASCII85Decode" in pdf)
+    return results
+
+# Writes the scorecards, blank scorecards and badges of the sample competition and of a synthetic one with each
+# output profile, taking turns for a few runs and keeping the median CPU time of each, and compares the total size of the PDFs and the time taken with
+# the default profile's. "compact" has to make smaller files than the default, and "fast" has to be quicker. It also
+# checks that certificates follow the config's output profile and name font (see certificate_fonts()).
+def bench_profiles(args):
+    home = os.getcwd()
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    save_canvas = CompGenerator.save_canvas
+    saves = [] # how long each save took, which is where the profiles differ
+    def timed_save(c, profile):
+        start = time.process_time()
+        save_canvas(c, profile)
+        saves.append(time.process_time() - start)
+    CompGenerator.save_canvas = timed_save
+    with tempfile.TemporaryDirectory() as directory:
+        sample_dir = os.path.join(directory, "sample")
+        os.mkdir(sample_dir)
+        for f in os.listdir(os.path.join(here, "samples")):
+            if f.startswith("sample_comp_"):
+                shutil.copy(os.path.join(here, "samples", f), sample_dir)
+        synthetic_dir = os.path.join(directory, "synthetic")
+        os.mkdir(synthetic_dir)
+        comps = [["sample", os.path.join(sample_dir, "sample_comp_config.json")],
+                 [f"synthetic {args.competitors}", synthetic_competition(synthetic_dir, args.competitors, 17, 4, 24, 40, 20, seed=args.competitors)]]
+        try:
+            for name, config_file in comps:
+                os.chdir(os.path.dirname(config_file))
+                config = CompGenerator.load_config(config_file)
+                assignments = CompGenerator.load_data(config)
+                CompGenerator.assign_stages(config, assignments)
+                CompGenerator.init_worker(config, assignments)
+                times = {profile: [] for profile in CompGenerator.output_profiles}
+                writing = {profile: [] for profile in CompGenerator.output_profiles}
+                for run in range(args.repeat):
+                    for profile in CompGenerator.output_profiles: # taking turns, so a slow spell hits them all alike
+                        config["output_profile"] = profile
+                        saves.clear()
+                        start = time.process_time()
+                        CompGenerator.generate_scorecards(config, assignments)
+                        CompGenerator.generate_blank_scorecards(config)
+                        CompGenerator.generate_badges(config, assignments)
+                        times[profile].append(time.process_time() - start)
+                        writing[profile].append(sum(saves))
+                        size = sum(os.path.getsize(f) for f in os.listdir(".") if f.endswith(".pdf"))
+                        results[(name, profile)] = (size, statistics.median(times[profile]), statistics.median(writing[profile]))
+            certificates = certificate_fonts(sample_dir)
+        finally:
+            os.chdir(home)
+            CompGenerator.save_canvas = save_canvas
+    ok = True
+    for profile, (embedded, a85) in certificates.items():
+        if not embedded:
+            print(f"{profile}: the certificates don't have the name font in them.")
+            ok = False
+        if a85 != CompGenerator.output_profiles[profile]["a85"]:
+            print(f"{profile}: the certificates don't follow the profile's ASCII85 setting.")
+            ok = False
+    print(f"{'competition':>16} {'profile':>8} {'KB':>9} {'size %':>7} {'seconds':>8} {'time %':>7} {'writing':>8} {'write %':>7}")
+    for name, _ in comps:
+        size0, seconds0, writing0 = results[(name, "default")]
+        for profile in CompGenerator.output_profiles:
+            size, seconds, writing = results[(name, profile)]
+            print(f"{name:>16} {profile:>8} {size/1024:>9.1f} {100*size/size0:>7.1f} {seconds:>8.3f} {100*seconds/seconds0:>7.1f} {writing:>8.3f} {100*writing/writing0:>7.1f}")
+        if results[(name, "compact")][0] >= size0:
+            print(f"{name}: compact PDFs aren't smaller than the default ones.")
+            ok = False
+        if results[(name, "fast")][2] >= writing0:
+            print(f"{name}: the fast profile isn't quicker to write than the default one.")
+            ok = False
+    return ok
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="CompGenerator benchmarks")
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+    p = sub.add_parser("staging", help="single-staging solver on synthetic events")
+    p.add_argument("--limit", type=float, default=1.0, help="fail if any event takes longer than this, in seconds")
+    p.set_defaults(func=bench_staging)
+    p = sub.add_parser("assign", help="automatic group and staff assignment for a big competition")
+    p.add_argument("--competitors", type=int, default=2000, help="how many competitors")
+    p.add_argument("--events", type=int, default=17, help="how many events")
+    p.add_argument("--limit", type=float, default=10.0, help="fail if it takes longer than this, in seconds")
+    p.set_defaults(func=bench_assign)
+    p = sub.add_parser("suite", help="every phase of a full run, on synthetic competitions from 50 to 3000 people")
+    p.add_argument("--sizes", nargs="+", choices=[s[0] for s in suite_sizes], default=None, help="which sizes to run (default: all of them)")
+    p.add_argument("--repeat", type=int, default=1, help="run each size this many times and keep the fastest")
+    p.add_argument("--no-memory", dest="memory", action="store_false", help="skip the (slow) memory-profiling pass")
+    p.add_argument("--output", default="benchmark_results.json", help="where to save the results")
+    p.add_argument("--baseline", default="benchmark_baseline.json", help="results to compare against")
+    p.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline instead of comparing")
+    p.add_argument("--tolerance", type=float, default=0.25, help="how much slower or bigger (as a fraction) a phase can get before it fails")
+    p.set_defaults(func=bench_suite)
+    p = sub.add_parser("fit", help="share of scorecard and badge drawing time spent fitting text")
+    p.add_argument("--competitors", type=int, default=1000, help="how many competitors")
+    p.add_argument("--limit", type=float, default=0.05, help="fail if fitting takes more than this fraction of the time")
+    p.set_defaults(func=bench_fit)
+    p = sub.add_parser("qr", help="cost of QR codes on the scorecards of a competition with about 5000 scorecards")
+    p.add_argument("--competitors", type=int, default=500, help="how many competitors")
+    p.add_argument("--repeat", type=int, default=7, help="draw the scorecards this many times each way")
+    p.add_argument("--output-profile", choices=list(CompGenerator.output_profiles), default="default", help="output profile to write the PDFs with")
+    p.add_argument("--limit", type=float, default=0.25, help="fail if QR codes make drawing slower by more than this fraction")
+    p.set_defaults(func=bench_qr)
+    p = sub.add_parser("wcif", help="loading a big competition from a WCIF export, from scratch and from a snapshot")
+    p.add_argument("--competitors", type=int, default=3000, help="how many competitors")
+    p.add_argument("--speedup", type=float, default=5.0, help="fail if loading the snapshot isn't at least this many times quicker")
+    p.set_defaults(func=bench_wcif)
+    p = sub.add_parser("profiles", help="PDF size and writing time with each output profile, on the sample and a synthetic competition")
+    p.add_argument("--competitors", type=int, default=500, help="how many competitors in the synthetic competition")
+    p.add_argument("--repeat", type=int, default=5, help="write the PDFs this many times with each profile and keep the median time")
+    p.set_defaults(func=bench_profiles)
+
+    args = parser.parse_args()
+    if not args.func(args):
+        print("Benchmark failed.")
+        sys.exit(1)